@@ -0,0 +1,215 @@
+"""클러스터 오케스트레이션 벤치마크.
+
+가짜 EC2 / SSH 백엔드(`fakes.py`)로 `create_cluster`, `start_cluster`,
+`stop_cluster`, `destroy_cluster` 를 워커 수별로 실행해 구간별 시간과 API 호출,
+SSH 연결/명령 수를 보고한다. AWS 계정이나 인스턴스 없이 로컬에서 돌아간다.
+
+    $ python benchmarks/bench_cluster.py
+    $ python benchmarks/bench_cluster.py -w 1,10 --ssh-latency 0.05 --fail-rate 0.1
+    $ python benchmarks/bench_cluster.py --json > result.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from fakes import Stats, FakeEC2Client, FakeEC2Resource, FakeSSHBackend  # noqa
+
+import bilbo.util  # noqa
+import bilbo.store  # noqa
+import bilbo.catalog  # noqa
+import bilbo.profile  # noqa
+import bilbo.cluster as bc  # noqa
+import bilbo.aio  # noqa
+
+PROFILE = 'bench.json'
+CLUSTER = 'bench'
+PHASES = ('create', 'start', 'stop', 'destroy')
+
+
+def _profile(workers):
+    return {
+        "description": "bilbo benchmark",
+        "instance": {
+            "ami": "ami-00000000000000000",
+            "security_group": "sg-00000000",
+            "ec2type": "m5.xlarge",
+            "keyname": "bench",
+            "ssh_user": "ubuntu",
+            "ssh_private_key": "~/.ssh/bench.pem"
+        },
+        "retry": {
+            "initial": 0.01,
+            "cap": 0.1,
+            "jitter": 0,
+            "deadline": 60
+        },
+        "notebook": {},
+        "dask": {
+            "worker": {
+                "count": workers
+            }
+        }
+    }
+
+
+def _patch_env(stack, work_dir, ec2, ssh):
+    """bilbo 의 경로와 외부 의존을 벤치마크용으로 바꿈."""
+    import boto3
+    import paramiko
+
+    bilbo_dir = os.path.join(work_dir, '.bilbo')
+    paths = {
+        'bilbo_dir': bilbo_dir,
+        'log_dir': os.path.join(bilbo_dir, 'logs'),
+        'prof_dir': os.path.join(bilbo_dir, 'profiles'),
+        'clust_dir': os.path.join(bilbo_dir, 'clusters'),
+        'catalog_path': os.path.join(bilbo_dir, 'instance_types.json'),
+        'store_path': os.path.join(bilbo_dir, 'bilbo.db'),
+        'prof_cache_dir': os.path.join(bilbo_dir, 'cache', 'profiles')
+    }
+    for mod in (bilbo.util, bilbo.store, bilbo.catalog, bilbo.profile):
+        for name, path in paths.items():
+            if hasattr(mod, name):
+                stack.enter_context(mock.patch.object(mod, name, path))
+
+    stack.enter_context(mock.patch.object(boto3, 'resource',
+                                          lambda *a, **kw: ec2))
+    stack.enter_context(mock.patch.object(boto3, 'client',
+                                          lambda *a, **kw: ec2.meta.client))
+    stack.enter_context(mock.patch.object(paramiko, 'SSHClient', ssh.client))
+    stack.enter_context(mock.patch.object(bc, 'load_private_key',
+                                          lambda path: None))
+    stack.enter_context(mock.patch.object(bc, 'get_aws_config',
+                                          lambda: ('ak', 'sk', 'region')))
+    stack.enter_context(mock.patch.object(bc, 'WAIT_SLEEP', 0.01))
+
+    async def _http_ready(url):
+        ssh.stats.incr('http.' + url.split(':')[-1])
+        return True
+
+    stack.enter_context(mock.patch.object(bilbo.aio, 'http_ready',
+                                          _http_ready))
+    bilbo.util.check_dirs()
+    return paths
+
+
+@contextmanager
+def fake_env(api_latency=0.0, ssh_latency=0.0, cmd_latency=0.0,
+             fail_rate=0.0, boot_polls=2, workers=1):
+    """가짜 백엔드와 임시 bilbo 디렉토리로 바꾼 환경.
+
+    Yields:
+        Stats: 호출 집계
+    """
+    stats = Stats()
+    ec2 = FakeEC2Resource(FakeEC2Client(stats, api_latency, boot_polls))
+    ssh = FakeSSHBackend(stats, ssh_latency, cmd_latency, fail_rate)
+    work_dir = tempfile.mkdtemp(prefix='bilbo_bench_')
+    try:
+        with ExitStack() as stack:
+            paths = _patch_env(stack, work_dir, ec2, ssh)
+            bilbo.catalog._catalog = None
+            with open(os.path.join(paths['prof_dir'], PROFILE), 'wt') as f:
+                f.write(json.dumps(_profile(workers)))
+            yield stats
+    finally:
+        bc.ssh_pool.close_all()
+        bilbo.store.close()
+        bilbo.catalog._catalog = None
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_once(workers, api_latency=0.0, ssh_latency=0.0, cmd_latency=0.0,
+             fail_rate=0.0, boot_polls=2):
+    """워커 수 하나에 대해 생성부터 제거까지 실행.
+
+    Returns:
+        dict: 구간별 시간(초)과 호출 집계
+    """
+    elapsed = {}
+    with fake_env(api_latency, ssh_latency, cmd_latency, fail_rate,
+                  boot_polls, workers) as stats:
+        t = time.time()
+        pobj, clinfo = bc.create_cluster(PROFILE, CLUSTER, None)
+        elapsed['create'] = time.time() - t
+
+        t = time.time()
+        bc.start_notebook_and_cluster(pobj, clinfo)
+        bc.save_cluster_info(CLUSTER, clinfo)
+        elapsed['start'] = time.time() - t
+
+        t = time.time()
+        bc.stop_cluster(CLUSTER)
+        elapsed['stop'] = time.time() - t
+
+        t = time.time()
+        bc.destroy_cluster(CLUSTER, True)
+        elapsed['destroy'] = time.time() - t
+
+    return {
+        'workers': workers,
+        'elapsed': {k: round(v, 3) for k, v in elapsed.items()},
+        'total': round(sum(elapsed.values()), 3),
+        'api_calls': stats.total('api.'),
+        'ssh_connects': stats['ssh.connect'],
+        'ssh_connect_fails': stats['ssh.connect_fail'],
+        'ssh_commands': stats['ssh.exec'],
+        'calls': dict(sorted(stats.counter.items()))
+    }
+
+
+def print_table(results):
+    cols = ['workers'] + list(PHASES) + ['total', 'api', 'connects',
+                                         'conn_fail', 'commands']
+    print(' '.join('{:>9}'.format(c) for c in cols))
+    for res in results:
+        row = [res['workers']]
+        row += ['{:.3f}'.format(res['elapsed'][p]) for p in PHASES]
+        row += ['{:.3f}'.format(res['total']), res['api_calls'],
+                res['ssh_connects'], res['ssh_connect_fails'],
+                res['ssh_commands']]
+        print(' '.join('{:>9}'.format(c) for c in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-w', '--workers', default='1,10,100,500',
+                        help="Comma separated worker counts.")
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help="Seconds added to each EC2 API call.")
+    parser.add_argument('--ssh-latency', type=float, default=0.0,
+                        help="Seconds added to each SSH connect.")
+    parser.add_argument('--cmd-latency', type=float, default=0.0,
+                        help="Seconds added to each SSH command.")
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help="Probability of SSH connect failure.")
+    parser.add_argument('--json', action='store_true',
+                        help="Print results as JSON.")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Show bilbo log messages.")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    results = []
+    for workers in [int(w) for w in args.workers.split(',')]:
+        results.append(run_once(workers, args.api_latency, args.ssh_latency,
+                                args.cmd_latency, args.fail_rate))
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_table(results)
+
+
+if __name__ == '__main__':
+    main()
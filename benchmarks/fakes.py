@@ -0,0 +1,243 @@
+"""벤치마크용 가짜 EC2 / SSH 백엔드.
+
+실제 AWS 와 인스턴스 없이 bilbo 의 오케스트레이션 비용(API 호출, SSH 연결과
+명령 수, 대기 시간)을 재기 위한 프로세스 내 대역들이다. 지연 시간과 실패율을
+주입할 수 있다.
+"""
+import time
+import random
+import threading
+from collections import Counter
+
+
+class Stats:
+    """스레드 안전한 호출 횟수 집계."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counter = Counter()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counter[name] += value
+
+    def __getitem__(self, name):
+        return self.counter[name]
+
+    def total(self, prefix):
+        """이름이 prefix 로 시작하는 항목의 합."""
+        return sum(v for k, v in self.counter.items() if k.startswith(prefix))
+
+
+class FakeEC2Instance:
+    """create_instances 가 돌려주는 인스턴스 리소스 대역."""
+
+    def __init__(self, instance_id, private_dns_name):
+        self.instance_id = instance_id
+        self.private_dns_name = private_dns_name
+
+
+class FakeEC2Client:
+    """boto EC2 client 대역.
+
+    생성된 인스턴스는 `boot_polls` 번 조회된 후에 running 이 된다.
+    """
+
+    def __init__(self, stats, latency=0.0, boot_polls=1, vcpus=4,
+                 memory_mib=16384):
+        self.stats = stats
+        self.latency = latency
+        self.boot_polls = boot_polls
+        self.vcpus = vcpus
+        self.memory_mib = memory_mib
+        self.instances = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def _call(self, name):
+        self.stats.incr('api.' + name)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def launch(self, ec2type, count, tags):
+        with self._lock:
+            ins = []
+            for _ in range(count):
+                self._seq += 1
+                n = self._seq
+                iid = 'i-{:017x}'.format(n)
+                ip = '10.{}.{}.{}'.format(n // 65536 % 256, n // 256 % 256,
+                                          n % 256)
+                desc = {
+                    'InstanceId': iid,
+                    'InstanceType': ec2type,
+                    'PrivateIpAddress': ip,
+                    'PublicIpAddress': ip,
+                    'PrivateDnsName': 'ip-{}.internal'.format(
+                        ip.replace('.', '-')),
+                    'Tags': tags,
+                    'polls': 0,
+                    'State': {'Name': 'pending'}
+                }
+                self.instances[iid] = desc
+                ins.append(FakeEC2Instance(iid, desc['PrivateDnsName']))
+            return ins
+
+    def describe_instances(self, InstanceIds):
+        self._call('describe_instances')
+        insts = []
+        with self._lock:
+            for iid in InstanceIds:
+                desc = self.instances[iid]
+                desc['polls'] += 1
+                if desc['State']['Name'] == 'pending' and \
+                        desc['polls'] >= self.boot_polls:
+                    desc['State'] = {'Name': 'running'}
+                insts.append({k: v for k, v in desc.items()
+                              if k != 'polls'})
+        return {'Reservations': [{'Instances': insts}]}
+
+    def describe_instance_types(self, InstanceTypes):
+        self._call('describe_instance_types')
+        return {'InstanceTypes': [{
+            'InstanceType': t,
+            'VCpuInfo': {'DefaultVCpus': self.vcpus,
+                         'DefaultCores': self.vcpus // 2,
+                         'DefaultThreadsPerCore': 2},
+            'MemoryInfo': {'SizeInMiB': self.memory_mib}
+        } for t in InstanceTypes]}
+
+    def terminate_instances(self, InstanceIds):
+        self._call('terminate_instances')
+        with self._lock:
+            for iid in InstanceIds:
+                self.instances[iid]['State'] = {'Name': 'terminated'}
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeEC2Resource:
+    """boto EC2 resource 대역."""
+
+    def __init__(self, client):
+        self.client = client
+        self.meta = _Meta(client)
+
+    def create_instances(self, ImageId, InstanceType, MinCount, MaxCount,
+                         TagSpecifications, **kwargs):
+        self.client._call('run_instances')
+        tags = TagSpecifications[0]['Tags']
+        return self.client.launch(InstanceType, MaxCount, tags)
+
+
+class _FakeChannel:
+    def __init__(self, exit_code):
+        self.exit_code = exit_code
+
+    def recv_exit_status(self):
+        return self.exit_code
+
+
+class _FakeFile:
+    def __init__(self, lines, exit_code=0):
+        self.lines = lines
+        self.channel = _FakeChannel(exit_code)
+
+    def readlines(self):
+        return list(self.lines)
+
+    def readline(self):
+        return self.lines.pop(0) if len(self.lines) > 0 else ''
+
+    def read(self):
+        return ''.join(self.lines).encode('utf-8')
+
+
+class _FakeTransport:
+    def __init__(self, client):
+        self.client = client
+
+    def is_active(self):
+        return not self.client.closed
+
+    def set_keepalive(self, interval):
+        pass
+
+
+class FakeSSHBackend:
+    """SSH 서버들의 대역. `client()` 로 paramiko.SSHClient 대신 쓸 객체를 만듦.
+
+    명령에 대한 응답은 bilbo 가 보내는 명령(lscpu, free, jupyter)을 흉내낸다.
+    """
+
+    def __init__(self, stats, connect_latency=0.0, cmd_latency=0.0,
+                 fail_rate=0.0, seed=0):
+        self.stats = stats
+        self.connect_latency = connect_latency
+        self.cmd_latency = cmd_latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _fail(self):
+        with self._lock:
+            return self.random.random() < self.fail_rate
+
+    def respond(self, cmd, hostname=None):
+        """명령에 대한 (표준 출력 행 리스트, 종료 코드)."""
+        if cmd.startswith('tail -n'):
+            return ['{} log\n'.format(hostname)], 0
+        if 'lscpu' in cmd and 'CPU' in cmd:
+            return ['4\n'], 0
+        if 'lscpu' in cmd:
+            return ['2\n'], 0
+        if 'free -b' in cmd:
+            return ['16000000000\n'], 0
+        if 'jupyter notebook list' in cmd:
+            return ['Currently running servers:\n',
+                    'http://0.0.0.0:8888/?token=bench :: /home\n'], 0
+        return [], 0
+
+    def client(self):
+        return FakeSSHClient(self)
+
+
+class FakeSSHClient:
+    """paramiko.SSHClient 대역."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hostname = None
+        self.closed = True
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, username=None, pkey=None, **kwargs):
+        be = self.backend
+        be.stats.incr('ssh.connect_attempt')
+        if be.connect_latency > 0:
+            time.sleep(be.connect_latency)
+        if be._fail():
+            be.stats.incr('ssh.connect_fail')
+            raise TimeoutError("fake connect timeout: {}".format(hostname))
+        be.stats.incr('ssh.connect')
+        self.hostname = hostname
+        self.closed = False
+
+    def get_transport(self):
+        return _FakeTransport(self)
+
+    def exec_command(self, cmd, get_pty=False, timeout=None):
+        be = self.backend
+        be.stats.incr('ssh.exec')
+        if be.cmd_latency > 0:
+            time.sleep(be.cmd_latency)
+        lines, exit_code = be.respond(cmd, self.hostname)
+        return None, _FakeFile(lines, exit_code), _FakeFile([])
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,424 @@
+"""asyncio 오케스트레이션 모듈.
+
+클러스터 생성, 시작, 중지의 순서와 명령은 여기에만 있고, `bilbo.cluster` 의 같은
+이름의 동기 함수들은 `run` 으로 이 코루틴들을 실행한다. 대기(인스턴스 상태 조회
+간격, SSH 연결 재시도, 노트북 URL 과 대쉬보드 준비 확인)는 이벤트 루프에서
+기다리기에 스레드를 잡고 있지 않는다. boto3 와 paramiko 의 블로킹 호출만 크기가
+제한된 실행기에서 돌기에, 호스트가 수백 대여도 스레드는 늘지 않는다.
+
+    pobj, clinfo = run(create_and_start('test.json', 'test', None))
+"""
+import asyncio
+import functools
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from bilbo import cluster as bc
+from bilbo.util import critical, warning, error, info, timing_span, \
+    timing_count, get_retry_policy
+
+# 블로킹 호출을 돌릴 실행기의 크기. 동시 SSH 명령 수보다 약간 크게
+EXECUTOR_WORKERS = bc.FANOUT_CONCURRENCY + 4
+# HTTP 준비 확인의 연결 / 응답 제한 시간(초)
+HTTP_TIMEOUT = 5
+
+
+def run(coro):
+    """새 이벤트 루프에서 코루틴을 끝까지 실행하고 결과를 돌려줌.
+
+    루프마다 자신의 실행기를 쓰기에, 실행기 스레드 안의 동기 함수가 다시 불러도
+    바깥 루프의 실행기를 기다리며 막히지 않는다. 이미 루프가 도는 스레드(예:
+    Jupyter 노트북)에서 불리면 별도 스레드에서 실행한다.
+    """
+    async def _main():
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS,
+                               thread_name_prefix='bilbo-aio'))
+        return await coro
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_main())
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, _main()).result()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """블로킹 함수를 루프의 실행기에서 실행하고 결과를 기다림."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None,
+                                      functools.partial(func, *args, **kwargs))
+
+
+async def _retry_sleep(delay):
+    bc.ssh_pool.record_wait(delay)
+    await asyncio.sleep(delay)
+
+
+async def exec_cmd(ssh_user, ssh_private_key, ip, cmd, timeout=None):
+    """인스턴스에 SSH 명령 실행.
+
+    연결 시도는 한 번씩만 실행기에서 하고, 재시도 대기는 이벤트 루프에서 한다.
+
+    Returns:
+        bilbo.cluster.HostResult: 실행 결과
+    """
+    policy = get_retry_policy()
+    async for attempt in policy.async_attempts(sleep=_retry_sleep):
+        res = await run_blocking(bc.exec_instance_cmd, ssh_user,
+                                 ssh_private_key, ip, cmd, timeout,
+                                 retry_count=1)
+        if res.error != "connection failed":
+            return res
+        warning("Connection failed to '{}'. Retry after a while.".format(ip))
+    return res
+
+
+async def send_cmd(host, cmd, show_stderr=True):
+    """명령을 실행하고 실패나 에러 출력을 로그로 남김.
+
+    Args:
+        host (tuple): (ssh_user, ssh_private_key, ip)
+        show_stderr (bool): 에러 출력을 로그로 남길지 여부
+
+    Returns:
+        bilbo.cluster.HostResult: 실행 결과
+    """
+    res = await exec_cmd(*host, cmd)
+    if res.error is not None:
+        error("Command failed on '{}' - {}".format(res.ip, res.error))
+    elif show_stderr and len(res.stderr) > 0:
+        error(res.stderr.decode('utf-8'))
+    return res
+
+
+async def fanout(hosts, cmd, concurrency=bc.FANOUT_CONCURRENCY,
+                 timeout=bc.FANOUT_TIMEOUT, on_result=None):
+    """여러 호스트에 동시에 명령 실행.
+
+    Args:
+        hosts (list): (ssh_user, ssh_private_key, ip) 튜플 리스트
+        cmd: 명령 문자열 또는 IP 를 받아 명령 문자열을 돌려주는 함수
+        concurrency (int): 최대 동시 실행 수
+        timeout (float): 호스트당 제한 시간(초)
+        on_result: 호스트의 결과가 나올 때마다 HostResult 로 부를 함수
+
+    Returns:
+        bilbo.cluster.FanoutResult: 호스트별 실행 결과
+    """
+    info("fanout - {} host(s), cmd {}".format(len(hosts), cmd))
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(host):
+        user, private_key, ip = host
+        async with sem:
+            try:
+                _cmd = cmd(ip) if callable(cmd) else cmd
+                res = await exec_cmd(user, private_key, ip, _cmd, timeout)
+            except Exception as e:
+                res = bc.HostResult(ip, error=str(e))
+        if on_result is not None:
+            on_result(res)
+        return res
+
+    results = await asyncio.gather(*[_run(host) for host in hosts])
+    return bc.FanoutResult({res.ip: res for res in results})
+
+
+async def wait_instances_running(client, instance_ids, retry_count=120):
+    """인스턴스들이 모두 running 상태가 될 때까지 기다림.
+
+    인스턴스마다 따로 기다리지 않고, 조회마다 대기중인 인스턴스들을
+    DescribeInstances 배치별로 동시에 조회한다.
+
+    Args:
+        client: boto EC2 client
+        instance_ids (list): 기다릴 인스턴스 ID 리스트
+        retry_count (int): 최대 조회 수
+
+    Returns:
+        dict: 인스턴스 ID 별 DescribeInstances 결과
+
+    Raises:
+        RuntimeError: 인스턴스가 시작되지 못하고 종료될 때
+        TimeoutError: 재시도 수가 넘을 때
+    """
+    info("wait_instances_running: {} instance(s)".format(len(instance_ids)))
+    pending = set(instance_ids)
+    descs = {}
+    for i in range(retry_count):
+        ids = sorted(pending)
+        batches = [ids[s:s + bc.DESCRIBE_BATCH]
+                   for s in range(0, len(ids), bc.DESCRIBE_BATCH)]
+        for running in await asyncio.gather(
+                *[run_blocking(bc.describe_running, client, batch)
+                  for batch in batches]):
+            descs.update(running)
+            pending -= set(running)
+        if len(pending) == 0:
+            return descs
+        info("  {} instance(s) pending. Wait for a while.".
+             format(len(pending)))
+        await asyncio.sleep(bc.WAIT_SLEEP)
+    raise TimeoutError("Instances are not running: {}".format(
+        ', '.join(sorted(pending))))
+
+
+async def http_ready(url):
+    """URL 이 HTTP 응답을 하는가?"""
+    parts = urlparse(url)
+    host, port = parts.hostname, parts.port or 80
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), HTTP_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        req = "GET {} HTTP/1.0\r\nHost: {}\r\n\r\n".format(parts.path or '/',
+                                                            host)
+        writer.write(req.encode('ascii'))
+        line = await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)
+        return line.startswith(b'HTTP/')
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+async def wait_until_connect(url, retry_count=None):
+    """URL 접속이 가능할 때까지 기다림.
+
+    Args:
+        url (str): 접속할 URL
+        retry_count (int): 최대 시도 수. None 이면 재시도 정책의 제한 시간까지
+    """
+    info("wait_until_connect: {}".format(url))
+    async for i in get_retry_policy().async_attempts(retry_count):
+        if await http_ready(url):
+            return
+        info("Can not connect to dashboard. Wait for a while.")
+    raise ConnectionError()
+
+
+async def create_cluster(profile, clname, params):
+    """클러스터 생성.
+
+    인스턴스 생성 요청 후 모든 인스턴스를 한꺼번에 기다려 추가 정보를 얻는다.
+
+    Returns:
+        tuple: (프로파일 객체, 클러스터 정보)
+    """
+    import boto3
+
+    pobj, clinfo, launched = await run_blocking(bc.launch_cluster, profile,
+                                                clname, params)
+    if len(clinfo['instances']) > 0:
+        info("Wait for instances to be running.")
+        with timing_span(clinfo, 'wait_running'):
+            descs = await wait_instances_running(boto3.client('ec2'),
+                                                 clinfo['instances'])
+        with timing_span(clinfo, 'instance_info'):
+            await run_blocking(bc.set_cluster_instance_info, pobj, clinfo,
+                               launched, descs)
+    return pobj, clinfo
+
+
+async def wait_bootstrap(hosts, what):
+    """호스트들의 cloud-init 부트스트랩이 끝날 때까지 기다림.
+
+    호스트마다 원격에서 완료 표시 파일을 기다리고 AWS 크레덴셜을 설치하기에,
+    호스트당 한 번의 명령으로 끝난다.
+    """
+    info("wait_bootstrap: {} host(s)".format(len(hosts)))
+    res = await fanout(hosts, bc._bootstrap_wait_cmd(),
+                       timeout=bc.BOOTSTRAP_WAIT + 60)
+    if not res.ok:
+        res.log_failures(what)
+        raise TimeoutError("{} is not finished.".format(what))
+
+
+async def start_notebook(pobj, clinfo, bootstrapped=False, retry_count=None):
+    """노트북 시작.
+
+    한 호스트에 차례로 보내는 명령들이고, 접속 URL 은 이벤트 루프에서 기다리며
+    확인한다.
+
+    Args:
+        clinfo (dict): 클러스터 생성 정보
+        bootstrapped (bool): 생성시 cloud-init 으로 이미 설정된 경우 True
+        retry_count (int): 접속 URL 얻기 최대 시도 수. None 이면 재시도
+            정책의 제한 시간까지
+
+    Raises:
+        TimeoutError: 재시도 수가 넘을 때
+    """
+    critical("Start notebook.")
+    ncfg = clinfo['notebook']
+    host = bc._host(ncfg, pobj.private_command)
+    nb_workdir = pobj.nb_workdir or bc.NB_WORKDIR
+
+    if bootstrapped:
+        with timing_span(clinfo, 'notebook.bootstrap'):
+            await wait_bootstrap([host], "Notebook bootstrap")
+    else:
+        # AWS 크레덴셜 설치와 작업 폴더
+        with timing_span(clinfo, 'notebook.setup'):
+            await send_cmd(host, "{}; mkdir -p {}".format(bc._aws_creds_cmd(),
+                                                          nb_workdir))
+
+        # git 설정이 있으면 설정 후 클론
+        if pobj.nb_git is not None:
+            with timing_span(clinfo, 'notebook.git'):
+                cmds, cdirs = bc._git_setup_cmds(pobj, nb_workdir)
+                await send_cmd(host, cmds[0])
+                for cmd in cmds[1:]:
+                    await send_cmd(host, cmd, show_stderr=False)
+                clinfo['git_cloned_dir'] = cdirs
+
+    # 클러스터 타입별 노트북 설정
+    vars = ''
+    if 'type' in clinfo:
+        if clinfo['type'] == 'dask':
+            # dask-labextension 을 위한 대쉬보드 URL
+            sip = clinfo['scheduler']['public_ip']
+            with timing_span(clinfo, 'notebook.labext'):
+                await send_cmd(host, bc._labext_cmd(sip))
+            vars = bc._get_dask_scheduler_address(clinfo)
+        else:
+            raise NotImplementedError()
+
+    if not bootstrapped:
+        with timing_span(clinfo, 'notebook.jupyter'):
+            await send_cmd(host, bc._jupyter_cmd(nb_workdir, vars))
+
+    # 접속 URL 얻기
+    cmd = "jupyter notebook list | awk '{print $1}'"
+    with timing_span(clinfo, 'notebook.url'):
+        async for i in get_retry_policy().async_attempts(retry_count):
+            res = await send_cmd(host, cmd)
+            if len(res.stdout) > 1:
+                url = res.stdout[1].strip().replace('0.0.0.0',
+                                                    ncfg['public_ip'])
+                clinfo['notebook_url'] = url
+                return
+            info("Can not fetch notebook list. Wait for a while.")
+    raise TimeoutError("Can not get notebook url.")
+
+
+async def start_dask_cluster(clinfo, bootstrapped=False):
+    """Dask 클러스터 마스터/워커를 시작.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        bootstrapped (bool): 생성시 cloud-init 으로 이미 시작된 경우 True
+    """
+    critical("Start dask scheduler & workers.")
+    private_command = clinfo['private_command']
+    scd = clinfo['scheduler']
+    sip = bc._get_ip(scd, private_command)
+
+    if bootstrapped:
+        # 부팅시 이미 시작되었으면 완료만 확인
+        hosts = [bc._host(scd, private_command)] + bc._worker_hosts(clinfo)
+        with timing_span(clinfo, 'dask.bootstrap'):
+            await wait_bootstrap(hosts, "Dask bootstrap")
+    else:
+        # AWS 크레덴셜 설치 후 스케쥴러 시작
+        cmd = "{}; {}".format(bc._aws_creds_cmd(), bc._dask_scheduler_cmd())
+        with timing_span(clinfo, 'dask.scheduler'):
+            await send_cmd(bc._host(scd, private_command), cmd)
+
+        # 워커 그룹별로 옵션을 정해 워커 IP 별 시작 명령 구성
+        cmds = {}
+        with timing_span(clinfo, 'dask.sizing'):
+            for winfo in bc.worker_groups(clinfo):
+                cmds.update(await run_blocking(bc._worker_start_cmds, clinfo,
+                                               winfo))
+
+        # 모든 워커들에 동시에 AWS 크레덴셜 설치 후 워커 시작
+        with timing_span(clinfo, 'dask.workers'):
+            res = await fanout(bc._worker_hosts(clinfo), cmds.get)
+        res.log_failures("Start dask worker")
+
+    # Dask 스케쥴러의 대쉬보드 기다림
+    dash_url = 'http://{}:8787'.format(sip)
+    clinfo['dask_dashboard_url'] = dash_url
+    critical("Wait for Dask dashboard ready.")
+    with timing_span(clinfo, 'dask.dashboard'):
+        await wait_until_connect(dash_url)
+
+
+async def start_cluster(clinfo, bootstrapped=False):
+    """클러스터 마스터 & 워커를 시작."""
+    assert 'type' in clinfo
+    if clinfo['type'] == 'dask':
+        await start_dask_cluster(clinfo, bootstrapped)
+    else:
+        raise NotImplementedError()
+
+
+async def start_notebook_and_cluster(pobj, clinfo):
+    """생성된 클러스터의 노트북과 클러스터를 동시에 시작."""
+    bootstrapped = pobj.bootstrap
+    coros = []
+    if 'notebook' in clinfo:
+        coros.append(start_notebook(pobj, clinfo, bootstrapped))
+    if 'type' in clinfo:
+        coros.append(start_cluster(clinfo, bootstrapped))
+
+    pool = bc.ssh_pool
+    retries, retry_wait = pool.connect_retries, pool.connect_wait
+    try:
+        await asyncio.gather(*coros)
+    finally:
+        # SSH 연결 재시도 수와 대기 시간 (여러 호스트에서 일어난 것의 합)
+        timing_count(clinfo, 'ssh_connect_retries',
+                     pool.connect_retries - retries)
+        timing_count(clinfo, 'ssh_connect_wait', pool.connect_wait - retry_wait)
+
+
+async def create_and_start(profile, clname, params):
+    """클러스터를 생성하고 노트북과 클러스터를 시작.
+
+    Returns:
+        tuple: (프로파일 객체, 클러스터 정보)
+    """
+    pobj, clinfo = await create_cluster(profile, clname, params)
+    await start_notebook_and_cluster(pobj, clinfo)
+    return pobj, clinfo
+
+
+async def stop_cluster(clname, drain=False, timeout=bc.RETIRE_TIMEOUT):
+    """클러스터 마스터/워커를 중지.
+
+    Args:
+        clname (str): 클러스터명
+        drain (bool): 실행중인 태스크를 기다리고 워커를 은퇴시킨 후 중지
+        timeout (float): drain 의 제한 시간(초)
+
+    Returns:
+        dict: 클러스터 정보(재시작 용)
+    """
+    clinfo = bc.check_cluster(clname)
+    private_command = clinfo['private_command']
+
+    if clinfo['type'] == 'dask':
+        if drain and not await run_blocking(bc.drain_cluster, clinfo,
+                                            timeout):
+            warning("Can not drain workers gracefully. Stop anyway.")
+        critical("Stop dask scheduler & workers.")
+        # 스케쥴러와 워커들을 동시에 중지
+        hosts = [bc._host(clinfo['scheduler'], private_command)]
+        hosts += bc._worker_hosts(clinfo)
+        await fanout(hosts, "screen -X -S 'bilbo' quit")
+    else:
+        raise NotImplementedError()
+    return clinfo
+
+
+async def restart_cluster(clname, drain=False, timeout=bc.RETIRE_TIMEOUT):
+    """클러스터를 중지 후 다시 시작."""
+    clinfo = await stop_cluster(clname, drain, timeout)
+    await start_cluster(clinfo)
+    return clinfo
@@ -0,0 +1,212 @@
+"""Dask 워커 자동 스케일 모듈.
+
+스케쥴러의 부하(대기 태스크, 워커 스레드, 메모리)를 주기적으로 확인해, 설정된
+최소/최대 워커 수와 쿨다운 안에서 워커 그룹의 워커 수를 바꾼다. 모든 판단은
+`~/.bilbo/logs/autoscale-<클러스터>.jsonl` 에 한 줄씩 기록된다.
+"""
+import os
+import json
+import math
+import time
+import datetime
+
+from bilbo.util import log_dir, check_dirs, info, warning, critical
+
+DEFAULTS = {
+    'min': 0,
+    'max': None,
+    'group': 0,
+    'interval': 30,
+    'up_cooldown': 60,
+    'down_cooldown': 300,
+    'tasks_per_thread': 2,
+    'memory_target': 0.7
+}
+
+# 스케쥴러에서 부하를 JSON 으로 출력하는 파이썬 코드
+LOAD_PY = """
+import json
+
+def load(dask_scheduler):
+    s = dask_scheduler
+    ws = list(s.workers.values())
+    return {
+        'processing': sum(len(w.processing) for w in ws),
+        'queued': len(getattr(s, 'queued', ())),
+        'unrunnable': len(getattr(s, 'unrunnable', ())),
+        'workers': len(ws),
+        'hosts': len(set(w.host for w in ws)),
+        'nthreads': sum(w.nthreads for w in ws),
+        'memory': sum(w.metrics.get('memory', 0) for w in ws),
+        'memory_limit': sum(w.memory_limit or 0 for w in ws)
+    }
+
+print(json.dumps(c.run_on_scheduler(load)))
+"""
+
+
+def resolve_config(clinfo, **overrides):
+    """클러스터 정보의 자동 스케일 설정에 기본값과 명령행 값을 적용.
+
+    Raises:
+        RuntimeError: 최대 워커 수가 없거나 최소보다 작을 때
+    """
+    cfg = dict(DEFAULTS)
+    cfg.update(clinfo.get('autoscale') or {})
+    cfg.update({k: v for k, v in overrides.items() if v is not None})
+    if cfg['max'] is None:
+        raise RuntimeError("No maximum worker count for autoscaling. Set "
+                           "'dask.autoscale.max' in the profile or use "
+                           "--max.")
+    if cfg['max'] < cfg['min']:
+        raise RuntimeError("Maximum worker count is less than minimum.")
+    return cfg
+
+
+def poll_scheduler(clinfo):
+    """스케쥴러의 현재 부하 얻기.
+
+    Returns:
+        dict: processing, queued, unrunnable, workers, hosts, nthreads, memory,
+            memory_limit. 얻지 못하면 None
+    """
+    from bilbo.cluster import run_on_scheduler
+
+    res = run_on_scheduler(clinfo, LOAD_PY, 60, "Poll scheduler")
+    if not res.ok:
+        # 실패는 run_on_scheduler 가 로그를 남김
+        return None
+    if len(res.stdout) == 0:
+        warning("Can not poll scheduler load: no output")
+        return None
+    try:
+        return json.loads(res.stdout[-1])
+    except ValueError:
+        warning("Wrong scheduler load: {}".format(res.stdout[-1]))
+        return None
+
+
+def decide(load, current, cfg, now, last_change, others=0):
+    """부하와 설정으로 목표 워커 수 결정.
+
+    대기 태스크를 스레드당 `tasks_per_thread` 개로 처리할 수 있는 워커 수와,
+    사용중인 메모리를 `memory_target` 비율로 담을 수 있는 워커 수 중 큰 것을
+    목표로 하되 최소/최대 안으로 제한한다. 부하는 클러스터 전체의 것이기에,
+    다른 워커 그룹의 워커 수를 뺀 만큼이 이 그룹의 목표다. 마지막 변경 후
+    쿨다운이 지나지 않았으면 현재 수를 유지한다.
+
+    Args:
+        load (dict): `poll_scheduler` 결과
+        current (int): 그룹의 현재 워커(인스턴스) 수
+        cfg (dict): `resolve_config` 결과
+        now (float): 현재 시간(초)
+        last_change (float): 마지막 변경 시간(초). 없으면 None
+        others (int): 다른 워커 그룹들의 워커(인스턴스) 수
+
+    Returns:
+        tuple: (목표 워커 수, 판단 이유)
+    """
+    lo, hi = cfg['min'], cfg['max']
+    # 범위 밖이면 쿨다운과 무관하게 맞춤
+    if current < lo:
+        return lo, 'below_min'
+    if current > hi:
+        return hi, 'above_max'
+
+    hosts = load['hosts']
+    backlog = load['processing'] + load['queued'] + load['unrunnable']
+    if hosts == 0:
+        # 워커가 없으면 태스크가 있을 때만 하나 띄움
+        desired = 1 if backlog > 0 else 0
+        by_memory = 0
+    else:
+        threads_per_host = max(1, load['nthreads'] / hosts)
+        desired = math.ceil(backlog / (threads_per_host *
+                                       cfg['tasks_per_thread']))
+        mem_per_host = load['memory_limit'] / hosts
+        by_memory = 0
+        if mem_per_host > 0:
+            by_memory = math.ceil(load['memory'] /
+                                  (mem_per_host * cfg['memory_target']))
+    target = min(hi, max(lo, max(desired, by_memory) - others))
+
+    if target == current:
+        return current, 'steady'
+    elapsed = now - last_change if last_change is not None else None
+    if target > current:
+        if elapsed is not None and elapsed < cfg['up_cooldown']:
+            return current, 'up_cooldown'
+        return target, 'scale_up'
+    if elapsed is not None and elapsed < cfg['down_cooldown']:
+        return current, 'down_cooldown'
+    return target, 'scale_down'
+
+
+def decision_log_path(clname):
+    """클러스터의 자동 스케일 판단 기록 파일 경로."""
+    return os.path.join(log_dir, 'autoscale-{}.jsonl'.format(clname))
+
+
+def log_decision(clname, record):
+    """판단 하나를 JSON 한 줄로 기록."""
+    check_dirs()
+    with open(decision_log_path(clname), 'at') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def run(clname, once=False, **overrides):
+    """자동 스케일 루프. Ctrl-C 로 멈춘다.
+
+    Args:
+        clname (str): 클러스터명
+        once (bool): 한 번만 판단하고 끝냄
+        overrides: 프로파일 설정을 덮어쓸 값 (min, max, interval 등)
+    """
+    from bilbo.cluster import check_cluster, scale_cluster, worker_groups
+
+    clinfo = check_cluster(clname)
+    if clinfo.get('type') != 'dask':
+        raise RuntimeError("Cluster '{}' is not a dask cluster.".
+                           format(clname))
+    cfg = resolve_config(clinfo, **overrides)
+    critical("Autoscale '{}' between {} and {} worker(s).".
+             format(clname, cfg['min'], cfg['max']))
+
+    last_change = None
+    while True:
+        clinfo = check_cluster(clname)
+        counts = [len(winfo['instances']) for winfo in worker_groups(clinfo)]
+        current = counts[cfg['group']]
+        others = sum(counts) - current
+        load = poll_scheduler(clinfo)
+        now = time.time()
+        record = {
+            'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'cluster': clname,
+            'current': current,
+            'others': others,
+            'load': load
+        }
+        if load is None:
+            record.update(target=current, reason='no_load')
+        else:
+            target, reason = decide(load, current, cfg, now, last_change,
+                                    others)
+            record.update(target=target, reason=reason)
+            if target != current:
+                info("autoscale: {} -> {} ({})".format(current, target,
+                                                       reason))
+                try:
+                    scale_cluster(clname, target, cfg['group'])
+                except Exception as e:
+                    warning("Autoscale failed: {}".format(e))
+                    record['error'] = str(e)
+                else:
+                    # 실패한 시도로는 쿨다운을 시작하지 않음
+                    last_change = time.time()
+        log_decision(clname, record)
+        print("{time} workers {current} -> {target} ({reason})".
+              format(**record))
+        if once:
+            return record
+        time.sleep(cfg['interval'])
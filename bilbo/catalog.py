@@ -0,0 +1,92 @@
+"""EC2 인스턴스 타입 카탈로그 모듈.
+
+인스턴스 타입별 하드웨어 정보(vCPU, 코어, 코어당 스레드, 메모리)를
+`describe_instance_types` 로 얻어 `~/.bilbo` 아래에 캐쉬한다. 인스턴스가
+부팅되기 전에 Dask 워커 옵션을 정할 수 있게 하기 위함이다.
+"""
+import os
+import json
+import threading
+
+from bilbo.util import catalog_path, info, warning, check_dirs
+
+# `free -b` 의 전체 메모리는 커널 예약분 만큼 명목 메모리보다 작다.
+USABLE_MEMORY_RATIO = 0.95
+# describe_instance_types 한 번에 조회할 수 있는 최대 타입 수
+DESCRIBE_BATCH = 100
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def _load_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = {}
+        if os.path.isfile(catalog_path):
+            with open(catalog_path, 'rt') as f:
+                _catalog = json.loads(f.read())
+    return _catalog
+
+
+def _save_catalog(catalog):
+    check_dirs()
+    tmp = catalog_path + '.tmp'
+    with open(tmp, 'wt') as f:
+        f.write(json.dumps(catalog, indent=4, sort_keys=True))
+    os.replace(tmp, catalog_path)
+
+
+def _parse_instance_type(itype):
+    vcpu = itype['VCpuInfo']
+    return {
+        'vcpus': vcpu['DefaultVCpus'],
+        'cores': vcpu.get('DefaultCores', vcpu['DefaultVCpus']),
+        'threads_per_core': vcpu.get('DefaultThreadsPerCore', 1),
+        'memory': itype['MemoryInfo']['SizeInMiB'] * 1024 * 1024
+    }
+
+
+def get_instance_types(ec2types, client=None):
+    """인스턴스 타입들의 하드웨어 정보 얻기.
+
+    캐쉬에 없는 타입만 한꺼번에 조회해 캐쉬에 추가한다.
+
+    Args:
+        ec2types (list): 인스턴스 타입 리스트
+        client: boto EC2 client. 없으면 새로 만듦
+
+    Returns:
+        dict: 타입별 정보. 조회할 수 없는 타입은 빠진다
+    """
+    import botocore
+
+    with _lock:
+        catalog = _load_catalog()
+        missing = sorted(set(t for t in ec2types if t not in catalog))
+        if len(missing) > 0:
+            info("get_instance_types: fetch {}".format(missing))
+            if client is None:
+                import boto3
+                client = boto3.client('ec2')
+            try:
+                for s in range(0, len(missing), DESCRIBE_BATCH):
+                    res = client.describe_instance_types(
+                        InstanceTypes=missing[s:s + DESCRIBE_BATCH])
+                    for itype in res['InstanceTypes']:
+                        name = itype['InstanceType']
+                        catalog[name] = _parse_instance_type(itype)
+            except botocore.exceptions.ClientError as e:
+                warning("Can not describe instance types: {}".format(e))
+            _save_catalog(catalog)
+        return {t: catalog[t] for t in ec2types if t in catalog}
+
+
+def get_instance_type(ec2type, client=None):
+    """인스턴스 타입 하나의 하드웨어 정보. 알 수 없으면 None."""
+    return get_instance_types([ec2type], client).get(ec2type)
+
+
+def usable_memory(hw):
+    """하드웨어 정보에서 OS 가 보고할 전체 메모리(바이트) 추정."""
+    return int(hw['memory'] * USABLE_MEMORY_RATIO)
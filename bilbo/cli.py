@@ -1,17 +1,13 @@
-"""명령행 인터페이스."""
-import json
+"""명령행 인터페이스.
 
+쉘 자동완성이나 스크립트에서 자주 불리는 명령이 빠르도록, 무거운 의존
+패키지(boto3, paramiko, jsonschema)를 쓰는 모듈은 필요한 명령 안에서 임포트한다.
+클러스터 생성과 재시작은 `bilbo.aio` 의 코루틴을 한 이벤트 루프에서 돌린다.
+"""
 import click
-import botocore
 
 from bilbo.version import VERSION
 from bilbo.util import set_log_verbosity, iter_profiles
-from bilbo.cluster import create_cluster, show_cluster, \
-    destroy_cluster, show_all_cluster, send_instance_cmd, \
-    find_cluster_instance_by_public_ip, stop_cluster, start_cluster, \
-    open_dashboard, save_cluster_info, open_notebook, start_notebook, \
-    run_notebook_or_python, stop_notebook_or_python
-from bilbo.profile import check_profile, show_plan
 
 
 @click.group()
@@ -34,15 +30,16 @@ def main(ctx, verbose):
               "dashboard when cluster is ready.")
 def create(profile, name, param, open_nb, open_db):
     """클러스터 생성."""
+    from bilbo.aio import run, create_and_start
+    from bilbo.profile import check_profile
+    from bilbo.cluster import save_cluster_info, show_cluster, \
+        open_notebook, open_dashboard
+
     check_profile(profile)
-    pobj, clinfo = create_cluster(profile, name, param)
+    pobj, clinfo = run(create_and_start(profile, name, param))
     remote_nb = 'notebook' in clinfo
     if name is None:
         name = clinfo['name']
-    if remote_nb:
-        start_notebook(pobj, clinfo)
-    if 'type' in clinfo:
-        start_cluster(clinfo)
     save_cluster_info(name, clinfo)
     show_cluster(name)
 
@@ -63,12 +60,14 @@ def create(profile, name, param, open_nb, open_db):
               help="Override profile by parameter.")
 def plan(profile, name, param):
     """클러스터 생성 계획 표시."""
+    from bilbo.profile import show_plan
     show_plan(profile, name, param)
 
 
 @main.command(help="List active clusters.")
 def ls():
     """모든 클러스터를 리스팅."""
+    from bilbo.cluster import show_all_cluster
     show_all_cluster()
 
 
@@ -82,35 +81,161 @@ def profiles():
 @main.command(help="Destroy cluster.")
 @click.argument('CLUSTER')
 @click.option('-f', '--force', is_flag=True, help="Destroy without check.")
-def destroy(cluster, force):
+@click.option('--keep-warm', is_flag=True, help="Stop dask instances into "
+              "the warm pool instead of terminating them.")
+def destroy(cluster, force, keep_warm):
     """클러스터 파괴."""
-    destroy_cluster(cluster, force)
+    from bilbo.cluster import destroy_cluster
+    destroy_cluster(cluster, force, keep_warm)
+
+
+@main.group(help="Manage the warm pool of stopped instances.")
+def pool():
+    pass
+
+
+@pool.command('fill', help="Launch and stop instances into the warm pool.")
+@click.argument('PROFILE')
+@click.argument('COUNT', type=click.IntRange(min=1))
+@click.option('-p', '--param', multiple=True,
+              help="Override profile by parameter.")
+def pool_fill(profile, count, param):
+    """프로파일의 Dask 인스턴스 사양별로 웜 풀 채우기."""
+    from bilbo.profile import check_profile
+    from bilbo.pool import fill_pool, show_pool
+
+    check_profile(profile)
+    fill_pool(profile, count, param)
+    show_pool()
+
+
+@pool.command('ls', help="List warm pool instances.")
+def pool_ls():
+    from bilbo.pool import show_pool
+    show_pool()
+
+
+@pool.command('clear', help="Terminate all warm pool instances.")
+def pool_clear():
+    from bilbo.pool import clear_pool
+    print("{} instance(s) terminated.".format(clear_pool()))
 
 
 @main.command(help="Describe cluster.")
 @click.argument('CLUSTER')
 @click.option('-d', '--detail', is_flag=True,
               help="Show detailed information.")
-def desc(cluster, detail):
-    show_cluster(cluster, detail)
+@click.option('-t', '--timing', is_flag=True,
+              help="Show time spent in each creation phase.")
+def desc(cluster, detail, timing):
+    from bilbo.cluster import show_cluster
+    show_cluster(cluster, detail, timing)
 
 
-def _restart(cluster):
-    clinfo = stop_cluster(cluster)
-    start_cluster(clinfo)
+def _restart(cluster, drain=False, rolling=False, batch=1, timeout=None):
+    from bilbo.aio import run, restart_cluster
+    from bilbo.cluster import rolling_restart, RETIRE_TIMEOUT
+
+    timeout = timeout or RETIRE_TIMEOUT
+    if rolling:
+        rolling_restart(cluster, batch, timeout)
+        return
+    run(restart_cluster(cluster, drain, timeout))
+
+
+def restart_options(func):
+    """재시작 방식 옵션들."""
+    func = click.option('--timeout', type=float, help="Seconds to wait for "
+                        "drain or each rolling batch.")(func)
+    func = click.option('-b', '--batch', default=1, help="Worker hosts per "
+                        "batch for rolling restart (Default: 1).")(func)
+    func = click.option('--rolling', is_flag=True, help="Restart workers "
+                        "in batches, keeping the scheduler up.")(func)
+    func = click.option('--drain', is_flag=True, help="Wait for running "
+                        "tasks and retire workers before stopping.")(func)
+    return func
 
 
 @main.command(help="Restart cluster.")
 @click.argument('CLUSTER')
-def restart(cluster):
-    _restart(cluster)
+@restart_options
+def restart(cluster, drain, rolling, batch, timeout):
+    _restart(cluster, drain, rolling, batch, timeout)
 
 
-@main.command(help="Command to a cluster instance.")
+@main.command(help="Change the number of dask workers.")
+@click.argument('CLUSTER')
+@click.argument('COUNT', type=int)
+@click.option('-g', '--group', default=0, help="Worker group index "
+              "(Default: 0).")
+@click.option('-f', '--force', is_flag=True, help="Terminate surplus workers "
+              "without retiring them.")
+def scale(cluster, count, group, force):
+    """Dask 워커 수 변경."""
+    from bilbo.cluster import scale_cluster, show_cluster
+    scale_cluster(cluster, count, group, force)
+    show_cluster(cluster)
+
+
+@main.command(help="Autoscale dask workers by scheduler load.")
 @click.argument('CLUSTER')
-@click.argument('PUBLIC_IP')
-@click.argument('CMD')
-def rcmd(cluster, public_ip, cmd):
+@click.option('--min', 'min_', type=int, help="Minimum worker count.")
+@click.option('--max', 'max_', type=int, help="Maximum worker count.")
+@click.option('-i', '--interval', type=float, help="Seconds between "
+              "scheduler polls.")
+@click.option('--once', is_flag=True, help="Decide once and exit.")
+def autoscale(cluster, min_, max_, interval, once):
+    """스케쥴러 부하에 따라 워커 수를 자동으로 조절."""
+    from bilbo.autoscale import run
+
+    try:
+        run(cluster, once, min=min_, max=max_, interval=interval)
+    except KeyboardInterrupt:
+        print("Autoscale stopped.")
+
+
+@main.command('spot-watch', help="Replace spot workers on interruption "
+              "notice.")
+@click.argument('CLUSTER')
+@click.option('-i', '--interval', default=5.0, help="Seconds between checks "
+              "(Default: 5).")
+@click.option('--once', is_flag=True, help="Check once and exit.")
+def spot_watch(cluster, interval, once):
+    """스팟 중단 알림을 받은 워커를 은퇴시키고 대체."""
+    from bilbo.cluster import watch_spot
+
+    try:
+        watch_spot(cluster, interval, once)
+    except KeyboardInterrupt:
+        print("Spot watch stopped.")
+
+
+@main.command(help="Command to a cluster instance, or to many instances "
+              "with --all or --role.")
+@click.argument('CLUSTER')
+@click.argument('ARGS', nargs=-1, required=True, metavar='[PUBLIC_IP] CMD')
+@click.option('-a', '--all', 'all_', is_flag=True, help="Run on all "
+              "instances concurrently.")
+@click.option('-r', '--role', type=click.Choice(['notebook', 'scheduler',
+                                                 'worker']),
+              help="Run on all instances of the role concurrently.")
+@click.option('-s', '--stream', is_flag=True, help="Show each host's output "
+              "as it finishes instead of grouping identical outputs.")
+@click.pass_context
+def rcmd(ctx, cluster, args, all_, role, stream):
+    from bilbo.cluster import find_cluster_instance_by_public_ip, \
+        send_instance_cmd, broadcast_cmd
+
+    if all_ or role is not None:
+        if len(args) != 1:
+            raise click.UsageError("Give only CMD with --all or --role.")
+        if not broadcast_cmd(cluster, args[0], role, stream):
+            ctx.exit(1)
+        return
+
+    if len(args) != 2:
+        raise click.UsageError("Give PUBLIC_IP and CMD.")
+    public_ip, cmd = args
     # 존재하는 클러스터에서 인스턴스 IP로 정보를 찾음
     info = find_cluster_instance_by_public_ip(cluster, public_ip)
     if info is None:
@@ -126,10 +251,77 @@ def rcmd(cluster, public_ip, cmd):
             print(out)
 
 
+@main.command(help="Show logs of notebook, scheduler and workers.")
+@click.argument('CLUSTER')
+@click.option('-r', '--role', type=click.Choice(['notebook', 'scheduler',
+                                                 'worker']),
+              help="Show logs of the role only.")
+@click.option('-f', '--follow', is_flag=True, help="Keep streaming new log "
+              "lines.")
+@click.option('-n', '--lines', default=20, help="Number of last lines to "
+              "show first (Default: 20).")
+def logs(cluster, role, follow, lines):
+    """클러스터 인스턴스들의 로그를 모아서 보기."""
+    from bilbo.logs import show_logs
+
+    try:
+        show_logs(cluster, role, follow, lines)
+    except KeyboardInterrupt:
+        pass
+
+
+@main.command(help="Copy a local file or directory to cluster instances.")
+@click.argument('CLUSTER')
+@click.argument('SRC', type=click.Path(exists=True))
+@click.argument('DST')
+@click.option('-r', '--role', type=click.Choice(['notebook', 'scheduler',
+                                                 'worker']),
+              help="Copy to instances of the role only.")
+@click.option('-z', '--compress', is_flag=True, help="Compress with gzip "
+              "before sending.")
+@click.option('--relay', is_flag=True, help="Send once to the scheduler (or "
+              "notebook) and let other instances fetch from it.")
+@click.option('-f', '--force', is_flag=True, help="Send even if the "
+              "destination has the same content.")
+@click.pass_context
+def put(ctx, cluster, src, dst, role, compress, relay, force):
+    """로컬 파일이나 폴더를 클러스터 인스턴스들에 보내기."""
+    from bilbo.transfer import put_files
+
+    if not put_files(cluster, src, dst, role, compress, relay, force):
+        ctx.exit(1)
+
+
+@main.command(help="Sync a local directory to the notebook instance.")
+@click.argument('CLUSTER')
+@click.argument('LOCAL_DIR', default='.', type=click.Path(exists=True,
+                                                          file_okay=False))
+@click.option('-d', '--dest', help="Remote directory (Default: ~/works).")
+@click.option('--delete', is_flag=True, help="Delete remote files not in the "
+              "local directory.")
+@click.option('-x', '--exclude', multiple=True, help="Name pattern to "
+              "exclude, in addition to .git, __pycache__ and so on.")
+@click.option('-w', '--watch', is_flag=True, help="Keep syncing on local "
+              "changes.")
+def sync(cluster, local_dir, dest, delete, exclude, watch):
+    """로컬 폴더를 노트북 인스턴스의 작업 폴더로 동기화."""
+    from bilbo.sync import sync_notebook, watch_notebook
+
+    if watch:
+        try:
+            watch_notebook(cluster, local_dir, dest, delete, exclude)
+        except KeyboardInterrupt:
+            print("Sync stopped.")
+        return
+    send, deletes = sync_notebook(cluster, local_dir, dest, delete, exclude)
+    print("Synced {} file(s), deleted {}.".format(len(send), len(deletes)))
+
+
 @main.command(help="Open dashboard.")
 @click.argument('CLUSTER')
 @click.option('-u', '--url-only', is_flag=True, help="Show URL only.")
 def dashboard(cluster, url_only):
+    from bilbo.cluster import open_dashboard
     open_dashboard(cluster, url_only)
 
 
@@ -137,6 +329,7 @@ def dashboard(cluster, url_only):
 @click.argument('CLUSTER')
 @click.option('-u', '--url-only', is_flag=True, help="Show URL only.")
 def notebook(cluster, url_only):
+    from bilbo.cluster import open_notebook
     open_notebook(cluster, url_only)
 
 
@@ -147,16 +340,145 @@ def notebook(cluster, url_only):
               help="Parameter to run with")
 @click.option('-r', '--restart', '_restart_after', is_flag=True,
               help="Restart cluster when after running.")
-def run(cluster, file, param, _restart_after):
+@click.option('-s', '--sync', '_sync', is_flag=True, help="Sync the current "
+              "directory to the notebook's work directory before running.")
+@click.option('-d', '--detach', is_flag=True, help="Submit as a job and "
+              "return without waiting.")
+@restart_options
+@click.pass_context
+def run(ctx, cluster, file, param, _restart_after, _sync, detach, drain,
+        rolling, batch, timeout):
+    """노트북 인스턴스에서 작업으로 실행하고 로그를 따라감.
+
+    연결이 끊어져도 작업은 계속되며, Ctrl-C 를 누르면 작업을 중지한다.
+    """
+    from bilbo.jobs import submit_job, follow_job, kill_job
+
+    if detach and _restart_after:
+        raise click.UsageError("Can not restart after a detached run.")
+    if _sync:
+        from bilbo.sync import sync_notebook
+        send, deletes = sync_notebook(cluster)
+        print("Synced {} file(s).".format(len(send)))
+
+    job = submit_job(cluster, file, param)
+    if detach:
+        print("Job {} submitted.".format(job['job_id']))
+        return
+
     try:
-        run_notebook_or_python(cluster, file, param)
+        job = follow_job(cluster, job)
     except KeyboardInterrupt:
         print("Interrupt received, stopping...")
-        stop_notebook_or_python(cluster, file, param)
+        job = kill_job(cluster, job['job_id'])
     finally:
         if _restart_after:
-            _restart(cluster)
+            _restart(cluster, drain, rolling, batch, timeout)
         print("Finished.")
+    if job['status'] != 'done':
+        print("Job {} {}.".format(job['job_id'], _job_status(job)))
+        ctx.exit(1)
+
+
+def _job_status(job):
+    if job['status'] == 'failed' and job['exit_code'] is not None:
+        return "failed with exit code {}".format(job['exit_code'])
+    return job['status']
+
+
+@main.command(help="List remote jobs on the notebook instance.")
+@click.argument('CLUSTER')
+def jobs(cluster):
+    """노트북 인스턴스의 작업들 표시."""
+    from bilbo.jobs import show_jobs
+    show_jobs(cluster)
+
+
+@main.group('job', help="Wait, show logs or kill a remote job.")
+def job_group():
+    pass
+
+
+@job_group.command('wait', help="Wait until a job finishes.")
+@click.argument('CLUSTER')
+@click.argument('JOB_ID')
+@click.option('-t', '--timeout', type=float, help="Seconds to wait. Exits "
+              "with 124 on timeout.")
+@click.pass_context
+def job_wait(ctx, cluster, job_id, timeout):
+    """작업이 끝날 때까지 기다리고, 작업의 종료 코드로 끝냄.
+
+    제한 시간이 지나면 `WAIT_TIMEOUT_EXIT` 로 끝낸다.
+    """
+    from bilbo.jobs import wait_job, WAIT_TIMEOUT_EXIT
+
+    try:
+        job = wait_job(cluster, job_id, timeout)
+    except TimeoutError as e:
+        print(e)
+        ctx.exit(WAIT_TIMEOUT_EXIT)
+    print("Job {} {}.".format(job['job_id'], _job_status(job)))
+    if job['status'] != 'done':
+        ctx.exit(job['exit_code'] or 1)
+
+
+@job_group.command('logs', help="Show output of a job.")
+@click.argument('CLUSTER')
+@click.argument('JOB_ID')
+@click.option('-f', '--follow', is_flag=True, help="Keep streaming until the "
+              "job finishes.")
+@click.option('-n', '--lines', default=20, help="Number of last lines to "
+              "show (Default: 20).")
+def job_logs(cluster, job_id, follow, lines):
+    from bilbo.jobs import job_logs as show_job_logs
+
+    try:
+        show_job_logs(cluster, job_id, follow, lines)
+    except KeyboardInterrupt:
+        pass
+
+
+@job_group.command('kill', help="Kill a job.")
+@click.argument('CLUSTER')
+@click.argument('JOB_ID')
+def job_kill(cluster, job_id):
+    from bilbo.jobs import kill_job
+
+    job = kill_job(cluster, job_id)
+    if job['status'] != 'killed':
+        print("Job {} {}.".format(job['job_id'], _job_status(job)))
+
+
+@main.command(help="Run a notebook or python file over a parameter grid.")
+@click.argument('CLUSTER')
+@click.argument('FILE')
+@click.option('-g', '--grid', type=click.Path(exists=True, dir_okay=False),
+              help="JSON file of parameter values or combinations.")
+@click.option('-j', '--parallel', type=click.IntRange(min=1), default=2,
+              help="Concurrent runs per instance (Default: 2).")
+@click.option('-w', '--on-workers', is_flag=True, help="Run on worker "
+              "instances as well as the notebook.")
+@click.option('--rerun', is_flag=True, help="Run again combinations already "
+              "done.")
+@click.option('--status', is_flag=True, help="Show status of the runs only.")
+@click.pass_context
+def sweep(ctx, cluster, file, grid, parallel, on_workers, rerun, status):
+    """파라미터 그리드로 노트북 또는 파이썬 파일을 동시에 실행."""
+    from bilbo.sweep import load_grid, run_sweep, show_sweep
+
+    if status:
+        show_sweep(cluster, file)
+        return
+    if grid is None:
+        raise click.UsageError("Give parameter grid with --grid.")
+    try:
+        ok = run_sweep(cluster, file, load_grid(grid), parallel, on_workers,
+                       rerun)
+    except KeyboardInterrupt:
+        print("Sweep interrupted. Run again to resume.")
+        ctx.exit(1)
+    if not ok:
+        ctx.exit(1)
 
 
 @main.command(help='Show bilbo version.')
@@ -2,33 +2,56 @@
 import os
 from os.path import expanduser
 import re
-import json
 import datetime
 import warnings
 import time
 import webbrowser
 import tempfile
-from urllib.request import urlopen
-from urllib.error import URLError
-
-import botocore
-import boto3
-import paramiko
-
-from bilbo.profile import read_profile, DaskProfile, Profile
-from bilbo.util import critical, warning, error, clust_dir, iter_clusters, \
-    info, get_aws_config, PARAM_PTRN
+import threading
+import atexit
+import socket
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bilbo.profile import read_profile, DaskProfile, Profile, Instance, \
+    WorkerGroup
+from bilbo.catalog import get_instance_type, get_instance_types, \
+    usable_memory
+from bilbo import store
+from bilbo.pool import claim_instances, park_instances
+from bilbo.util import critical, warning, error, \
+    info, get_aws_config, PARAM_PTRN, timing_span, format_timing, \
+    get_retry_policy, set_retry_policy
 
 warnings.filterwarnings("ignore")
 
 NB_WORKDIR = "~/works"
-TRY_SLEEP = 10
+SSH_KEEPALIVE = 30
+# 여러 호스트에 동시에 명령을 보낼 때의 최대 동시 수와 호스트당 제한 시간(초)
+FANOUT_CONCURRENCY = 32
+FANOUT_TIMEOUT = 600
+# 인스턴스 상태 조회 간격(초)과 한 번에 조회할 최대 인스턴스 수
+WAIT_SLEEP = 5
+DESCRIBE_BATCH = 1000
+# cloud-init 부트스트랩 완료 표시 파일과 완료 대기 시간(초)
+BOOTSTRAP_DONE = "~/.bilbo_bootstrap_done"
+BOOTSTRAP_WAIT = 600
+# 원격 프로세스(노트북, 스케쥴러, 워커)의 로그 폴더. 원격 쉘에서 확장됨
+REMOTE_LOG_DIR = "$HOME/.bilbo_logs"
+# 워커를 은퇴시킬 때 결과 이전을 기다리는 시간(초)
+RETIRE_TIMEOUT = 300
+# 스팟 중단 알림 후 종료까지 약 2 분이기에 은퇴에 쓸 시간(초)
+SPOT_RETIRE_TIMEOUT = 90
+# 인스턴스 메타데이터(IMDSv2)에서 스팟 중단 알림 확인 명령
+SPOT_NOTICE_CMD = "TOKEN=$(curl -s -X PUT " \
+    "http://169.254.169.254/latest/api/token " \
+    "-H 'X-aws-ec2-metadata-token-ttl-seconds: 60'); " \
+    "curl -s -f -H \"X-aws-ec2-metadata-token: $TOKEN\" " \
+    "http://169.254.169.254/latest/meta-data/spot/instance-action"
 
 
 def cluster_info_exists(clname):
     """클러스터 정보가 존재하는가?"""
-    path = os.path.join(clust_dir, clname + '.json')
-    return os.path.isfile(path)
+    return store.cluster_exists(clname)
 
 
 def _build_tag_spec(name, desc, _tags):
@@ -50,9 +73,61 @@ def _build_tag_spec(name, desc, _tags):
     return tag_spec
 
 
-def create_ec2_instances(ec2, inst, cnt, tag_spec, clinfo=None):
-    """EC2 인스턴스 생성."""
+def _placement_kwargs(placement):
+    """배치 설정의 인스턴스 생성 인자 (Placement, SubnetId)."""
+    kwargs = {}
+    if placement is None:
+        return kwargs
+    plc = {}
+    if 'group' in placement:
+        plc['GroupName'] = placement['group']
+    if 'availability_zone' in placement:
+        plc['AvailabilityZone'] = placement['availability_zone']
+    if len(plc) > 0:
+        kwargs['Placement'] = plc
+    if 'subnet' in placement:
+        kwargs['SubnetId'] = placement['subnet']
+    return kwargs
+
+
+def ensure_placement_group(client, name, strategy):
+    """배치 그룹이 없으면 만듦. 있으면 재사용한다.
+
+    Returns:
+        bool: 새로 만들었으면 True
+    """
+    import botocore
+
+    try:
+        res = client.describe_placement_groups(GroupNames=[name])
+        pg = res['PlacementGroups'][0]
+        if pg['Strategy'] != strategy:
+            warning("Placement group '{}' exists with '{}' strategy.".
+                    format(name, pg['Strategy']))
+        info("ensure_placement_group: reuse '{}'".format(name))
+        return False
+    except botocore.exceptions.ClientError as e:
+        if 'InvalidPlacementGroup.Unknown' not in str(e):
+            raise e
+    critical("Create placement group '{}' ({}).".format(name, strategy))
+    client.create_placement_group(GroupName=name, Strategy=strategy)
+    return True
+
+
+def create_ec2_instances(ec2, inst, cnt, tag_spec, clinfo=None,
+                         user_data=None, placement=None):
+    """EC2 인스턴스 생성.
+
+    Args:
+        user_data (str): 부팅시 cloud-init 으로 실행할 스크립트
+        placement (dict): 배치 그룹, 서브넷, 가용 영역 설정
+    """
+    import botocore
+
     rdm = get_root_dm(ec2, inst)
+    kwargs = _placement_kwargs(placement)
+    if user_data is not None:
+        kwargs['UserData'] = user_data
 
     try:
         ins = ec2.create_instances(ImageId=inst.ami,
@@ -61,7 +136,8 @@ def create_ec2_instances(ec2, inst, cnt, tag_spec, clinfo=None):
                                    KeyName=inst.keyname,
                                    BlockDeviceMappings=rdm,
                                    SecurityGroupIds=[inst.secgroup],
-                                   TagSpecifications=tag_spec)
+                                   TagSpecifications=tag_spec,
+                                   **kwargs)
         return ins
     except botocore.exceptions.ClientError as e:
         error("create_ec2_instances - {}".format(str(e)))
@@ -69,32 +145,224 @@ def create_ec2_instances(ec2, inst, cnt, tag_spec, clinfo=None):
             raise e
 
 
+def create_fleet_instances(ec2, inst, cnt, tag_spec, spot, user_data=None,
+                           placement=None):
+    """EC2 Fleet 으로 스팟 인스턴스 생성.
+
+    인스턴스 설정으로 임시 런치 템플릿을 만들어 허용된 인스턴스 타입들로
+    instant 플릿을 요청한다. 인스턴스가 만들어진 후 템플릿은 지운다.
+
+    Args:
+        ec2: boto EC2 resource
+        inst (bilbo.profile.Instance): 인스턴스 프로파일
+        cnt (int): 인스턴스 수
+        tag_spec (list): 인스턴스 태그 스펙
+        spot (dict): 스팟 설정 (ec2types, allocation_strategy, max_price)
+        user_data (str): 부팅시 cloud-init 으로 실행할 스크립트
+        placement (dict): 배치 그룹, 서브넷, 가용 영역 설정
+
+    Returns:
+        list: 생성된 인스턴스 ID 리스트. 용량이 부족하면 cnt 보다 적을 수 있다
+    """
+    import base64
+    import uuid
+
+    ltdata = {
+        'ImageId': inst.ami,
+        'KeyName': inst.keyname,
+        'SecurityGroupIds': [inst.secgroup],
+        'TagSpecifications': tag_spec
+    }
+    client = ec2.meta.client
+    rdm = get_root_dm(ec2, inst)
+    if len(rdm) > 0:
+        ltdata['BlockDeviceMappings'] = rdm
+    if user_data is not None:
+        ltdata['UserData'] = base64.b64encode(user_data.encode('utf-8')).\
+            decode('ascii')
+    pkwargs = _placement_kwargs(placement)
+    if 'Placement' in pkwargs:
+        ltdata['Placement'] = pkwargs['Placement']
+    overrides = []
+    for ec2type in spot['ec2types']:
+        ovr = {'InstanceType': ec2type}
+        if 'SubnetId' in pkwargs:
+            ovr['SubnetId'] = pkwargs['SubnetId']
+        overrides.append(ovr)
+    spot_opts = {'AllocationStrategy': spot['allocation_strategy']}
+    if 'max_price' in spot:
+        spot_opts['MaxTotalPrice'] = str(spot['max_price'] * cnt)
+
+    ltname = 'bilbo-{}'.format(uuid.uuid4().hex)
+    lt = client.create_launch_template(LaunchTemplateName=ltname,
+                                       LaunchTemplateData=ltdata)
+    ltid = lt['LaunchTemplate']['LaunchTemplateId']
+    try:
+        res = client.create_fleet(
+            Type='instant',
+            TargetCapacitySpecification={
+                'TotalTargetCapacity': cnt,
+                'DefaultTargetCapacityType': 'spot'
+            },
+            SpotOptions=spot_opts,
+            LaunchTemplateConfigs=[{
+                'LaunchTemplateSpecification': {
+                    'LaunchTemplateId': ltid,
+                    'Version': '$Latest'
+                },
+                'Overrides': overrides
+            }])
+    finally:
+        client.delete_launch_template(LaunchTemplateId=ltid)
+
+    ids = [iid for fi in res.get('Instances', []) for iid in fi['InstanceIds']]
+    for err in res.get('Errors', []):
+        warning("create_fleet - {}: {}".format(err.get('ErrorCode'),
+                                                err.get('ErrorMessage')))
+    if len(ids) < cnt:
+        warning("Only {} of {} spot instance(s) are launched.".
+                format(len(ids), cnt))
+    return ids
+
+
+def launch_instance(ec2, inst, tag_spec, user_data=None, placement=None):
+    """인스턴스 하나를 웜 풀에서 꺼내거나 새로 생성 요청.
+
+    Returns:
+        tuple: (인스턴스 ID, Private DNS 이름)
+    """
+    # 부트스트랩 스크립트는 첫 부팅에만 실행되고, 정지된 인스턴스의 배치는
+    # 바꿀 수 없기에 웜 풀을 쓰지 않음
+    if user_data is None and placement is None:
+        warm = claim_instances(ec2, inst, 1, tag_spec)
+        if len(warm) > 0:
+            return warm[0]['InstanceId'], warm[0].get('PrivateDnsName')
+    ins = create_ec2_instances(ec2, inst, 1, tag_spec, user_data=user_data,
+                               placement=placement)
+    return ins[0].instance_id, ins[0].private_dns_name
+
+
+def launch_workers(ec2, inst, cnt, tag_spec, spot=None, user_data=None,
+                   placement=None):
+    """워커 인스턴스 생성 요청. 스팟 설정이 있으면 EC2 Fleet 을 쓴다.
+
+    스팟이 아니고 부트스트랩이나 배치 설정이 없으면 웜 풀의 인스턴스를 먼저
+    쓴다.
+
+    Returns:
+        list: 생성된 인스턴스 ID 리스트
+    """
+    if spot is not None:
+        return create_fleet_instances(ec2, inst, cnt, tag_spec, spot,
+                                      user_data, placement)
+    ids = []
+    if user_data is None and placement is None:
+        ids = [d['InstanceId'] for d in
+               claim_instances(ec2, inst, cnt, tag_spec)]
+    if len(ids) < cnt:
+        ins = create_ec2_instances(ec2, inst, cnt - len(ids), tag_spec,
+                                   user_data=user_data, placement=placement)
+        ids += [wrk.instance_id for wrk in ins]
+    return ids
+
+
 def get_type_instance_info(pobj, only_inst=None):
-    """인스턴스 종류별 공통 정보."""
+    """인스턴스 종류별 공통 정보.
+
+    Args:
+        pobj (bilbo.profile.Instance): 인스턴스 프로파일
+        only_inst (dict): 단일 인스턴스일 때 DescribeInstances 결과의 인스턴스
+    """
     info = {}
     info['image_id'] = pobj.ami
     info['key_name'] = pobj.keyname
     info['ssh_user'] = pobj.ssh_user
     info['ssh_private_key'] = pobj.ssh_private_key
     info['ec2type'] = pobj.ec2type
+    info['vol_size'] = pobj.volsize
 
     if only_inst is not None:
-        info['instance_id'] = only_inst.instance_id
-        info['public_ip'] = only_inst.public_ip_address
-        info['private_ip'] = only_inst.private_ip_address
-        info['private_dns_name'] = only_inst.private_dns_name
-        if only_inst.tags is not None:
-            info['tags'] = only_inst.tags
+        info.update(_instance_desc_info(only_inst))
+        if only_inst.get('Tags') is not None:
+            info['tags'] = only_inst['Tags']
     return info
 
 
+def _instance_desc_info(desc):
+    """DescribeInstances 결과의 인스턴스에서 접속 정보 얻기."""
+    return {
+        'instance_id': desc['InstanceId'],
+        'public_ip': desc.get('PublicIpAddress'),
+        'private_ip': desc.get('PrivateIpAddress'),
+        'private_dns_name': desc.get('PrivateDnsName')
+    }
+
+
+def wait_instances_running(ec2, instance_ids, retry_count=120):
+    """인스턴스들이 모두 running 상태가 될 때까지 기다림.
+
+    `bilbo.aio.wait_instances_running` 을 실행한다.
+
+    Args:
+        ec2: boto EC2 resource
+        instance_ids (list): 기다릴 인스턴스 ID 리스트
+        retry_count (int): 최대 조회 수
+
+    Returns:
+        dict: 인스턴스 ID 별 DescribeInstances 결과
+
+    Raises:
+        RuntimeError: 인스턴스가 시작되지 못하고 종료될 때
+        TimeoutError: 재시도 수가 넘을 때
+    """
+    from bilbo import aio
+    return aio.run(aio.wait_instances_running(ec2.meta.client, instance_ids,
+                                              retry_count))
+
+
+def describe_running(client, ids):
+    """인스턴스들을 한 번 조회해 running 인 것들의 결과를 얻음.
+
+    Returns:
+        dict: running 인 인스턴스 ID 별 DescribeInstances 결과
+
+    Raises:
+        RuntimeError: 인스턴스가 시작되지 못하고 종료될 때
+    """
+    import botocore
+
+    try:
+        res = client.describe_instances(InstanceIds=ids)
+    except botocore.exceptions.ClientError as e:
+        # 생성 직후에는 아직 조회되지 않을 수 있음
+        if 'InvalidInstanceID.NotFound' not in str(e):
+            raise e
+        return {}
+    descs = {}
+    for rsv in res['Reservations']:
+        for ins in rsv['Instances']:
+            iid = ins['InstanceId']
+            state = ins['State']['Name']
+            if state == 'running':
+                descs[iid] = ins
+            elif state != 'pending':
+                raise RuntimeError("Instance '{}' is {}.".format(iid, state))
+    return descs
+
+
 def create_dask_cluster(clname, pobj, ec2, clinfo):
-    """Dask 클러스터 생성.
+    """Dask 클러스터 인스턴스 생성 요청.
+
+    인스턴스가 running 상태가 되는 것은 기다리지 않는다. 기다린 후에는
+    `set_dask_instance_info` 로 접속 정보를 채운다.
 
     Args:
         clname (str): 클러스터 이름. 이미 존재하면 에러
         pobj (bilbo.profile.Profile): 프로파일 정보
         ec2 (botocore.client.EC2): boto EC2 client
+
+    Returns:
+        dict: 역할별 생성된 인스턴스 ID 리스트
     """
     critical("Create dask cluster '{}'.".format(clname))
 
@@ -104,60 +372,105 @@ def create_dask_cluster(clname, pobj, ec2, clinfo):
 
     clinfo['type'] = 'dask'
 
+    # 스케쥴러와 워커를 같은 배치 그룹 / 서브넷에
+    placement = pobj.placement
+    if placement is not None:
+        if 'group' in placement:
+            ensure_placement_group(ec2.meta.client, placement['group'],
+                                   placement['strategy'])
+        # 스케일 아웃에서도 같은 배치를 쓰도록 기록
+        clinfo['placement'] = placement
+
     # create scheduler
     scd_name = pobj.scd_inst.get_name(clname)
     scd_tag_spec = _build_tag_spec(scd_name, pobj.desc, pobj.scd_inst.tags)
-    ins = create_ec2_instances(ec2, pobj.scd_inst, 1, scd_tag_spec)
-    scd = ins[0]
-    clinfo['instances'].append(scd.instance_id)
+    user_data = None
+    if pobj.bootstrap:
+        user_data = render_scheduler_user_data(pobj)
+    scd_id, scd_dns = launch_instance(ec2, pobj.scd_inst, scd_tag_spec,
+                                      user_data, placement)
+    clinfo['instances'].append(scd_id)
     clinfo['launch_time'] = datetime.datetime.now()
+    # Private DNS 는 생성 직후에도 알 수 있음 (워커/노트북 부트스트랩에 필요)
+    clinfo['scheduler'] = {'instance_id': scd_id,
+                           'private_dns_name': scd_dns}
+
+    # 워커 그룹별로 생성
+    winfos = []
+    wids = []
+    for grp in pobj.wrk_groups:
+        inst = grp.inst
+        winfo = get_type_instance_info(inst)
+        winfo['count'] = grp.count
+        # 프로파일에서 지정된 thread/proc 수
+        winfo['nthread'] = grp.nthread
+        winfo['nproc'] = grp.nproc
+        winfo['instances'] = []
+        winfos.append(winfo)
+        # 인스턴스 타입 카탈로그로 부팅 전에 워커 옵션 결정
+        if grp.spot is not None:
+            # 타입이 섞이기에 타입별로 정함
+            winfo['spot'] = grp.spot
+            set_spot_worker_sizing(winfo, ec2.meta.client)
+            sizing = None
+        else:
+            sizing = set_worker_sizing(winfo, ec2.meta.client)
+
+        wrk_name = inst.get_name(clname)
+        wrk_tag_spec = _build_tag_spec(wrk_name, pobj.desc, inst.tags)
+        # 스케일 아웃에서 같은 사양으로 생성할 수 있게 기록
+        winfo['launch'] = {'instance': inst.to_config(), 'name': wrk_name,
+                           'description': pobj.desc}
+        if pobj.bootstrap:
+            user_data = render_worker_user_data(grp, scd_dns, sizing)
+        gids = launch_workers(ec2, inst, grp.count, wrk_tag_spec, grp.spot,
+                              user_data, placement)
+        clinfo['instances'] += gids
+        wids.append(gids)
+    # 여러 그룹이면 리스트로 기록
+    clinfo['worker'] = winfos if pobj.wrk_multi else winfos[0]
+
+    return {'scheduler': [scd_id], 'worker': wids}
+
+
+def set_dask_instance_info(pobj, clinfo, launched, descs):
+    """running 상태가 된 Dask 인스턴스들의 정보를 클러스터 정보에 기록."""
+    scd_id = launched['scheduler'][0]
+    clinfo['scheduler'] = get_type_instance_info(pobj.scd_inst, descs[scd_id])
+
+    for grp, winfo, gids in zip(pobj.wrk_groups, worker_groups(clinfo),
+                                launched['worker']):
+        for wid in gids:
+            winfo['instances'].append(_worker_desc_info(winfo, descs[wid]))
+
+        # 카탈로그에서 얻지 못한 경우에만 lscpu 로 요청.
+        if 'cpu_info' not in winfo and 'spot' not in winfo and \
+                len(winfo['instances']) > 0:
+            # 그룹 첫 번째 워커의 ip
+            wip = _get_ip(winfo['instances'][0], pobj.private_command)
+            winfo['cpu_info'] = get_cpu_info(grp.inst, wip)
+
+
+def _worker_desc_info(winfo, desc):
+    """워커 인스턴스의 접속 정보. 스팟 워커는 실제 인스턴스 타입도 기록."""
+    wrk = _instance_desc_info(desc)
+    if 'spot' in winfo:
+        wrk['ec2type'] = desc.get('InstanceType')
+        wrk['spot'] = True
+    return wrk
+
+
+def worker_groups(clinfo):
+    """클러스터 정보의 워커 그룹 리스트 (단일 그룹도 리스트로)."""
+    winfo = clinfo['worker']
+    return winfo if type(winfo) is list else [winfo]
 
-    # create workers
-    wrk_name = pobj.wrk_inst.get_name(clname)
-    wrk_tag_spec = _build_tag_spec(wrk_name, pobj.desc, pobj.wrk_inst.tags)
-    ins = create_ec2_instances(ec2, pobj.wrk_inst, pobj.wrk_cnt, wrk_tag_spec)
-    inst = pobj.wrk_inst
-    winfo = get_type_instance_info(inst)
-    winfo['count'] = pobj.wrk_cnt
-    # 프로파일에서 지정된 thread/proc 수
-    winfo['nthread'] = pobj.wrk_nthread
-    winfo['nproc'] = pobj.wrk_nproc
-    winfo['instances'] = []
-    clinfo['worker'] = winfo
-    for wrk in ins:
-        clinfo['instances'].append(wrk.instance_id)
-
-    # 사용 가능 상태까지 기다린 후 추가 정보 얻기.
-    info("Wait for instance to be running.")
-    scd.wait_until_running()
-    scd.load()
-
-    inst = pobj.scd_inst
-    sinfo = get_type_instance_info(inst, scd)
-    clinfo['scheduler'] = sinfo
-
-    for wrk in ins:
-        wrk.wait_until_running()
-        wrk.load()
-        wi = {}
-        wi['instance_id'] = wrk.instance_id
-        wi['public_ip'] = wrk.public_ip_address
-        wi['private_ip'] = wrk.private_ip_address
-        wi['private_dns_name'] = wrk.private_dns_name
-        winfo['instances'].append(wi)
-
-    # ec2 생성 후 반환값의 `ncpu_options` 가 잘못오고 있어 여기서 요청.
-    if len(ins) > 0:
-        # 첫 번째 워커의 ip
-        wip = _get_ip(winfo['instances'][0], pobj.private_command)
-        winfo['cpu_info'] = get_cpu_info(pobj, wip)
-
-
-def get_cpu_info(pobj, ip):
+
+def get_cpu_info(inst, ip):
     """생성된 인스턴스에서 lscpu 명령으로 CPU 정보 얻기."""
     info("get_cpu_info")
-    user = pobj.wrk_inst.ssh_user
-    private_key = pobj.wrk_inst.ssh_private_key
+    user = inst.ssh_user
+    private_key = inst.ssh_private_key
     # Cores
     cmd = "lscpu | grep -e ^CPU\(s\): | awk '{print $2}'"
     res, _ = send_instance_cmd(user, private_key, ip, cmd)
@@ -171,43 +484,30 @@ def get_cpu_info(pobj, ip):
 
 
 def save_cluster_info(clname, clinfo):
-    """클러스터 정보파일 쓰기."""
-    def json_default(value):
-        if isinstance(value, datetime.date):
-            return value.strftime('%Y-%m-%d %H:%M:%S')
-        raise TypeError('not JSON serializable')
-
+    """클러스터 정보를 저장소에 쓰기."""
     warning("save_cluster_info: '{}'".format(clname))
     clinfo['ready_time'] = datetime.datetime.now()
-
-    path = os.path.join(clust_dir, clname + '.json')
-    with open(path, 'wt') as f:
-        body = json.dumps(clinfo, default=json_default, indent=4,
-                          sort_keys=True, ensure_ascii=False)
-        f.write(body)
+    store.put_cluster(clname, clinfo)
 
 
 def load_cluster_info(clname):
-    """클러스터 정보파일 읽기."""
+    """클러스터 정보를 저장소에서 읽기."""
     warning("load_cluster_info: '{}'".format(clname))
-    path = os.path.join(clust_dir, clname + '.json')
-    with open(path, 'rt') as f:
-        body = f.read()
-        clinfo = json.loads(body)
+    clinfo = store.get_cluster(clname)
+    if clinfo is None:
+        raise FileNotFoundError("Cluster '{}' does not exist.".format(clname))
     return clinfo
 
 
-def wait_until_connect(url, retry_count=10):
-    """URL 접속이 가능할 때까지 기다림."""
-    info("wait_until_connect: {}".format(url))
-    for i in range(retry_count):
-        try:
-            urlopen(url, timeout=5)
-            return
-        except URLError:
-            info("Can not connect to dashboard. Wait for a while.")
-            time.sleep(TRY_SLEEP)
-    raise ConnectionError()
+def wait_until_connect(url, retry_count=None):
+    """URL 접속이 가능할 때까지 기다림 (`bilbo.aio.wait_until_connect`).
+
+    Args:
+        url (str): 접속할 URL
+        retry_count (int): 최대 시도 수. None 이면 재시도 정책의 제한 시간까지
+    """
+    from bilbo import aio
+    aio.run(aio.wait_until_connect(url, retry_count))
 
 
 def get_root_dm(ec2, inst):
@@ -224,29 +524,54 @@ def get_root_dm(ec2, inst):
 
 
 def create_notebook(clname, pobj, ec2, clinfo):
-    """노트북 생성."""
+    """노트북 인스턴스 생성 요청.
+
+    Returns:
+        dict: 역할별 생성된 인스턴스 ID 리스트
+    """
     critical("Create notebook.")
     nb_name = pobj.nb_inst.get_name(clname)
     nb_tag_spec = _build_tag_spec(nb_name, pobj.desc, pobj.nb_inst.tags)
-    ins = create_ec2_instances(ec2, pobj.nb_inst, 1, nb_tag_spec)
+    user_data = None
+    if pobj.bootstrap:
+        user_data = render_notebook_user_data(pobj, clinfo)
+    ins = create_ec2_instances(ec2, pobj.nb_inst, 1, nb_tag_spec,
+                               user_data=user_data)
     nb = ins[0]
-    info("Wait for notebook instance to be running.")
-    nb.wait_until_running()
-    nb.load()
     clinfo['instances'].append(nb.instance_id)
-    ninfo = get_type_instance_info(pobj.nb_inst, nb)
-    clinfo['notebook'] = ninfo
+    return {'notebook': [nb.instance_id]}
+
+
+def set_notebook_instance_info(pobj, clinfo, launched, descs):
+    """running 상태가 된 노트북 인스턴스의 정보를 클러스터 정보에 기록."""
+    nb_id = launched['notebook'][0]
+    clinfo['notebook'] = get_type_instance_info(pobj.nb_inst, descs[nb_id])
 
 
 def check_dup_cluster(clname):
     """클러스터 이름이 겹치는지 검사."""
-    path = os.path.join(clust_dir, clname + '.json')
-    if os.path.isfile(path):
+    if store.cluster_exists(clname):
         raise NameError("Cluster '{}' already exist.".format(clname))
 
 
 def create_cluster(profile, clname, params):
-    """클러스터 생성."""
+    """클러스터 생성 (`bilbo.aio.create_cluster`).
+
+    Returns:
+        tuple: (프로파일 객체, 클러스터 정보)
+    """
+    from bilbo import aio
+    return aio.run(aio.create_cluster(profile, clname, params))
+
+
+def launch_cluster(profile, clname, params):
+    """클러스터 인스턴스들의 생성 요청까지. running 을 기다리지 않는다.
+
+    Returns:
+        tuple: (프로파일 객체, 클러스터 정보, 역할별 생성된 인스턴스 ID)
+    """
+    import boto3
+
     critical("Create cluster '{}'.".format(clname))
 
     if clname is None:
@@ -254,17 +579,26 @@ def create_cluster(profile, clname, params):
 
     check_dup_cluster(clname)
 
-    pcfg = read_profile(profile, params)
-    ec2 = boto3.resource('ec2')
-
     # 클러스터 생성
     clinfo = {'name': clname, 'instances': []}
+    with timing_span(clinfo, 'profile'):
+        pcfg = read_profile(profile, params)
+    ec2 = boto3.resource('ec2')
+    # 재시도 정책은 재시작 등에서도 쓰도록 클러스터 정보에 기록
+    clinfo['retry'] = set_retry_policy(pcfg.get('retry')).to_config()
+    if 'ssh_idle_ttl' in pcfg:
+        clinfo['ssh_idle_ttl'] = pcfg['ssh_idle_ttl']
+    ssh_pool.set_idle_ttl(clinfo.get('ssh_idle_ttl'))
+
+    # 역할별 생성 요청된 인스턴스 ID
+    launched = {}
 
     # 다스크 프로파일
     if 'dask' in pcfg:
         pobj = DaskProfile(pcfg)
         pobj.validate()
-        create_dask_cluster(clname, pobj, ec2, clinfo)
+        with timing_span(clinfo, 'launch.dask'):
+            launched.update(create_dask_cluster(clname, pobj, ec2, clinfo))
     # 공통 프로파일 (테스트용)
     else:
         pobj = Profile(pcfg)
@@ -276,20 +610,39 @@ def create_cluster(profile, clname, params):
     if 'webbrowser' in pcfg:
         clinfo['webbrowser'] = pcfg['webbrowser']
     clinfo['private_command'] = pcfg.get('private_command', False)
+    if 'dask' in pcfg and pobj.autoscale is not None:
+        clinfo['autoscale'] = pobj.autoscale
+    if pobj.bootstrap:
+        clinfo['bootstrap'] = True
 
-    # 노트북 생성
+    # 노트북 생성 (Dask 인스턴스를 기다리지 않고 바로 요청)
     if 'notebook' in pcfg:
-        create_notebook(clname, pobj, ec2, clinfo)
+        with timing_span(clinfo, 'launch.notebook'):
+            launched.update(create_notebook(clname, pobj, ec2, clinfo))
+
+    return pobj, clinfo, launched
+
+
+def set_cluster_instance_info(pobj, clinfo, launched, descs):
+    """running 상태가 된 인스턴스들의 정보를 클러스터 정보에 기록."""
+    if 'scheduler' in launched:
+        set_dask_instance_info(pobj, clinfo, launched, descs)
+    if 'notebook' in launched:
+        set_notebook_instance_info(pobj, clinfo, launched, descs)
 
-    return pobj, clinfo
+
+def start_notebook_and_cluster(pobj, clinfo):
+    """생성된 클러스터의 노트북과 클러스터를 동시에 시작.
+
+    `bilbo.aio.start_notebook_and_cluster` 를 실행한다.
+    """
+    from bilbo import aio
+    aio.run(aio.start_notebook_and_cluster(pobj, clinfo))
 
 
 def show_all_cluster():
     """모든 클러스터를 표시."""
-    for clname in iter_clusters():
-        clinfo = load_cluster_info(clname)
-        name = clinfo['name']
-        desc = clinfo.get('description')
+    for name, desc in store.iter_cluster_summary():
         if desc is not None:
             msg = '{} : {}'.format(name, desc)
         else:
@@ -298,10 +651,13 @@ def show_all_cluster():
 
 
 def check_cluster(clname):
-    """프로파일을 확인.
+    """클러스터를 확인하고 정보를 읽음.
 
     Args:
         clname (str): 클러스터명 (.json 확장자 제외)
+
+    Returns:
+        dict: 클러스터 정보
     """
     if clname.lower().endswith('.json'):
         rname = '.'.join(clname.split('.')[0:-1])
@@ -309,25 +665,32 @@ def check_cluster(clname):
               format(clname, rname)
         raise NameError(msg)
 
-    # file existence
-    path = os.path.join(clust_dir, clname + '.json')
-    if not os.path.isfile(path):
-        error("Cluster '{}' does not exist.".format(path))
-        raise(FileNotFoundError(path))
+    # existence
+    clinfo = store.get_cluster(clname)
+    if clinfo is None:
+        error("Cluster '{}' does not exist.".format(clname))
+        raise(FileNotFoundError(clname))
+
+    set_retry_policy(clinfo.get('retry'))
+    ssh_pool.set_idle_ttl(clinfo.get('ssh_idle_ttl'))
+    return clinfo
 
-    return path
 
+def show_cluster(clname, detail=False, timing=False):
+    """클러스터 정보를 표시.
 
-def show_cluster(clname, detail=False):
-    """클러스터 정보를 표시."""
-    path = check_cluster(clname)
+    Args:
+        clname (str): 클러스터명
+        detail (bool): 기록된 정보 전체를 표시
+        timing (bool): 생성 단계별 소요 시간을 표시
+    """
+    info = check_cluster(clname)
     if detail:
-        with open(path, 'rt') as f:
-            body = f.read()
-            print(body)
+        print(store.dump_cluster_info(info))
+        return
+    if timing:
+        show_cluster_timing(info)
         return
-
-    info = load_cluster_info(clname)
 
     print()
     print("Cluster Name: {}".format(info['name']))
@@ -351,6 +714,19 @@ def show_cluster(clname, detail=False):
     print()
 
 
+def show_cluster_timing(clinfo):
+    """클러스터 생성 단계별 소요 시간 표시."""
+    print()
+    print("Cluster Name: {}".format(clinfo['name']))
+    print()
+    if 'timing' not in clinfo:
+        print("There is no timing information.")
+    else:
+        for line in format_timing(clinfo['timing']):
+            print(line)
+    print()
+
+
 def show_instance(idx, inst):
     print("  [{}] instance_id: {}, public_ip: {}, private_ip: {}".
           format(idx, inst['instance_id'], inst['public_ip'],
@@ -366,11 +742,21 @@ def show_dask_cluster(idx, info):
     idx = show_instance(idx, scd)
     print("       {}".format(_get_dask_scheduler_address(info)))
 
-    print()
-    print("Workers:")
-    winfo = info['worker']
-    for wrk in winfo['instances']:
-        idx = show_instance(idx, wrk)
+    for winfo in worker_groups(info):
+        print()
+        if 'spot' in winfo:
+            print("Spot Workers ({}):".
+                  format(', '.join(winfo['spot']['ec2types'])))
+        else:
+            print("Workers ({}):".format(winfo['ec2type']))
+        for wrk in winfo['instances']:
+            idx = show_instance(idx, wrk)
+
+    if 'placement' in info:
+        plc = info['placement']
+        print()
+        print("Placement: {}".format(', '.join(
+            "{}={}".format(k, plc[k]) for k in sorted(plc))))
 
 
 def check_git_modified(clinfo):
@@ -429,10 +815,13 @@ def check_git_modified(clinfo):
     return True
 
 
-def destroy_cluster(clname, force):
-    """클러스터 제거."""
-    check_cluster(clname)
-    info = load_cluster_info(clname)
+def destroy_cluster(clname, force, keep_warm=False):
+    """클러스터 제거.
+
+    Args:
+        keep_warm (bool): 인스턴스를 종료하지 않고 정지해 웜 풀에 넣음
+    """
+    info = check_cluster(clname)
 
     if 'git_cloned_dir' in info and not force:
         if not check_git_modified(info):
@@ -441,22 +830,237 @@ def destroy_cluster(clname, force):
 
     critical("Destroy cluster '{}'.".format(clname))
     # 인스턴스 제거
+    import boto3
     ec2 = boto3.client('ec2')
     instances = info['instances']
+    if keep_warm and len(instances) > 0:
+        # 작업 파일이 남는 노트북은 넣지 않음
+        sizes = _dask_vol_sizes(info)
+        instances = [iid for iid in instances if iid not in sizes] + \
+            park_instances(ec2, sorted(sizes), sizes)
     if len(instances) > 0:
-        ec2.terminate_instances(InstanceIds=info['instances'])
+        ec2.terminate_instances(InstanceIds=instances)
+
+    # 클러스터 정보 제거
+    store.delete_cluster(clname)
+
+
+def _dask_vol_sizes(clinfo):
+    """Dask 스케쥴러와 워커 인스턴스 ID 별 프로파일의 볼륨 크기."""
+    sizes = {}
+    if 'instance_id' in clinfo.get('scheduler', {}):
+        scd = clinfo['scheduler']
+        sizes[scd['instance_id']] = scd.get('vol_size')
+    if 'worker' in clinfo:
+        for winfo in worker_groups(clinfo):
+            for wrk in winfo['instances']:
+                sizes[wrk['instance_id']] = winfo.get('vol_size')
+    return sizes
 
-    # 클러스터 파일 제거
-    path = os.path.join(clust_dir, clname + '.json')
-    os.unlink(path)
+
+_key_cache = {}
+_key_lock = threading.Lock()
+
+
+def load_private_key(ssh_private_key):
+    """SSH Private Key 를 읽어 캐쉬.
+
+    같은 키 파일은 프로세스 내에서 한 번만 파싱한다 (파일이 바뀌면 다시 읽음).
+    """
+    import paramiko
+
+    key_path = expanduser(ssh_private_key)
+    mtime = os.path.getmtime(key_path)
+    with _key_lock:
+        cached = _key_cache.get(key_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        key = paramiko.RSAKey.from_private_key_file(key_path)
+        _key_cache[key_path] = (mtime, key)
+    return key
+
+
+class SSHPool:
+    """(유저, 키, IP) 별로 SSH 연결을 재사용하는 풀.
+
+    하나의 Transport 위에 명령마다 새 채널을 열기에, 핸드쉐이크는 호스트당 한
+    번만 일어난다. 연결은 프로세스 종료시 또는 유휴 유지 시간이 지나면 닫힌다.
+    열린 채널(실행 중인 명령, SFTP)이 있는 연결은 유휴로 보지 않는다.
+    """
+
+    def __init__(self, idle_ttl=None):
+        """초기화.
+
+        Args:
+            idle_ttl (float): 유휴 연결 유지 시간(초). None 이면 계속 유지
+        """
+        self.set_idle_ttl(idle_ttl)
+        self._conns = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        # 연결 재시도 수와 재시도 대기 시간(초) 누적
+        self.connect_retries = 0
+        self.connect_wait = 0.0
+
+    def _host_lock(self, key):
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def _expired(self, last_used):
+        return self.idle_ttl is not None and \
+            time.time() - last_used > self.idle_ttl
+
+    @staticmethod
+    def _is_alive(client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    @staticmethod
+    def _in_use(client):
+        """열린 채널이 있는가? 닫힌 채널은 Transport 에서 빠진다."""
+        transport = client.get_transport()
+        return transport is not None and len(transport._channels) > 0
+
+    def set_idle_ttl(self, idle_ttl):
+        """유휴 연결 유지 시간(초)을 지정. None 이면 계속 유지."""
+        self.idle_ttl = float(idle_ttl) if idle_ttl is not None else None
+
+    def _sleep(self, delay):
+        """재시도 대기 (대기 통계 누적)."""
+        time.sleep(delay)
+        self.record_wait(delay)
+
+    def record_wait(self, delay):
+        """연결 재시도 대기 통계 누적."""
+        with self._lock:
+            self.connect_retries += 1
+            self.connect_wait += delay
+
+    def _connect(self, ssh_user, ssh_private_key, ip, retry_count):
+        import paramiko
+
+        key = load_private_key(ssh_private_key)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        policy = get_retry_policy()
+        for i in policy.attempts(retry_count, self._sleep):
+            try:
+                client.connect(hostname=ip, username=ssh_user, pkey=key)
+            except (paramiko.ssh_exception.NoValidConnectionsError,
+                    TimeoutError, socket.timeout):
+                warning("Connection failed to '{}'. Retry after a while.".
+                        format(ip))
+            else:
+                client.get_transport().set_keepalive(SSH_KEEPALIVE)
+                return client
+
+    def get(self, ssh_user, ssh_private_key, ip, retry_count=None):
+        """호스트의 SSH 연결을 얻음. 없거나 끊어졌으면 새로 연결.
+
+        연결 재시도 간격과 제한 시간은 `get_retry_policy()` 를 따른다.
+
+        Returns:
+            paramiko.SSHClient: 연결된 클라이언트. 연결 실패시 None
+        """
+        self.expire_idle()
+        key = (ssh_user, ssh_private_key, ip)
+        with self._host_lock(key):
+            conn = self._conns.get(key)
+            if conn is not None:
+                client = conn[0]
+                if self._is_alive(client):
+                    conn[1] = time.time()
+                    return client
+                info("SSHPool: drop dead connection to '{}'".format(ip))
+                client.close()
+                del self._conns[key]
+
+            client = self._connect(ssh_user, ssh_private_key, ip,
+                                   retry_count)
+            if client is not None:
+                self._conns[key] = [client, time.time()]
+            return client
+
+    def discard(self, ssh_user, ssh_private_key, ip):
+        """호스트의 연결을 닫고 풀에서 제거."""
+        key = (ssh_user, ssh_private_key, ip)
+        with self._host_lock(key):
+            conn = self._conns.pop(key, None)
+            if conn is not None:
+                conn[0].close()
+
+    def expire_idle(self):
+        """유휴 유지 시간이 지난 연결들을 닫음.
+
+        채널이 열려 있는 연결은 사용 중이기에 닫지 않고 사용 시간을 갱신한다.
+        """
+        if self.idle_ttl is None:
+            return
+        with self._lock:
+            expired = [key for key, conn in self._conns.items()
+                       if self._expired(conn[1])]
+        for key in expired:
+            with self._host_lock(key):
+                conn = self._conns.get(key)
+                if conn is None or not self._expired(conn[1]):
+                    continue
+                if self._in_use(conn[0]):
+                    conn[1] = time.time()
+                    continue
+                info("SSHPool: close idle connection to '{}'".format(key[2]))
+                conn[0].close()
+                del self._conns[key]
+
+    def close_all(self):
+        """모든 연결을 닫음."""
+        with self._lock:
+            keys = list(self._conns.keys())
+        for key in keys:
+            self.discard(*key)
+
+
+ssh_pool = SSHPool()
+atexit.register(ssh_pool.close_all)
+
+
+def _exec_pooled(ssh_user, ssh_private_key, ip, cmd, get_pty=False,
+                 retry_count=None, timeout=None):
+    """풀의 연결에 새 채널을 열어 명령 실행.
+
+    Returns:
+        tuple: (stdin, stdout, stderr). 연결 실패시 None
+    """
+    import paramiko
+
+    client = ssh_pool.get(ssh_user, ssh_private_key, ip, retry_count)
+    if client is None:
+        error("Connection failed to '{}'".format(ip))
+        return
+
+    try:
+        return client.exec_command(cmd, get_pty=get_pty, timeout=timeout)
+    except paramiko.SSHException:
+        # 풀에 있던 연결이 끊어졌으면 한 번 다시 연결
+        warning("Reconnect to '{}'.".format(ip))
+        ssh_pool.discard(ssh_user, ssh_private_key, ip)
+        client = ssh_pool.get(ssh_user, ssh_private_key, ip, retry_count)
+        if client is None:
+            error("Connection failed to '{}'".format(ip))
+            return
+        return client.exec_command(cmd, get_pty=get_pty, timeout=timeout)
 
 
 def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
-                      show_stdout=False, show_stderr=True, retry_count=10):
+                      show_stdout=False, show_stderr=True, retry_count=None):
     """인스턴스에 SSH 명령어 실행
 
     https://stackoverflow.com/questions/42645196/how-to-ssh-and-run-commands-in-ec2-using-boto3
 
+    연결은 `ssh_pool` 에서 얻어 재사용한다.
+
     Args:
         ssh_user (str): SSH 유저
         ssh_private_key (str): SSH Private Key 경로
@@ -464,7 +1068,8 @@ def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
         cmd (list): 커맨드 문자열 리스트
         show_stdout (bool): 표준 출력 메시지 출력 여부
         show_stderr (bool): 에러 메시지 출력 여부
-        retry_count (int): 재시도 횟수
+        retry_count (int): 최대 연결 시도 수. None 이면 재시도 정책의 제한
+            시간까지
 
     Returns:
         tuple: send_command 함수의 결과 (stdout, stderr)
@@ -472,29 +1077,12 @@ def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
     info('send_instance_cmd - user: {}, key: {}, ip {}, cmd {}'
          .format(ssh_user, ssh_private_key, ip, cmd))
 
-    key_path = expanduser(ssh_private_key)
-
-    key = paramiko.RSAKey.from_private_key_file(key_path)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    connected = False
-    for i in range(retry_count):
-        try:
-            client.connect(hostname=ip, username=ssh_user, pkey=key)
-        except (paramiko.ssh_exception.NoValidConnectionsError, TimeoutError):
-            warning("Connection failed to '{}'. Retry after a while.".
-                    format(ip))
-            time.sleep(TRY_SLEEP)
-        else:
-            connected = True
-            break
-
-    if not connected:
-        error("Connection failed to '{}'".format(ip))
+    chans = _exec_pooled(ssh_user, ssh_private_key, ip, cmd, show_stdout,
+                         retry_count)
+    if chans is None:
         return
+    stdin, stdout, stderr = chans
 
-    stdin, stdout, stderr = client.exec_command(cmd, get_pty=show_stdout)
     if show_stdout:
         stdouts = []
         for line in iter(stdout.readline, ""):
@@ -506,33 +1094,306 @@ def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
     if show_stderr and len(err) > 0:
         error(err.decode('utf-8'))
 
-    client.close()
-
     return stdouts, err
 
 
+class HostResult:
+    """호스트 하나의 명령 실행 결과."""
+
+    def __init__(self, ip, stdout=None, stderr=b'', exit_code=None,
+                 error=None):
+        self.ip = ip
+        self.stdout = stdout if stdout is not None else []
+        self.stderr = stderr
+        self.exit_code = exit_code
+        self.error = error
+
+    @property
+    def ok(self):
+        """정상 종료 여부."""
+        return self.error is None and self.exit_code == 0
+
+    def __repr__(self):
+        return "<HostResult {} exit_code={} error={}>".\
+            format(self.ip, self.exit_code, self.error)
+
+
+class FanoutResult:
+    """여러 호스트의 명령 실행 결과 모음 (IP 별)."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def __getitem__(self, ip):
+        return self.results[ip]
+
+    def __iter__(self):
+        return iter(self.results.values())
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def ok(self):
+        """모든 호스트가 정상 종료했는가?"""
+        return all(res.ok for res in self)
+
+    def failed(self):
+        """실패한 호스트의 결과 리스트."""
+        return [res for res in self if not res.ok]
+
+    def log_failures(self, what):
+        """실패한 호스트들을 에러 로그로 남김."""
+        for res in self.failed():
+            if res.error is not None:
+                reason = res.error
+            else:
+                reason = "exit code {}".format(res.exit_code)
+                if len(res.stderr) > 0:
+                    reason += ": {}".format(res.stderr.decode('utf-8').strip())
+            error("{} failed on '{}' - {}".format(what, res.ip, reason))
+
+
+def exec_instance_cmd(ssh_user, ssh_private_key, ip, cmd, timeout=None,
+                      retry_count=None):
+    """인스턴스에 SSH 명령을 실행하고 종료 코드까지 포함한 결과를 얻음.
+
+    Args:
+        timeout (float): 명령 출력을 기다리는 제한 시간(초)
+
+    Returns:
+        HostResult: 실행 결과
+    """
+    import paramiko
+
+    info('exec_instance_cmd - ip {}, cmd {}'.format(ip, cmd))
+    try:
+        chans = _exec_pooled(ssh_user, ssh_private_key, ip, cmd,
+                             retry_count=retry_count, timeout=timeout)
+        if chans is None:
+            return HostResult(ip, error="connection failed")
+        _, stdout, stderr = chans
+        stdouts = stdout.readlines()
+        err = stderr.read()
+        exit_code = stdout.channel.recv_exit_status()
+    except socket.timeout:
+        return HostResult(ip, error="timeout")
+    except (paramiko.SSHException, OSError) as e:
+        return HostResult(ip, error=str(e))
+    return HostResult(ip, stdouts, err, exit_code)
+
+
+def fanout_cmd(hosts, cmd, concurrency=FANOUT_CONCURRENCY,
+               timeout=FANOUT_TIMEOUT, on_result=None):
+    """여러 호스트에 동시에 명령 실행 (`bilbo.aio.fanout`).
+
+    Args:
+        hosts (list): (ssh_user, ssh_private_key, ip) 튜플 리스트
+        cmd: 명령 문자열 또는 IP 를 받아 명령 문자열을 돌려주는 함수
+        concurrency (int): 최대 동시 실행 수
+        timeout (float): 호스트당 제한 시간(초)
+        on_result: 호스트의 결과가 나올 때마다 HostResult 로 부를 함수
+
+    Returns:
+        FanoutResult: 호스트별 실행 결과
+    """
+    from bilbo import aio
+    return aio.run(aio.fanout(hosts, cmd, concurrency, timeout, on_result))
+
+
+def fanout_call(hosts, func, concurrency=FANOUT_CONCURRENCY, on_result=None):
+    """여러 호스트에 대해 동시에 함수 실행.
+
+    Args:
+        hosts (list): (ssh_user, ssh_private_key, ip) 튜플 리스트
+        func: 호스트 튜플을 받아 HostResult 를 돌려주는 함수
+        concurrency (int): 최대 동시 실행 수
+        on_result: 호스트의 결과가 나올 때마다 HostResult 로 부를 함수
+
+    Returns:
+        FanoutResult: 호스트별 실행 결과
+    """
+    results = {}
+    if len(hosts) == 0:
+        return FanoutResult(results)
+
+    nworker = max(1, min(concurrency, len(hosts)))
+    with ThreadPoolExecutor(max_workers=nworker) as pool:
+        futures = {pool.submit(func, host): host[2] for host in hosts}
+        for fut in as_completed(futures):
+            ip = futures[fut]
+            try:
+                results[ip] = fut.result()
+            except Exception as e:
+                results[ip] = HostResult(ip, error=str(e))
+            if on_result is not None:
+                on_result(results[ip])
+    return FanoutResult(results)
+
+
+def _host(cfg, private_command):
+    """인스턴스 정보에서 fanout_cmd 용 호스트 튜플 얻기."""
+    return cfg['ssh_user'], cfg['ssh_private_key'], \
+        _get_ip(cfg, private_command)
+
+
+def _worker_hosts(clinfo, winfo=None):
+    """클러스터 정보에서 모든 (또는 한 그룹) 워커의 호스트 튜플 얻기."""
+    pc = clinfo['private_command']
+    winfos = worker_groups(clinfo) if winfo is None else [winfo]
+    return [(wi['ssh_user'], wi['ssh_private_key'], _get_ip(wrk, pc))
+            for wi in winfos for wrk in wi['instances']]
+
+
 def find_cluster_instance_by_public_ip(cluster, public_ip):
-    """Public IP로 클러스터 인스턴스 정보 찾기."""
-    clpath = check_cluster(cluster)
+    """Public IP로 클러스터 인스턴스 정보 찾기.
 
-    with open(clpath, 'rt') as f:
-        body = f.read()
-        clinfo = json.loads(body)
+    저장소의 인스턴스 인덱스에서 찾기에 클러스터 정보 전체를 읽지 않는다.
 
-    if 'notebook' in clinfo:
-        if clinfo['notebook']['public_ip'] == public_ip:
-            return clinfo['notebook']
+    Returns:
+        dict: instance_id, role, public_ip, private_ip, ssh_user,
+            ssh_private_key. 없으면 None
+    """
+    if not store.cluster_exists(cluster):
+        error("Cluster '{}' does not exist.".format(cluster))
+        raise(FileNotFoundError(cluster))
+    return store.find_instance(cluster=cluster, public_ip=public_ip)
 
-    if clinfo['type'] == 'dask':
-        scd = clinfo['scheduler']
-        if scd['public_ip'] == public_ip:
-            return scd
-        winfo = clinfo['worker']
-        for wrk in winfo['instances']:
-            if wrk['public_ip'] == public_ip:
-                return wrk
-    else:
-        raise NotImplementedError()
+
+def cluster_hosts(clinfo, role=None):
+    """클러스터 인스턴스들의 역할과 호스트 튜플.
+
+    Args:
+        role (str): notebook, scheduler, worker 중 하나. 없으면 모두
+
+    Returns:
+        list: (역할, (ssh_user, ssh_private_key, ip)) 리스트
+    """
+    pc = clinfo['private_command']
+    hosts = []
+    if role in (None, 'notebook') and 'notebook' in clinfo:
+        hosts.append(('notebook', _host(clinfo['notebook'], pc)))
+    if clinfo.get('type') == 'dask':
+        if role in (None, 'scheduler'):
+            hosts.append(('scheduler', _host(clinfo['scheduler'], pc)))
+        if role in (None, 'worker'):
+            hosts += [('worker', host) for host in _worker_hosts(clinfo)]
+    return hosts
+
+
+def _result_status(hres):
+    """HostResult 의 상태 문자열."""
+    if hres.error is not None:
+        return "error: {}".format(hres.error)
+    return "exit {}".format(hres.exit_code)
+
+
+def _result_lines(hres):
+    """HostResult 의 표준 출력과 (표시가 붙은) 에러 출력 줄들."""
+    lines = [line.rstrip('\n') for line in hres.stdout]
+    if len(hres.stderr) > 0:
+        lines += ["stderr: {}".format(line) for line in
+                  hres.stderr.decode('utf-8', 'replace').splitlines()]
+    return lines
+
+
+def group_results(res):
+    """같은 상태와 출력을 낸 호스트끼리 묶음.
+
+    Returns:
+        list: (상태, 출력 줄 리스트, IP 리스트) 를 호스트가 많은 순으로
+    """
+    groups = {}
+    for hres in res:
+        key = (_result_status(hres), tuple(_result_lines(hres)))
+        groups.setdefault(key, []).append(hres.ip)
+    return sorted([(status, list(lines), sorted(ips))
+                   for (status, lines), ips in groups.items()],
+                  key=lambda g: (-len(g[2]), g[0]))
+
+
+def broadcast_cmd(clname, cmd, role=None, stream=False):
+    """클러스터 인스턴스들에 동시에 명령을 보내고 결과를 요약해 표시.
+
+    기본으로는 같은 결과를 낸 호스트끼리 묶어서 보여준다. stream 이면 각
+    호스트의 결과가 나오는 대로 IP 를 붙여 보여준다.
+
+    Args:
+        clname (str): 클러스터명
+        cmd (str): 명령
+        role (str): notebook, scheduler, worker 중 하나. 없으면 모두
+        stream (bool): 결과가 나오는 대로 표시
+
+    Returns:
+        bool: 모든 호스트에서 성공했으면 True
+    """
+    clinfo = check_cluster(clname)
+    targets = cluster_hosts(clinfo, role)
+    if len(targets) == 0:
+        print("No instance to run command.")
+        return True
+    roles = {host[2]: r for r, host in targets}
+
+    def _show(hres):
+        prefix = "{} {}".format(roles[hres.ip], hres.ip)
+        for line in _result_lines(hres):
+            print("{} | {}".format(prefix, line))
+        if not hres.ok:
+            print("{} | ({})".format(prefix, _result_status(hres)))
+
+    res = fanout_cmd([host for _, host in targets], cmd,
+                     on_result=_show if stream else None)
+    groups = group_results(res)
+    if not stream:
+        for status, lines, ips in groups:
+            print("==> {} host(s), {}: {}".format(len(ips), status,
+                                                  ', '.join(ips)))
+            for line in lines:
+                print(line)
+            print()
+
+    # 상태별 호스트 수
+    counts = {}
+    for status, _, ips in groups:
+        counts[status] = counts.get(status, 0) + len(ips)
+    print("{} host(s): {}".format(len(res), ', '.join(
+        "{} {}".format(cnt, status) for status, cnt in sorted(counts.items()))))
+    return res.ok
+
+
+def set_worker_sizing(winfo, client=None):
+    """인스턴스 타입 카탈로그로 워커 옵션을 정해 워커 정보에 기록.
+
+    Returns:
+        tuple: (nproc, nthread, memory). 카탈로그에 없는 타입이면 None
+    """
+    hw = get_instance_type(winfo['ec2type'], client)
+    if hw is None:
+        return None
+    winfo['cpu_info'] = {'CoreCount': hw['vcpus'],
+                         'ThreadsPerCore': hw['threads_per_core']}
+    nproc, nthread, memory = dask_worker_options(winfo, usable_memory(hw))
+    winfo['nproc'] = nproc
+    winfo['nthread'] = nthread
+    winfo['memory'] = memory
+    return nproc, nthread, memory
+
+
+def set_spot_worker_sizing(winfo, client=None):
+    """스팟 워커 그룹의 인스턴스 타입별 워커 옵션을 카탈로그로 정해 기록.
+
+    카탈로그에 없는 타입의 워커는 시작할 때 인스턴스에서 직접 구한다.
+    """
+    sizing = {}
+    hws = get_instance_types(winfo['spot']['ec2types'], client)
+    for ec2type, hw in hws.items():
+        cpu_info = {'CoreCount': hw['vcpus'],
+                    'ThreadsPerCore': hw['threads_per_core']}
+        opts = dask_worker_options(dict(winfo, cpu_info=cpu_info),
+                                   usable_memory(hw))
+        sizing[ec2type] = list(opts)
+    winfo['type_sizing'] = sizing
+    return sizing
 
 
 def dask_worker_options(winfo, memory):
@@ -543,13 +1404,15 @@ def dask_worker_options(winfo, memory):
     return nproc, nthread, memory // nproc
 
 
-def start_cluster(clinfo):
-    """클러스터 마스터 & 워커를 시작."""
-    assert 'type' in clinfo
-    if clinfo['type'] == 'dask':
-        start_dask_cluster(clinfo)
-    else:
-        raise NotImplementedError()
+def start_cluster(clinfo, bootstrapped=False):
+    """클러스터 마스터 & 워커를 시작 (`bilbo.aio.start_cluster`).
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        bootstrapped (bool): 생성시 cloud-init 으로 이미 시작된 경우 True
+    """
+    from bilbo import aio
+    aio.run(aio.start_cluster(clinfo, bootstrapped))
 
 
 def git_clone_cmd(repo, user, passwd, workdir):
@@ -561,8 +1424,8 @@ def git_clone_cmd(repo, user, passwd, workdir):
     return cmd
 
 
-def setup_aws_creds(user, private_key, ip):
-    """AWS 크레덴셜 설치."""
+def _aws_creds_cmd():
+    """AWS 크레덴셜 설치 명령 구성 (서브쉘에서 실행)."""
     cmds = [
         'mkdir -p ~/.aws',
         'cd ~/.aws',
@@ -578,8 +1441,7 @@ def setup_aws_creds(user, private_key, ip):
     cmd = 'echo "region = {}" >> config'.format(dr)
     cmds.append(cmd)
 
-    cmd = '; '.join(cmds)
-    send_instance_cmd(user, private_key, ip, cmd)
+    return '({})'.format('; '.join(cmds))
 
 
 def _get_dask_scheduler_address(clinfo):
@@ -592,76 +1454,32 @@ def _get_ip(cfg, private_command):
     return cfg['private_ip'] if private_command else cfg['public_ip']
 
 
-def start_notebook(pobj, clinfo, retry_count=10):
-    """노트북 시작.
+def start_notebook(pobj, clinfo, bootstrapped=False, retry_count=None):
+    """노트북 시작 (`bilbo.aio.start_notebook`).
 
     Args:
         clinfo (dict): 클러스터 생성 정보
-        retry_count (int): 접속 URL 얻기 재시도 수. 기본 10
+        bootstrapped (bool): 생성시 cloud-init 으로 이미 설정된 경우 True
+        retry_count (int): 접속 URL 얻기 최대 시도 수. None 이면 재시도
+            정책의 제한 시간까지
 
     Raises:
         TimeoutError: 재시도 수가 넘을 때
-
     """
-    critical("Start notebook.")
-
-    ncfg = clinfo['notebook']
-    user, private_key = ncfg['ssh_user'], ncfg['ssh_private_key']
-    ip = _get_ip(ncfg, pobj.private_command)
-
-    # AWS 크레덴셜 설치
-    setup_aws_creds(user, private_key, ip)
-
-    # 작업 폴더
-    nb_workdir = pobj.nb_workdir or NB_WORKDIR
-    cmd = "mkdir -p {}".format(nb_workdir)
-    send_instance_cmd(user, private_key, ip, cmd)
+    from bilbo import aio
+    aio.run(aio.start_notebook(pobj, clinfo, bootstrapped, retry_count))
 
-    # git 설정이 있으면 설정
-    if pobj.nb_git is not None:
-        setup_git(pobj, user, private_key, ip, nb_workdir, clinfo)
 
-    # 클러스터 타입별 노트북 설정
-    vars = ''
-    if 'type' in clinfo:
-        if clinfo['type'] == 'dask':
-            # dask-labextension을 위한 대쉬보드 URL
-            sip = clinfo['scheduler']['public_ip']
-            cmd = "mkdir -p ~/.jupyter/lab/user-settings/dask-labextension; "
-            cmd += 'echo \'{{ "defaultURL": "http://{}:8787" }}\' > ' \
-                   '~/.jupyter/lab/user-settings/dask-labextension/' \
-                   'plugin.jupyterlab-settings'.format(sip)
-            send_instance_cmd(user, private_key, ip, cmd)
-            # 스케쥴러 주소
-            vars = _get_dask_scheduler_address(clinfo)
-        else:
-            raise NotImplementedError()
-
-    # Jupyter 시작
-    ncmd = "cd {} && {} jupyter lab --ip 0.0.0.0".format(nb_workdir, vars)
-    cmd = "screen -S bilbo -d -m bash -c '{}'".format(ncmd)
-    send_instance_cmd(user, private_key, ip, cmd)
-
-    # 접속 URL 얻기
-    cmd = "jupyter notebook list | awk '{print $1}'"
-    for i in range(retry_count):
-        stdouts, _ = send_instance_cmd(user, private_key, ip, cmd)
-        # url을 얻었으면 기록
-        if len(stdouts) > 1:
-            url = stdouts[1].strip().replace('0.0.0.0', ncfg['public_ip'])
-            clinfo['notebook_url'] = url
-            return
-        info("Can not fetch notebook list. Wait for a while.")
-        time.sleep(TRY_SLEEP)
-    raise TimeoutError("Can not get notebook url.")
+def _git_setup_cmds(pobj, nb_workdir):
+    """Git 설정 및 클론 명령 구성.
 
-
-def setup_git(pobj, user, private_key, ip, nb_workdir, clinfo):
-    """Git 설정 및 클론."""
+    Returns:
+        tuple: (명령 리스트, 클론될 디렉토리 리스트)
+    """
     # config
     cmd = "git config --global user.name '{}'; ".format(pobj.nb_git.user)
     cmd += "git config --global user.email '{}'".format(pobj.nb_git.email)
-    send_instance_cmd(user, private_key, ip, cmd)
+    cmds = [cmd]
 
     # 클론 (작업 디렉토리에)
     gobj = pobj.nb_git
@@ -671,31 +1489,159 @@ def setup_git(pobj, user, private_key, ip, nb_workdir, clinfo):
     repos = [grepo] if type(grepo) is str else grepo
     cdirs = []
     for repo in repos:
-        cmd = git_clone_cmd(repo, guser, gpasswd, nb_workdir)
-        send_instance_cmd(user, private_key, ip, cmd, show_stderr=False)
+        cmds.append(git_clone_cmd(repo, guser, gpasswd, nb_workdir))
         gcdir = repo.split('/')[-1].replace('.git', '')
         cdirs.append("{}/{}".format(nb_workdir, gcdir))
-    clinfo['git_cloned_dir'] = cdirs
+    return cmds, cdirs
 
 
-def start_dask_cluster(clinfo):
-    """Dask 클러스터 마스터/워커를 시작."""
-    critical("Start dask scheduler & workers.")
-    private_command = clinfo['private_command']
+def _labext_cmd(sip):
+    """dask-labextension 을 위한 대쉬보드 URL 설정 명령."""
+    cmd = "mkdir -p ~/.jupyter/lab/user-settings/dask-labextension; "
+    cmd += 'echo \'{{ "defaultURL": "http://{}:8787" }}\' > ' \
+           '~/.jupyter/lab/user-settings/dask-labextension/' \
+           'plugin.jupyterlab-settings'.format(sip)
+    return cmd
 
-    # 스케쥴러 시작
-    scd = clinfo['scheduler']
-    user, private_key = scd['ssh_user'], scd['ssh_private_key']
-    sip = _get_ip(scd, private_command)
-    scd_dns = scd['private_dns_name']
-    cmd = "screen -S bilbo -d -m dask-scheduler"
-    send_instance_cmd(user, private_key, sip, cmd)
 
-    # AWS 크레덴셜 설치
-    setup_aws_creds(user, private_key, sip)
+def remote_log_path(role):
+    """역할(notebook, scheduler, worker)별 원격 로그 파일 경로."""
+    return "{}/{}.log".format(REMOTE_LOG_DIR, role)
 
-    winfo = clinfo['worker']
-    # 워커 실행 옵션
+
+def _screen_cmd(cmd, role):
+    """명령을 screen 세션에서 실행하며 출력을 역할의 로그 파일에 덧붙임.
+
+    명령은 원격 쉘에서 변수가 확장된 후 screen 안의 bash 로 전달된다.
+    """
+    return 'mkdir -p {}; screen -S bilbo -d -m bash -c "{} >> {} 2>&1"'.\
+        format(REMOTE_LOG_DIR, cmd, remote_log_path(role))
+
+
+def _jupyter_cmd(nb_workdir, vars):
+    """Jupyter 시작 명령."""
+    ncmd = "cd {} && {} jupyter lab --ip 0.0.0.0".format(nb_workdir, vars)
+    return _screen_cmd(ncmd, 'notebook')
+
+
+def _dask_scheduler_cmd():
+    """Dask 스케쥴러 시작 명령."""
+    return _screen_cmd("dask-scheduler", 'scheduler')
+
+
+def _dask_worker_cmd(scd_dns, nproc, nthread, memory):
+    """Dask 워커 시작 명령."""
+    opts = "--nprocs {} --nthreads {} --memory-limit {}".\
+        format(nproc, nthread, memory)
+    return _screen_cmd("dask-worker {}:8786 {}".format(scd_dns, opts),
+                       'worker')
+
+
+def _render_user_data(ssh_user, cmds):
+    """cloud-init 에서 SSH 유저로 명령들을 실행하는 스크립트 구성.
+
+    마지막에 완료 표시 파일을 만들어 `wait_bootstrap` 으로 확인할 수 있게 한다.
+    """
+    cmds = cmds + ['touch {}'.format(BOOTSTRAP_DONE)]
+    return "#!/bin/bash\nsudo -u {} -i bash <<'BILBO'\n{}\nBILBO\n".\
+        format(ssh_user, '\n'.join(cmds))
+
+
+def render_scheduler_user_data(pobj):
+    """Dask 스케쥴러 부트스트랩 스크립트."""
+    return _render_user_data(pobj.scd_inst.ssh_user, [_dask_scheduler_cmd()])
+
+
+def render_worker_user_data(grp, scd_dns, sizing=None):
+    """Dask 워커 그룹의 부트스트랩 스크립트.
+
+    Args:
+        grp (bilbo.profile.WorkerGroup): 워커 그룹 프로파일
+        scd_dns (str): 스케쥴러의 Private DNS
+        sizing (tuple): 카탈로그로 정한 (nproc, nthread, memory). 없으면
+            부팅된 인스턴스에서 구한다
+    """
+    cmds = _worker_sizing_cmds(sizing, grp.nproc, grp.nthread)
+    cmds.append(_dask_worker_cmd(scd_dns, '$NPROC', '$NTHREAD', '$MEMORY'))
+    return _render_user_data(grp.inst.ssh_user, cmds)
+
+
+def _worker_sizing_cmds(sizing, nproc=None, nthread=None):
+    """워커 옵션을 쉘 변수 NPROC, NTHREAD, MEMORY 로 지정하는 명령들.
+
+    Args:
+        sizing (tuple): 정해진 (nproc, nthread, memory). 없으면 인스턴스에서
+            구한다
+        nproc (int): 프로파일에서 지정된 프로세스 수
+        nthread (int): 프로파일에서 지정된 스레드 수
+    """
+    if sizing is not None:
+        nproc, nthread, memory = sizing
+    else:
+        nproc = nproc or \
+            "$(lscpu | grep -e ^CPU\\(s\\): | awk '{print $2}')"
+        nthread = nthread or \
+            "$(lscpu | grep Thread | awk '{print $4}')"
+        memory = "$(( $(free -b | grep 'Mem:' | awk '{print $2}') / NPROC ))"
+    return [
+        "NPROC={}".format(nproc),
+        "NTHREAD={}".format(nthread),
+        "MEMORY={}".format(memory)
+    ]
+
+
+def render_notebook_user_data(pobj, clinfo):
+    """노트북 부트스트랩 스크립트.
+
+    스케쥴러의 Public IP 가 필요한 dask-labextension 설정은 제외된다.
+    """
+    nb_workdir = pobj.nb_workdir or NB_WORKDIR
+    cmds = ["mkdir -p {}".format(nb_workdir)]
+    if pobj.nb_git is not None:
+        gcmds, cdirs = _git_setup_cmds(pobj, nb_workdir)
+        cmds += gcmds
+        clinfo['git_cloned_dir'] = cdirs
+
+    vars = ''
+    if clinfo.get('type') == 'dask':
+        vars = _get_dask_scheduler_address(clinfo)
+    cmds.append(_jupyter_cmd(nb_workdir, vars))
+    return _render_user_data(pobj.nb_inst.ssh_user, cmds)
+
+
+def _bootstrap_wait_cmd():
+    """완료 표시 파일을 기다린 후 AWS 크레덴셜을 설치하는 명령.
+
+    크레덴셜은 인스턴스 메타데이터로 누구나 읽을 수 있는 UserData 에 넣지
+    않고, 여기서 SSH 로 보낸다.
+    """
+    return "for i in $(seq {}); do test -f {} && break; sleep 1; done; " \
+           "test -f {} || exit 1; {}".format(BOOTSTRAP_WAIT, BOOTSTRAP_DONE,
+                                             BOOTSTRAP_DONE, _aws_creds_cmd())
+
+
+def wait_bootstrap(hosts, what):
+    """호스트들의 cloud-init 부트스트랩이 끝날 때까지 기다림.
+
+    `bilbo.aio.wait_bootstrap` 을 실행한다.
+    """
+    from bilbo import aio
+    aio.run(aio.wait_bootstrap(hosts, what))
+
+
+def _worker_sizing(winfo, private_command):
+    """워커 그룹의 실행 옵션.
+
+    생성시 카탈로그로 정해지지 않았으면 그룹 첫 워커의 메모리를 직접 확인해
+    정하고 기록한다.
+
+    Returns:
+        tuple: (nproc, nthread, memory)
+    """
+    if 'memory' in winfo:
+        return winfo['nproc'], winfo['nthread'], winfo['memory']
+
+    user, private_key = winfo['ssh_user'], winfo['ssh_private_key']
     wip = _get_ip(winfo['instances'][0], private_command)
     info("  Get worker memory from '{}'".format(wip))
     cmd = "free -b | grep 'Mem:' | awk '{print $2}'"
@@ -706,62 +1652,74 @@ def start_dask_cluster(clinfo):
     winfo['nproc'] = nproc
     winfo['nthread'] = nthread
     winfo['memory'] = memory
+    return nproc, nthread, memory
 
-    # 모든 워커들에 대해
-    user, private_key = winfo['ssh_user'], winfo['ssh_private_key']
-    for wrk in winfo['instances']:
-        wip = _get_ip(wrk, private_command)
-        # AWS 크레덴셜 설치
-        setup_aws_creds(user, private_key, wip)
 
-        # 워커 시작
-        opts = "--nprocs {} --nthreads {} --memory-limit {}".\
-            format(nproc, nthread, memory)
-        cmd = "screen -S bilbo -d -m dask-worker {}:8786 {}".\
-            format(scd_dns, opts)
-        warning("  Worker options: {}".format(opts))
-        send_instance_cmd(user, private_key, wip, cmd)
+def _worker_start_cmd(clinfo, winfo, ec2type=None):
+    """워커 그룹의 (AWS 크레덴셜 설치를 포함한) 워커 시작 명령.
 
-    # Dask 스케쥴러의 대쉬보드 기다림
-    dash_url = 'http://{}:8787'.format(sip)
-    clinfo['dask_dashboard_url'] = dash_url
-    critical("Wait for Dask dashboard ready.")
-    wait_until_connect(dash_url)
+    Args:
+        ec2type (str): 스팟 워커의 실제 인스턴스 타입
+    """
+    scd_dns = clinfo['scheduler']['private_dns_name']
+    if 'spot' in winfo:
+        # 타입별 옵션. 카탈로그에 없는 타입은 인스턴스에서 구함
+        sizing = winfo.get('type_sizing', {}).get(ec2type)
+        cmds = _worker_sizing_cmds(sizing, winfo['nproc'], winfo['nthread'])
+        cmds.append(_dask_worker_cmd(scd_dns, '$NPROC', '$NTHREAD',
+                                     '$MEMORY'))
+        wcmd = '; '.join(cmds)
+    else:
+        nproc, nthread, memory = _worker_sizing(winfo,
+                                                clinfo['private_command'])
+        wcmd = _dask_worker_cmd(scd_dns, nproc, nthread, memory)
+    warning("  Worker command ({}): {}".format(ec2type or winfo['ec2type'],
+                                               wcmd))
+    return "{}; {}".format(_aws_creds_cmd(), wcmd)
 
 
-def stop_cluster(clname):
-    """클러스터 마스터/워커를 중지.
+def _worker_start_cmds(clinfo, winfo, wrks=None):
+    """워커 IP 별 시작 명령. 같은 타입의 워커는 명령을 공유한다.
 
-    Returns:
-        dict: 클러스터 정보(재시작 용)
+    Args:
+        wrks (list): 대상 워커들. 없으면 그룹의 모든 워커
     """
-    clpath = check_cluster(clname)
+    pc = clinfo['private_command']
+    wrks = winfo['instances'] if wrks is None else wrks
+    by_type = {}
+    cmds = {}
+    for wrk in wrks:
+        ec2type = wrk.get('ec2type')
+        if ec2type not in by_type:
+            by_type[ec2type] = _worker_start_cmd(clinfo, winfo, ec2type)
+        cmds[_get_ip(wrk, pc)] = by_type[ec2type]
+    return cmds
 
-    with open(clpath, 'rt') as f:
-        body = f.read()
-        clinfo = json.loads(body)
-    private_command = clinfo['private_command']
 
-    if clinfo['type'] == 'dask':
-        critical("Stop dask scheduler & workers.")
-        # 스케쥴러 중지
-        scd = clinfo['scheduler']
-        user, private_key = scd['ssh_user'], scd['ssh_private_key']
-        sip = _get_ip(scd, private_command)
-        cmd = "screen -X -S 'bilbo' quit"
-        send_instance_cmd(user, private_key, sip, cmd)
-
-        worker = clinfo['worker']
-        user, private_key = worker['ssh_user'], worker['ssh_private_key']
-        for wrk in worker['instances']:
-            # 워커 중지
-            wip = _get_ip(wrk, private_command)
-            cmd = "screen -X -S 'bilbo' quit"
-            send_instance_cmd(user, private_key, wip, cmd)
-    else:
-        raise NotImplementedError()
+def start_dask_cluster(clinfo, bootstrapped=False):
+    """Dask 클러스터 마스터/워커를 시작 (`bilbo.aio.start_dask_cluster`).
 
-    return clinfo
+    Args:
+        clinfo (dict): 클러스터 정보
+        bootstrapped (bool): 생성시 cloud-init 으로 이미 시작된 경우 True
+    """
+    from bilbo import aio
+    aio.run(aio.start_dask_cluster(clinfo, bootstrapped))
+
+
+def stop_cluster(clname, drain=False, timeout=RETIRE_TIMEOUT):
+    """클러스터 마스터/워커를 중지 (`bilbo.aio.stop_cluster`).
+
+    Args:
+        clname (str): 클러스터명
+        drain (bool): 실행중인 태스크를 기다리고 워커를 은퇴시킨 후 중지
+        timeout (float): drain 의 제한 시간(초)
+
+    Returns:
+        dict: 클러스터 정보(재시작 용)
+    """
+    from bilbo import aio
+    return aio.run(aio.stop_cluster(clname, drain, timeout))
 
 
 def open_url(url, cldata):
@@ -779,8 +1737,7 @@ def open_url(url, cldata):
 
 def open_dashboard(clname, url_only):
     """클러스터의 대쉬보드 열기."""
-    check_cluster(clname)
-    clinfo = load_cluster_info(clname)
+    clinfo = check_cluster(clname)
 
     if clinfo['type'] == 'dask':
         scd = clinfo['scheduler']
@@ -796,8 +1753,7 @@ def open_dashboard(clname, url_only):
 
 def open_notebook(clname, url_only=False):
     """노트북 열기."""
-    check_cluster(clname)
-    clinfo = load_cluster_info(clname)
+    clinfo = check_cluster(clname)
 
     if 'notebook_url' in clinfo:
         url = clinfo['notebook_url']
@@ -809,53 +1765,6 @@ def open_notebook(clname, url_only=False):
         raise Exception("No notebook instance.")
 
 
-def stop_notebook_or_python(clname, path, params):
-    """실행한 노트북/파이썬 파일을 중단."""
-    info("stop_notebook_or_python: {} - {}".format(clname, path))
-    check_cluster(clname)
-    clinfo = load_cluster_info(clname)
-    private_command = clinfo['private_command']
-
-    if 'notebook' not in clinfo:
-        raise RuntimeError("No notebook instance.")
-
-    ncfg = clinfo['notebook']
-    user, private_key = ncfg['ssh_user'], ncfg['ssh_private_key']
-    ip = _get_ip(ncfg, private_command)
-
-    ext = path.split('.')[-1].lower()
-
-    dask_scd_addr = _get_dask_scheduler_address(clinfo)
-    # 노트북 파일
-    if ext == 'ipynb':
-        # Run by papermill
-        _cmd, _ = _get_run_notebook(path, params, [dask_scd_addr])
-        _cmd = _cmd.replace('papermill', '[p]apermill')
-    # 파이썬 파일
-    elif ext == 'py':
-        params = list(params)
-        params.insert(0, dask_scd_addr)
-        _cmd = _get_run_python(path, params)
-        _cmd = _cmd.replace('python', '[p]ython')
-    else:
-        raise RuntimeError("Unsupported file type: {}".format(path))
-
-    # 실행된 프로세스 찾기
-    cmd = "ps auxww | grep '{}' | awk '{{print $2}}' | head -n 1".format(_cmd)
-    res, _ = send_instance_cmd(user, private_key, ip, cmd, show_stdout=False,
-                               show_stderr=False)
-
-    # 프로세스가 있으면 삭제
-    if len(res) > 0:
-        proc = res[0].strip()
-        cmd = "pkill -P {}".format(proc)
-        info("Delete process: {}".format(cmd))
-        res, _ = send_instance_cmd(user, private_key, ip, cmd,
-                                   show_stderr=False)
-    else:
-        info("No process exists.")
-
-
 def _iter_run_param(params):
     for param in params:
         match = re.search(PARAM_PTRN, param)
@@ -865,13 +1774,18 @@ def _iter_run_param(params):
         yield key, value
 
 
-def _get_run_notebook(path, nb_params, cmd_params=None):
+def _get_run_notebook(path, nb_params, cmd_params=None, out_path=None,
+                      stdout_file=None):
     assert type(nb_params) in [list, tuple]
 
-    tname = next(tempfile._get_candidate_names())
-    tmp = '/tmp/{}'.format(tname)
-    elms = path.split('.')
-    out_path = '.'.join(elms[:-1]) + '.out.' + elms[-1]
+    if stdout_file is None:
+        tname = next(tempfile._get_candidate_names())
+        tmp = '/tmp/{}'.format(tname)
+    else:
+        tmp = stdout_file
+    if out_path is None:
+        elms = path.split('.')
+        out_path = '.'.join(elms[:-1]) + '.out.' + elms[-1]
     cmd = "cd {} && ".format(NB_WORKDIR)
 
     if cmd_params is not None:
@@ -900,48 +1814,353 @@ def _get_run_python(path, params):
     return cmd
 
 
-def run_notebook_or_python(clname, path, params):
-    """원격 노트북 인스턴스에서 노트북 또는 파이썬 파일 실행."""
-    info("run_notebook_or_python: {} - {}".format(clname, path))
+def run_on_scheduler(clinfo, code, timeout, what):
+    """스케쥴러 인스턴스에서 Dask 클라이언트 파이썬 코드 실행.
+
+    코드 앞에서 로컬 스케쥴러에 접속한 클라이언트 `c` 가 준비된다. 쉘의
+    큰따옴표로 감싸 보내기에 코드에는 큰따옴표를 쓰지 않는다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        code (str): 실행할 파이썬 코드
+        timeout (float): 제한 시간(초)
+        what (str): 실패시 로그에 남길 작업 이름
+
+    Returns:
+        HostResult: 실행 결과
+    """
+    assert '"' not in code
+    code = "from distributed import Client\n" \
+        "c = Client('tcp://localhost:8786', timeout=30)\n" + code
+    cmd = 'timeout {} python -c "{}"'.format(int(timeout), code)
+    scd = clinfo['scheduler']
+    sip = _get_ip(scd, clinfo['private_command'])
+    res = exec_instance_cmd(scd['ssh_user'], scd['ssh_private_key'], sip,
+                            cmd, timeout=timeout + 30)
+    if not res.ok:
+        FanoutResult({sip: res}).log_failures(what)
+    return res
+
+
+def _worker_ips(clinfo, winfo=None):
+    """모든 (또는 한 그룹) 워커의 Private IP 리스트."""
+    winfos = worker_groups(clinfo) if winfo is None else [winfo]
+    return [wrk['private_ip'] for wi in winfos for wrk in wi['instances']]
+
+
+RETIRE_PY = """
+ips = {ips!r}
+ws = [w for w, i in c.scheduler_info()['workers'].items() if i['host'] in ips]
+if ws:
+    c.retire_workers(workers=ws, close_workers=True)
+"""
+
+DRAIN_PY = """
+import time
+
+def busy(dask_scheduler):
+    s = dask_scheduler
+    return (sum(len(w.processing) for w in s.workers.values()) +
+            len(getattr(s, 'queued', ())) + len(getattr(s, 'unrunnable', ())))
+
+end = time.time() + {timeout}
+while c.run_on_scheduler(busy) > 0 and time.time() < end:
+    time.sleep(1)
+"""
+
+WAIT_WORKERS_PY = """
+import time
+ips = set({ips!r})
+end = time.time() + {timeout}
+while time.time() < end:
+    hosts = set(i['host'] for i in c.scheduler_info()['workers'].values())
+    if ips <= hosts:
+        break
+    time.sleep(1)
+else:
+    raise TimeoutError('workers did not join')
+"""
+
+
+def retire_workers(clinfo, ips, timeout=RETIRE_TIMEOUT):
+    """스케쥴러를 통해 워커들을 은퇴시킴.
+
+    은퇴하는 워커의 결과는 남는 워커들로 옮겨진 후 워커 프로세스가 닫힌다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        ips (list): 은퇴시킬 워커들의 Private IP 리스트
+        timeout (float): 제한 시간(초)
+
+    Returns:
+        bool: 성공 여부
+    """
+    if len(ips) == 0:
+        return True
+    critical("Retire {} worker host(s).".format(len(ips)))
+    code = RETIRE_PY.format(ips=sorted(ips))
+    return run_on_scheduler(clinfo, code, timeout, "Retire workers").ok
+
+
+def drain_cluster(clinfo, timeout=RETIRE_TIMEOUT):
+    """실행중인 태스크가 끝나기를 기다린 후 워커들을 은퇴시킴.
+
+    제한 시간이 지나면 남은 태스크가 있어도 은퇴로 넘어간다.
+
+    Returns:
+        bool: 성공 여부
+    """
+    critical("Drain dask workers (up to {} seconds).".format(timeout))
+    start = time.time()
+    res = run_on_scheduler(clinfo, DRAIN_PY.format(timeout=int(timeout)),
+                           timeout, "Drain workers")
+    left = max(30, timeout - (time.time() - start))
+    return retire_workers(clinfo, _worker_ips(clinfo), left) and res.ok
+
+
+def wait_workers(clinfo, ips, timeout=RETIRE_TIMEOUT):
+    """주어진 호스트들의 워커가 스케쥴러에 붙을 때까지 기다림.
 
-    check_cluster(clname)
-    clinfo = load_cluster_info(clname)
-    private_command = clinfo['private_command']
+    Returns:
+        bool: 제한 시간 안에 모두 붙었는가?
+    """
+    code = WAIT_WORKERS_PY.format(ips=sorted(ips), timeout=int(timeout))
+    return run_on_scheduler(clinfo, code, timeout, "Wait workers").ok
+
+
+def rolling_restart(clname, batch=1, timeout=RETIRE_TIMEOUT):
+    """스케쥴러를 유지한 채 워커들을 배치 단위로 재시작.
+
+    배치마다 워커를 은퇴시켜 결과를 다른 워커로 옮긴 후 재시작하고, 다시
+    스케쥴러에 붙기를 기다린 다음 배치로 넘어간다. 나머지 워커들은 계속
+    태스크를 처리한다.
+
+    Args:
+        clname (str): 클러스터명
+        batch (int): 한 번에 재시작할 워커 호스트 수
+        timeout (float): 배치당 은퇴와 합류 각각의 제한 시간(초)
 
-    if 'notebook' not in clinfo:
-        raise RuntimeError("No notebook instance.")
+    Returns:
+        dict: 클러스터 정보
+    """
+    clinfo = check_cluster(clname)
+    if clinfo.get('type') != 'dask':
+        raise NotImplementedError()
+    pc = clinfo['private_command']
+    critical("Rolling restart dask workers by {}.".format(batch))
+    for winfo in worker_groups(clinfo):
+        wcmds = _worker_start_cmds(clinfo, winfo)
+        wrks = winfo['instances']
+        for i in range(0, len(wrks), batch):
+            bwrks = wrks[i:i + batch]
+            ips = [wrk['private_ip'] for wrk in bwrks]
+            info("  restart workers {}".format(ips))
+            if not retire_workers(clinfo, ips, timeout):
+                warning("Can not retire workers gracefully. Restart anyway.")
+            hosts = [(winfo['ssh_user'], winfo['ssh_private_key'],
+                      _get_ip(wrk, pc)) for wrk in bwrks]
+            res = fanout_cmd(hosts, lambda ip: "screen -X -S 'bilbo' quit; "
+                             "{}".format(wcmds[ip]))
+            res.log_failures("Restart dask worker")
+            if not wait_workers(clinfo, ips, timeout):
+                raise TimeoutError("Restarted workers did not join: {}".
+                                   format(', '.join(ips)))
+    return clinfo
 
-    ncfg = clinfo['notebook']
-    user, private_key = ncfg['ssh_user'], ncfg['ssh_private_key']
-    nip = _get_ip(ncfg, private_command)
 
-    ext = path.split('.')[-1].lower()
+def _launch_config(winfo):
+    """워커 그룹의 생성 설정. 이전 버전에서 만든 클러스터에는 없음."""
+    if 'launch' not in winfo:
+        raise RuntimeError("The cluster was created by an older bilbo and "
+                           "can not be scaled. Re-create it.")
+    return winfo['launch']
 
-    dask_scd_addr = None
-    if 'scheduler' in clinfo:
-        dask_scd_addr = _get_dask_scheduler_address(clinfo)
+
+def scale_out(clinfo, winfo, cnt):
+    """워커 그룹에 워커를 추가하고 새 워커에서만 dask-worker 시작.
+
+    생성 요청 직후와 running 이 된 후에 클러스터 정보를 저장해, 도중에
+    실패해도 만들어진 인스턴스를 잃지 않는다.
+    """
+    import boto3
+
+    clname = clinfo['name']
+    launch = _launch_config(winfo)
+    critical("Add {} worker(s) to '{}'.".format(cnt, clname))
+    ec2 = boto3.resource('ec2')
+    inst = Instance(launch['instance'], 'worker')
+    tag_spec = _build_tag_spec(launch['name'], launch['description'],
+                               inst.tags)
+    user_data = None
+    bootstrapped = clinfo.get('bootstrap', False)
+    if bootstrapped:
+        grp = WorkerGroup(inst, {'nproc': winfo['nproc'],
+                                 'nthread': winfo['nthread']}, 'worker',
+                          None)
+        sizing = (winfo['nproc'], winfo['nthread'], winfo['memory']) \
+            if 'memory' in winfo and 'spot' not in winfo else None
+        user_data = render_worker_user_data(
+            grp, clinfo['scheduler']['private_dns_name'], sizing)
+
+    ids = launch_workers(ec2, inst, cnt, tag_spec, winfo.get('spot'),
+                         user_data, clinfo.get('placement'))
+    clinfo['instances'] += ids
+    store.put_cluster(clname, clinfo)
+    if len(ids) == 0:
+        return
+
+    descs = wait_instances_running(ec2, ids)
+    wrks = [_worker_desc_info(winfo, descs[iid]) for iid in ids]
+    winfo['instances'] += wrks
+    store.put_cluster(clname, clinfo)
+
+    pc = clinfo['private_command']
+    hosts = [(winfo['ssh_user'], winfo['ssh_private_key'], _get_ip(wrk, pc))
+             for wrk in wrks]
+    if bootstrapped:
+        wait_bootstrap(hosts, "Worker bootstrap")
     else:
-        for param in params:
-            if param.startswith('DASK_SCHEDULER_ADDRESS'):
-                dask_scd_addr = param
-    assert dask_scd_addr is not None, "No Dask scheduler address available."
-
-    # 노트북 파일
-    if ext == 'ipynb':
-        # Run by papermill
-        cmd, tmp = _get_run_notebook(path, params, [dask_scd_addr])
-        res, _ = send_instance_cmd(user, private_key, nip, cmd,
-                                   show_stdout=True, show_stderr=False)
-        cmd = 'cat {}'.format(tmp)
-        res, _ = send_instance_cmd(user, private_key, nip, cmd)
-    # 파이썬 파일
-    elif ext == 'py':
-        params = list(params)
-        params.insert(0, dask_scd_addr)
-        cmd = _get_run_python(path, params)
-        res, _ = send_instance_cmd(user, private_key, nip, cmd,
-                                   show_stdout=True)
+        res = fanout_cmd(hosts, _worker_start_cmds(clinfo, winfo, wrks).get)
+        res.log_failures("Start dask worker")
+
+
+def scale_in(clinfo, winfo, cnt, force=False):
+    """워커 그룹에서 마지막 워커들을 은퇴시킨 후 제거.
+
+    Args:
+        force (bool): 은퇴시키지 않고 바로 제거
+    """
+    critical("Remove {} worker(s) from '{}'.".format(cnt, clinfo['name']))
+    remove_workers(clinfo, winfo, winfo['instances'][-cnt:], not force)
+
+
+def remove_workers(clinfo, winfo, wrks, retire=True,
+                   timeout=RETIRE_TIMEOUT):
+    """워커 그룹에서 주어진 워커들을 (은퇴시킨 후) 제거.
+
+    Args:
+        wrks (list): 제거할 워커 인스턴스 정보 리스트
+        retire (bool): 제거 전에 스케쥴러를 통해 은퇴시킴
+        timeout (float): 은퇴 제한 시간(초)
+    """
+    import boto3
+
+    if retire:
+        ips = [wrk['private_ip'] for wrk in wrks]
+        if not retire_workers(clinfo, ips, timeout):
+            warning("Can not retire workers gracefully. Terminate anyway.")
+
+    pc = clinfo['private_command']
+    for wrk in wrks:
+        ssh_pool.discard(winfo['ssh_user'], winfo['ssh_private_key'],
+                         _get_ip(wrk, pc))
+    ids = [wrk['instance_id'] for wrk in wrks]
+    boto3.client('ec2').terminate_instances(InstanceIds=ids)
+    winfo['instances'] = [wrk for wrk in winfo['instances']
+                          if wrk['instance_id'] not in ids]
+    clinfo['instances'] = [iid for iid in clinfo['instances']
+                           if iid not in ids]
+    store.put_cluster(clinfo['name'], clinfo)
+
+
+def scale_cluster(clname, count, group=0, force=False):
+    """Dask 워커 그룹의 워커 수를 바꿈.
+
+    늘어난 만큼만 생성해 시작하고, 줄어든 만큼만 은퇴시켜 제거한다. 스케쥴러와
+    노트북, 나머지 워커는 그대로 유지된다.
+
+    Args:
+        clname (str): 클러스터명
+        count (int): 그룹의 목표 워커 수
+        group (int): 워커 그룹 인덱스 (0 부터)
+        force (bool): 줄일 때 은퇴시키지 않고 바로 제거
+
+    Returns:
+        dict: 클러스터 정보
+    """
+    clinfo = check_cluster(clname)
+    if clinfo.get('type') != 'dask':
+        raise RuntimeError("Cluster '{}' is not a dask cluster.".
+                           format(clname))
+    winfos = worker_groups(clinfo)
+    if not 0 <= group < len(winfos):
+        raise IndexError("There is no worker group {} in '{}'.".
+                         format(group, clname))
+    if count < 0:
+        raise ValueError("Worker count can not be negative.")
+
+    winfo = winfos[group]
+    cur = len(winfo['instances'])
+    if count > cur:
+        scale_out(clinfo, winfo, count - cur)
+    elif count < cur:
+        scale_in(clinfo, winfo, cur - count, force)
     else:
-        raise RuntimeError("Unsupported file type: {}".format(path))
+        print("Cluster '{}' already has {} worker(s).".format(clname, cur))
+    # 용량 부족 등으로 목표에 못 미칠 수 있기에 실제 워커 수를 기록
+    winfo['count'] = len(winfo['instances'])
+    if winfo['count'] != count:
+        warning("Worker group {} has {} worker(s) instead of {}.".
+                format(group, winfo['count'], count))
+    store.put_cluster(clname, clinfo)
+    return clinfo
 
-    return res
+
+def find_spot_interruptions(clinfo):
+    """중단 알림을 받은 스팟 워커들 찾기.
+
+    스팟 워커들의 인스턴스 메타데이터를 동시에 확인한다.
+
+    Returns:
+        list: (워커 그룹 정보, 워커 인스턴스 정보) 튜플 리스트
+    """
+    pc = clinfo['private_command']
+    spots = [(winfo, wrk) for winfo in worker_groups(clinfo)
+             if 'spot' in winfo for wrk in winfo['instances']]
+    if len(spots) == 0:
+        return []
+    hosts = [(winfo['ssh_user'], winfo['ssh_private_key'], _get_ip(wrk, pc))
+             for winfo, wrk in spots]
+    res = fanout_cmd(hosts, SPOT_NOTICE_CMD, timeout=30)
+    doomed = []
+    for (winfo, wrk), host in zip(spots, hosts):
+        hres = res[host[2]]
+        if hres.ok and len(''.join(hres.stdout).strip()) > 0:
+            warning("Spot interruption notice on '{}': {}".
+                    format(wrk['instance_id'], ''.join(hres.stdout).strip()))
+            doomed.append((winfo, wrk))
+    return doomed
+
+
+def replace_interrupted_workers(clname):
+    """중단 알림을 받은 스팟 워커를 은퇴시키고 대체 워커를 띄움.
+
+    은퇴는 종료 전까지 끝나도록 짧은 제한 시간으로 한다.
+
+    Returns:
+        int: 대체된 워커 수
+    """
+    clinfo = check_cluster(clname)
+    doomed = find_spot_interruptions(clinfo)
+    if len(doomed) == 0:
+        return 0
+    critical("Replace {} interrupted spot worker(s).".format(len(doomed)))
+    for winfo in worker_groups(clinfo):
+        wrks = [wrk for wi, wrk in doomed if wi is winfo]
+        if len(wrks) == 0:
+            continue
+        remove_workers(clinfo, winfo, wrks, True, SPOT_RETIRE_TIMEOUT)
+        scale_out(clinfo, winfo, len(wrks))
+    return len(doomed)
+
+
+def watch_spot(clname, interval=5, once=False):
+    """스팟 중단 알림을 주기적으로 확인해 워커를 대체. Ctrl-C 로 멈춘다."""
+    critical("Watch spot interruptions of '{}'.".format(clname))
+    while True:
+        cnt = replace_interrupted_workers(clname)
+        if cnt > 0:
+            print("{} spot worker(s) replaced.".format(cnt))
+        if once:
+            return cnt
+        time.sleep(interval)
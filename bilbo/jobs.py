@@ -0,0 +1,368 @@
+"""원격 작업 모듈.
+
+노트북 인스턴스에서 노트북이나 파이썬 파일을 SSH 세션과 분리된 작업으로
+실행한다. 작업마다 노트북 인스턴스의 `~/.bilbo_jobs/<작업 ID>/` 에 명령, PID,
+시작 시간, 출력 로그, 종료 코드가 기록되고 로컬 저장소에도 같은 작업이
+기록된다. 클라이언트 연결이 끊어져도 작업은 계속되며, 상태 확인은 원격 명령
+하나로 작업 기록들을 읽는다.
+
+작업은 새 세션(프로세스 그룹)으로 시작되기에, 중지는 PID 로 그룹 전체에
+시그널을 보낸다.
+"""
+import math
+import shlex
+import secrets
+import datetime
+
+from bilbo import store
+from bilbo.util import info, critical
+
+# 원격 홈 아래 작업 기록 폴더
+JOB_DIR = '.bilbo_jobs'
+LOG_LINES = 20
+# 작업 기다리기 제한 시간에 더해 줄 SSH 읽기 여유 시간(초)
+WAIT_MARGIN = 30
+# 작업 기다리기 제한 시간이 지났을 때 `job wait` 의 종료 코드
+WAIT_TIMEOUT_EXIT = 124
+
+
+def job_dir(job_id):
+    """원격 쉘에서 쓸 작업 기록 폴더 경로."""
+    return '"$HOME"/{}/{}'.format(JOB_DIR, job_id)
+
+
+def new_job_id():
+    """시작 시간과 임의의 접미어로 된 작업 ID."""
+    return "{}-{}".format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'),
+                          secrets.token_hex(2))
+
+
+def run_cmd(clinfo, path, params, stdout_file=None):
+    """노트북 또는 파이썬 파일 실행 명령.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        path (str): 작업 폴더 기준 노트북 또는 파이썬 파일 경로
+        params (list): `키=값` 파라미터 리스트
+        stdout_file (str): 노트북 셀 출력을 받을 파일
+    """
+    from bilbo.cluster import _get_run_notebook, _get_run_python, \
+        _get_dask_scheduler_address
+
+    params = list(params)
+    dask_scd_addr = None
+    if 'scheduler' in clinfo:
+        dask_scd_addr = _get_dask_scheduler_address(clinfo)
+    else:
+        for param in params:
+            if param.startswith('DASK_SCHEDULER_ADDRESS'):
+                dask_scd_addr = param
+    assert dask_scd_addr is not None, "No Dask scheduler address available."
+
+    ext = path.split('.')[-1].lower()
+    if ext == 'ipynb':
+        # Run by papermill
+        cmd, _ = _get_run_notebook(path, params, [dask_scd_addr],
+                                   stdout_file=stdout_file)
+    elif ext == 'py':
+        cmd = _get_run_python(path, [dask_scd_addr] + params)
+    else:
+        raise RuntimeError("Unsupported file type: {}".format(path))
+    return cmd
+
+
+def session_cmd(cmd, pid_file, redirect='< /dev/null'):
+    """명령을 새 세션(프로세스 그룹)으로 백그라운드에서 시작하고 PID 를
+    pid_file 에 기록하는 명령. `kill_group_cmd` 로 그룹 전체를 중지할 수 있다.
+
+    Args:
+        redirect (str): 시작할 명령의 입출력 재지정
+    """
+    return "setsid nohup bash -c {} {} & echo $! > {}".format(
+        shlex.quote(cmd), redirect, pid_file)
+
+
+def kill_group_cmd(pid_file):
+    """pid_file 에 기록된 프로세스 그룹 전체에 TERM 시그널을 보내는 명령."""
+    return 'kill -TERM -- -"$(cat {})" 2>/dev/null'.format(pid_file)
+
+
+def submit_cmd(job_id, cmd):
+    """명령을 분리된 새 세션으로 시작하고 기록을 남긴 후 PID 를 출력하는 명령.
+
+    명령의 출력은 `out.log` 로, 끝나면 종료 코드는 `exit_code` 로 기록된다.
+    """
+    d = job_dir(job_id)
+    inner = "( {} ) > {d}/out.log 2>&1; echo $? > {d}/exit_code".format(
+        cmd, d=d)
+    return "mkdir -p {d} && printf '%s\\n' {cmd} > {d}/cmd && " \
+        "date '+%Y-%m-%d %H:%M:%S' > {d}/started && " \
+        "{{ {session}; }} && cat {d}/pid".format(
+            d=d, cmd=shlex.quote(cmd),
+            session=session_cmd(inner, d + '/pid',
+                                '> /dev/null 2>&1 < /dev/null'))
+
+
+def status_cmd(job_id=None):
+    """작업(없으면 모든 작업)의 ID, PID, 시작 시간, 상태를 탭으로 출력하는 명령.
+
+    상태는 `exit <종료 코드>`, `killed`, `running`, `lost`(기록 없이 사라짐) 중
+    하나다.
+    """
+    pattern = shlex.quote(job_id) if job_id is not None else '*'
+    return 'cd "$HOME"/{} 2>/dev/null || exit 0; for j in {}; do ' \
+        '[ -d "$j" ] || continue; pid=$(cat "$j/pid" 2>/dev/null); ' \
+        'if [ -f "$j/exit_code" ]; then s="exit $(cat "$j/exit_code")"; ' \
+        'elif [ -f "$j/killed" ]; then s=killed; ' \
+        'elif [ -n "$pid" ] && kill -0 "$pid" 2>/dev/null; then s=running; ' \
+        'else s=lost; fi; ' \
+        'printf "%s\\t%s\\t%s\\t%s\\n" "$j" "$pid" ' \
+        '"$(cat "$j/started" 2>/dev/null)" "$s"; done'.format(JOB_DIR,
+                                                              pattern)
+
+
+def wait_cmd(job_id, timeout=None):
+    """작업이 끝날 때까지 원격에서 기다린 후 `status_cmd` 를 출력하는 명령.
+
+    Args:
+        timeout (float): 제한 시간(초). 지나면 작업이 끝나지 않았어도 기다리기를
+            멈추고, 출력되는 상태는 running
+    """
+    d = job_dir(job_id)
+    cond = '[ ! -f {d}/exit_code ] && [ ! -f {d}/killed ] && ' \
+        'kill -0 "$(cat {d}/pid)" 2>/dev/null'.format(d=d)
+    deadline = ''
+    if timeout is not None:
+        deadline = 'end=$(($(date +%s) + {})); '.format(math.ceil(timeout))
+        cond += ' && [ "$(date +%s)" -lt "$end" ]'
+    return '{}while {}; do sleep 1; done; {}'.format(deadline, cond,
+                                                     status_cmd(job_id))
+
+
+def kill_cmd(job_id):
+    """작업의 프로세스 그룹을 중지한 후 `status_cmd` 를 출력하는 명령.
+
+    이미 끝난 작업은 그대로 둔다.
+    """
+    d = job_dir(job_id)
+    return 'if [ ! -f {d}/exit_code ]; then touch {d}/killed; {}; fi; ' \
+        '{}'.format(kill_group_cmd(d + '/pid'), status_cmd(job_id), d=d)
+
+
+def parse_status(lines):
+    """`status_cmd` 출력을 파싱.
+
+    Returns:
+        dict: 작업 ID 별 dict (pid, started, status, exit_code). status 는
+            running, done, failed, killed, lost 중 하나
+    """
+    jobs = {}
+    for line in lines:
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) != 4:
+            continue
+        job_id, pid, started, state = parts
+        exit_code = None
+        if state.startswith('exit '):
+            try:
+                exit_code = int(state[5:])
+            except ValueError:
+                exit_code = -1
+            state = 'done' if exit_code == 0 else 'failed'
+        jobs[job_id] = {'pid': int(pid) if pid.isdigit() else None,
+                        'started': started or None, 'status': state,
+                        'exit_code': exit_code}
+    return jobs
+
+
+def _notebook_host(clinfo):
+    from bilbo.cluster import _host
+
+    if 'notebook' not in clinfo:
+        raise RuntimeError("No notebook instance.")
+    return _host(clinfo['notebook'], clinfo['private_command'])
+
+
+def _exec(host, cmd, what, timeout=None):
+    """호스트에 명령을 실행하고, 실패하면 로그를 남기고 예외."""
+    from bilbo.cluster import exec_instance_cmd, FanoutResult
+
+    res = exec_instance_cmd(*host, cmd, timeout)
+    if not res.ok:
+        FanoutResult({host[2]: res}).log_failures(what)
+        raise RuntimeError("{} failed on '{}'.".format(what, host[2]))
+    return res
+
+
+def submit_job(clname, path, params=()):
+    """노트북 인스턴스에서 노트북 또는 파이썬 파일을 분리된 작업으로 실행.
+
+    Returns:
+        dict: 작업 정보 (job_id, host, path, cmd, pid, status, started)
+    """
+    from bilbo.cluster import check_cluster
+
+    clinfo = check_cluster(clname)
+    host = _notebook_host(clinfo)
+    job_id = new_job_id()
+    stdout_file = None
+    if path.split('.')[-1].lower() == 'ipynb':
+        stdout_file = "{}/stdout.log".format(job_dir(job_id))
+    cmd = run_cmd(clinfo, path, params, stdout_file)
+    res = _exec(host, submit_cmd(job_id, cmd), "Submit job")
+    job = {'job_id': job_id, 'host': host[2], 'path': path, 'cmd': cmd,
+           'pid': int(res.stdout[0].strip()), 'status': 'running',
+           'started': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    store.put_job(clname, job)
+    info("submit_job - {}".format(job))
+    return job
+
+
+def find_job(clname, job_id):
+    """ID (또는 유일한 앞부분)로 로컬에 기록된 작업 찾기.
+
+    Raises:
+        RuntimeError: 없거나 여럿일 때
+    """
+    jobs = list(store.iter_jobs(clname, job_id))
+    exact = [job for job in jobs if job['job_id'] == job_id]
+    if len(exact) == 1:
+        return exact[0]
+    if len(jobs) == 0:
+        raise RuntimeError("No job '{}' in '{}'.".format(job_id, clname))
+    if len(jobs) > 1:
+        raise RuntimeError("Job ID '{}' is ambiguous: {}".format(
+            job_id, ', '.join(job['job_id'] for job in jobs)))
+    return jobs[0]
+
+
+def refresh_jobs(clname):
+    """노트북 인스턴스의 작업 기록을 한 번에 읽어 로컬 기록을 갱신.
+
+    Returns:
+        list: 작업 dict 리스트 (ID 순). 로컬에 없는 작업의 path 는 None
+    """
+    from bilbo.cluster import check_cluster
+
+    clinfo = check_cluster(clname)
+    host = _notebook_host(clinfo)
+    remote = parse_status(_exec(host, status_cmd(), "List jobs").stdout)
+    jobs = {job['job_id']: job for job in store.iter_jobs(clname)}
+    for job_id, rjob in remote.items():
+        if job_id in jobs:
+            job = jobs[job_id]
+            if (job['status'], job['exit_code']) != \
+                    (rjob['status'], rjob['exit_code']):
+                store.update_job(clname, job_id, status=rjob['status'],
+                                 exit_code=rjob['exit_code'])
+            job.update(rjob)
+        else:
+            jobs[job_id] = dict(rjob, job_id=job_id, host=host[2], path=None)
+    for job_id, job in jobs.items():
+        # 원격 기록이 지워진 작업
+        if job_id not in remote and job['status'] == 'running':
+            store.update_job(clname, job_id, status='lost')
+            job['status'] = 'lost'
+    return [jobs[job_id] for job_id in sorted(jobs)]
+
+
+def show_jobs(clname):
+    """클러스터의 작업들 표시."""
+    jobs = refresh_jobs(clname)
+    if len(jobs) == 0:
+        print("No job.")
+        return
+    for job in jobs:
+        status = job['status']
+        if job['exit_code'] is not None and status == 'failed':
+            status = "failed({})".format(job['exit_code'])
+        print("{}  {:<10} {}  {}".format(job['job_id'], status,
+                                         job['started'] or '-',
+                                         job['path'] or '-'))
+
+
+def wait_job(clname, job_id, timeout=None):
+    """작업이 끝날 때까지 원격에서 기다림. 기다리는 동안 조회를 반복하지 않는다.
+
+    제한 시간은 원격의 기다리기 명령이 지키기에, 시간이 지나면 원격에도 남는
+    것이 없다.
+
+    Args:
+        timeout (float): 제한 시간(초)
+
+    Returns:
+        dict: 끝난 작업 정보 (status, exit_code 포함)
+
+    Raises:
+        TimeoutError: 제한 시간 안에 작업이 끝나지 않을 때
+    """
+    from bilbo.cluster import check_cluster
+
+    job = find_job(clname, job_id)
+    host = _notebook_host(check_cluster(clname))
+    ssh_timeout = timeout + WAIT_MARGIN if timeout is not None else None
+    res = _exec(host, wait_cmd(job['job_id'], timeout), "Wait job",
+                ssh_timeout)
+    rjob = parse_status(res.stdout).get(job['job_id'])
+    if rjob is not None and rjob['status'] == 'running':
+        raise TimeoutError("Timed out waiting for job {}.".format(
+            job['job_id']))
+    if rjob is None:
+        rjob = {'status': 'lost', 'exit_code': None}
+    store.update_job(clname, job['job_id'], status=rjob['status'],
+                     exit_code=rjob['exit_code'])
+    job.update(rjob)
+    return job
+
+
+def _log_files(job):
+    d = job_dir(job['job_id'])
+    files = ["{}/out.log".format(d)]
+    if job['path'].split('.')[-1].lower() == 'ipynb':
+        files.append("{}/stdout.log".format(d))
+    return ' '.join(files)
+
+
+def job_logs(clname, job_id, follow=False, lines=LOG_LINES):
+    """작업의 출력 로그 보기. follow 면 작업이 끝날 때까지 따라간다."""
+    from bilbo.cluster import check_cluster, send_instance_cmd
+
+    job = find_job(clname, job_id)
+    host = _notebook_host(check_cluster(clname))
+    if follow:
+        cmd = 'tail -n {} --pid="$(cat {}/pid)" -F {} 2>/dev/null'.format(
+            lines, job_dir(job['job_id']), _log_files(job))
+    else:
+        cmd = "tail -n {} {}".format(lines, _log_files(job))
+    res = send_instance_cmd(*host, cmd, show_stdout=follow)
+    if res is not None and not follow:
+        for line in res[0]:
+            print(line, end='')
+
+
+def kill_job(clname, job_id):
+    """작업의 프로세스 그룹을 중지.
+
+    Returns:
+        dict: 작업 정보 (status, exit_code 포함)
+    """
+    from bilbo.cluster import check_cluster
+
+    job = find_job(clname, job_id)
+    host = _notebook_host(check_cluster(clname))
+    res = _exec(host, kill_cmd(job['job_id']), "Kill job")
+    rjob = parse_status(res.stdout).get(job['job_id'])
+    if rjob is None:
+        rjob = {'status': 'lost', 'exit_code': None}
+    store.update_job(clname, job['job_id'], status=rjob['status'],
+                     exit_code=rjob['exit_code'])
+    job.update(rjob)
+    if rjob['status'] == 'killed':
+        critical("Job {} killed.".format(job['job_id']))
+    return job
+
+
+def follow_job(clname, job):
+    """작업의 로그를 따라가다가 끝나면 종료 정보를 돌려줌."""
+    job_logs(clname, job['job_id'], follow=True)
+    return wait_job(clname, job['job_id'])
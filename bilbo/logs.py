@@ -0,0 +1,194 @@
+"""원격 로그 모듈.
+
+노트북, 스케쥴러, 워커 프로세스의 로그 파일(`bilbo.cluster.remote_log_path`)을
+여러 인스턴스에서 동시에 읽어 호스트와 역할을 붙여 출력한다. 따라가기(follow)
+에서는 풀의 SSH 연결마다 채널을 하나씩 열고, 한 스레드에서 모든 채널을
+select 로 읽는다. 채널별로는 완성되지 않은 한 줄만 버퍼에 둔다.
+"""
+import sys
+import select
+
+from bilbo.util import warning, critical
+
+TAIL_LINES = 20
+# 한 줄 버퍼의 최대 크기(바이트). 넘으면 잘라서 출력
+LINE_MAX = 64 * 1024
+RECV_SIZE = 32 * 1024
+SELECT_TIMEOUT = 1.0
+
+
+class LineSplitter:
+    """받은 바이트를 줄 단위로 나눔. 완성되지 않은 줄만 버퍼에 남긴다."""
+
+    def __init__(self, line_max=LINE_MAX):
+        self.line_max = line_max
+        self.buf = b''
+
+    def feed(self, data):
+        """받은 바이트를 더하고 완성된 줄들을 돌려줌.
+
+        Returns:
+            list: 줄 끝 문자를 뺀 문자열 리스트
+        """
+        self.buf += data
+        *lines, self.buf = self.buf.split(b'\n')
+        if len(self.buf) > self.line_max:
+            lines.append(self.buf)
+            self.buf = b''
+        return [line.decode('utf-8', 'replace').rstrip('\r')
+                for line in lines]
+
+    def flush(self):
+        """남은 버퍼를 마지막 줄로 돌려줌."""
+        lines = self.feed(b'')
+        if len(self.buf) > 0:
+            lines.append(self.buf.decode('utf-8', 'replace'))
+            self.buf = b''
+        return lines
+
+
+def log_targets(clinfo, role=None):
+    """로그를 읽을 대상들.
+
+    Args:
+        role (str): 역할. 없으면 모든 역할
+
+    Returns:
+        list: (접두어, (ssh_user, ssh_private_key, ip), 로그 경로) 리스트
+    """
+    from bilbo.cluster import cluster_hosts, remote_log_path
+
+    targets = cluster_hosts(clinfo, role)
+    width = max([len(r) for r, _ in targets] or [0])
+    return [("{:<{}} {}".format(r, width, host[2]), host, remote_log_path(r))
+            for r, host in targets]
+
+
+def _emit(out, prefix, line):
+    out.write("{} | {}\n".format(prefix, line))
+
+
+def tail_logs(targets, lines=TAIL_LINES, out=None):
+    """대상들의 로그 마지막 줄들을 동시에 읽어 대상 순서대로 출력."""
+    from bilbo.cluster import fanout_cmd
+
+    out = out or sys.stdout
+    cmds = {host[2]: "tail -n {} {}".format(lines, path)
+            for _, host, path in targets}
+    res = fanout_cmd([host for _, host, _ in targets], cmds.get)
+    for prefix, host, path in targets:
+        hres = res[host[2]]
+        if not hres.ok:
+            warning("Can not read '{}' on {}: {}".format(
+                path, host[2], hres.error or hres.stderr.decode('utf-8')
+                .strip()))
+            continue
+        for line in hres.stdout:
+            _emit(out, prefix, line.rstrip('\n'))
+    out.flush()
+
+
+def _open_channel(client, path, lines):
+    """연결에 `tail -F` 채널을 엶."""
+    import paramiko
+
+    transport = client.get_transport()
+    if transport is None or not transport.is_active():
+        raise paramiko.SSHException("connection is closed")
+    chan = transport.open_session()
+    try:
+        chan.set_combine_stderr(True)
+        chan.exec_command("tail -n {} -F {}".format(lines, path))
+    except BaseException:
+        chan.close()
+        raise
+    return chan
+
+
+def _open_channels(targets, lines):
+    """대상마다 풀의 연결에 `tail -F` 채널을 엶.
+
+    한 호스트에서 연결이나 채널 열기가 실패하면 경고하고 나머지 호스트만
+    따라간다.
+
+    Returns:
+        dict: 채널별 (접두어, LineSplitter)
+    """
+    import paramiko
+    from concurrent.futures import ThreadPoolExecutor
+    from bilbo.cluster import ssh_pool, FANOUT_CONCURRENCY
+
+    def _connect(host):
+        try:
+            return ssh_pool.get(*host)
+        except (paramiko.SSHException, OSError) as e:
+            return e
+
+    nworker = max(1, min(FANOUT_CONCURRENCY, len(targets)))
+    with ThreadPoolExecutor(max_workers=nworker) as pool:
+        clients = list(pool.map(_connect, [host for _, host, _ in targets]))
+
+    chans = {}
+    for (prefix, host, path), client in zip(targets, clients):
+        if client is None:
+            warning("Can not connect to {}.".format(host[2]))
+            continue
+        if isinstance(client, Exception):
+            warning("Can not connect to {}: {}".format(host[2], client))
+            continue
+        try:
+            chan = _open_channel(client, path, lines)
+        except (paramiko.SSHException, OSError) as e:
+            warning("Can not follow '{}' on {}: {}".format(path, host[2], e))
+            ssh_pool.discard(*host)
+            continue
+        chans[chan] = (prefix, LineSplitter())
+    return chans
+
+
+def follow_logs(targets, lines=TAIL_LINES, out=None):
+    """대상들의 로그를 따라가며 도착하는 대로 출력. Ctrl-C 로 멈춘다."""
+    out = out or sys.stdout
+    chans = _open_channels(targets, lines)
+    try:
+        while len(chans) > 0:
+            ready, _, _ = select.select(list(chans), [], [], SELECT_TIMEOUT)
+            for chan in ready:
+                prefix, splitter = chans[chan]
+                data = chan.recv(RECV_SIZE)
+                if len(data) == 0:
+                    # 원격의 tail 이 끝남
+                    for line in splitter.flush():
+                        _emit(out, prefix, line)
+                    chan.close()
+                    del chans[chan]
+                    continue
+                for line in splitter.feed(data):
+                    _emit(out, prefix, line)
+            out.flush()
+    finally:
+        for chan in chans:
+            chan.close()
+
+
+def show_logs(clname, role=None, follow=False, lines=TAIL_LINES):
+    """클러스터 인스턴스들의 로그 출력.
+
+    Args:
+        clname (str): 클러스터명
+        role (str): 역할 (notebook, scheduler, worker). 없으면 모두
+        follow (bool): 로그를 따라가며 계속 출력
+        lines (int): 처음에 보여줄 마지막 줄 수
+    """
+    from bilbo.cluster import check_cluster
+
+    clinfo = check_cluster(clname)
+    targets = log_targets(clinfo, role)
+    if len(targets) == 0:
+        print("No instance to show logs.")
+        return
+    critical("Logs of {} instance(s) in '{}'.".format(len(targets), clname))
+    if follow:
+        follow_logs(targets, lines)
+    else:
+        tail_logs(targets, lines)
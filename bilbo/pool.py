@@ -0,0 +1,218 @@
+"""정지된 인스턴스의 웜 풀 모듈.
+
+클러스터를 제거할 때 Dask 인스턴스를 종료하지 않고 정지해 풀에 넣어 두면, 다음
+클러스터 생성에서 사양(AMI, 인스턴스 타입, 보안 그룹, 키, 볼륨 크기)이 같은
+인스턴스를 새로 만들지 않고 다시 시작해 쓴다. 풀 상태는 로컬 저장소에
+기록된다. 작업 파일이 남는 노트북 인스턴스는 풀에 넣지 않으며, 정지된
+인스턴스도 EBS 볼륨 비용은 계속 나간다.
+"""
+from bilbo import store
+from bilbo.util import info, warning, critical
+
+# 웜 풀 인스턴스의 이름과 구분 태그
+POOL_NAME = 'bilbo-pool'
+POOL_TAG = 'bilbo-pool'
+POOL_TAGS = [{'Key': 'Name', 'Value': POOL_NAME},
+             {'Key': POOL_TAG, 'Value': 'warm'}]
+# 인스턴스 ID 필터 한 번에 쓸 수 있는 최대 값 수
+FILTER_BATCH = 200
+
+
+def instance_spec(inst):
+    """인스턴스 프로파일의 웜 풀 사양."""
+    return {
+        'image_id': inst.ami,
+        'ec2type': inst.ec2type,
+        'security_group': inst.secgroup,
+        'key_name': inst.keyname,
+        'vol_size': inst.volsize
+    }
+
+
+def _desc_spec(desc, vol_size):
+    """DescribeInstances 결과의 웜 풀 사양."""
+    sgs = desc.get('SecurityGroups') or [{}]
+    return {
+        'image_id': desc['ImageId'],
+        'ec2type': desc['InstanceType'],
+        'security_group': sgs[0].get('GroupId'),
+        'key_name': desc.get('KeyName'),
+        'vol_size': vol_size
+    }
+
+
+def describe_instances(client, ids):
+    """인스턴스들의 DescribeInstances 결과. 없어진 인스턴스는 빠진다."""
+    descs = []
+    for s in range(0, len(ids), FILTER_BATCH):
+        res = client.describe_instances(Filters=[{
+            'Name': 'instance-id', 'Values': ids[s:s + FILTER_BATCH]}])
+        for rsv in res['Reservations']:
+            descs += rsv['Instances']
+    return descs
+
+
+def claim_instances(ec2, inst, cnt, tag_spec):
+    """웜 풀에서 사양이 같은 정지된 인스턴스를 최대 cnt 개 꺼내 시작.
+
+    아직 정지 중인 인스턴스는 풀에 되돌리고, 없어진 인스턴스는 버린다.
+    꺼낸 인스턴스는 새 태그로 바꾼 후 시작한다.
+
+    Args:
+        ec2: boto EC2 resource
+        inst (bilbo.profile.Instance): 인스턴스 프로파일
+        cnt (int): 필요한 인스턴스 수
+        tag_spec (list): 인스턴스 태그 스펙
+
+    Returns:
+        list: 시작한 인스턴스들의 DescribeInstances 결과
+    """
+    spec = instance_spec(inst)
+    ids = store.take_pool_instances(spec, cnt)
+    if len(ids) == 0:
+        return []
+    client = ec2.meta.client
+    descs = describe_instances(client, ids)
+    stopped = [d for d in descs if d['State']['Name'] == 'stopped']
+    stopping = [d['InstanceId'] for d in descs
+                if d['State']['Name'] == 'stopping']
+    if len(stopping) > 0:
+        store.put_pool_instances({iid: spec for iid in stopping})
+    lost = set(ids) - set(d['InstanceId'] for d in descs
+                          if d['State']['Name'] in ('stopped', 'stopping'))
+    if len(lost) > 0:
+        warning("Warm instance(s) no longer available: {}".
+                format(', '.join(sorted(lost))))
+    if len(stopped) == 0:
+        return []
+
+    sids = [d['InstanceId'] for d in stopped]
+    info("claim_instances: start {}".format(sids))
+    client.delete_tags(Resources=sids, Tags=[{'Key': POOL_TAG}])
+    client.create_tags(Resources=sids, Tags=tag_spec[0]['Tags'])
+    client.start_instances(InstanceIds=sids)
+    return stopped
+
+
+def park_instances(client, ids, vol_sizes=None):
+    """인스턴스들을 정지해 웜 풀에 넣음.
+
+    스팟 인스턴스나 running 이 아닌 인스턴스는 넣지 않는다.
+
+    Args:
+        client: boto EC2 client
+        ids (list): 인스턴스 ID 리스트
+        vol_sizes (dict): 인스턴스 ID 별 프로파일의 볼륨 크기
+
+    Returns:
+        list: 풀에 넣지 못해 종료해야 할 인스턴스 ID 리스트
+    """
+    vol_sizes = vol_sizes or {}
+    specs = {}
+    rest = []
+    tag_keys = set()
+    for desc in describe_instances(client, ids):
+        iid = desc['InstanceId']
+        state = desc['State']['Name']
+        if desc.get('InstanceLifecycle') == 'spot' or state != 'running':
+            if state not in ('shutting-down', 'terminated'):
+                rest.append(iid)
+            continue
+        specs[iid] = _desc_spec(desc, vol_sizes.get(iid))
+        tag_keys |= set(tag['Key'] for tag in desc.get('Tags') or [])
+    if len(specs) == 0:
+        return rest
+
+    pids = sorted(specs)
+    critical("Stop {} instance(s) into the warm pool.".format(len(pids)))
+    # 이전 클러스터의 태그를 지우고 풀 태그로
+    tag_keys = [k for k in tag_keys if not k.startswith('aws:')]
+    if len(tag_keys) > 0:
+        client.delete_tags(Resources=pids,
+                           Tags=[{'Key': k} for k in sorted(tag_keys)])
+    client.create_tags(Resources=pids, Tags=POOL_TAGS)
+    client.stop_instances(InstanceIds=pids)
+    store.put_pool_instances(specs)
+    return rest
+
+
+def _profile_instances(pobj):
+    """프로파일의 Dask 인스턴스 사양별 프로파일 (스팟 워커 제외)."""
+    insts = [pobj.scd_inst]
+    insts += [grp.inst for grp in pobj.wrk_groups if grp.spot is None]
+    uniq = {}
+    for inst in insts:
+        key = tuple(sorted(instance_spec(inst).items()))
+        uniq.setdefault(key, inst)
+    return list(uniq.values())
+
+
+def fill_pool(profile, cnt, params=None):
+    """프로파일의 Dask 인스턴스 사양별로 cnt 개씩 만들어 웜 풀에 넣음.
+
+    Returns:
+        list: 풀에 넣은 인스턴스 ID 리스트
+    """
+    import boto3
+    from bilbo.profile import read_profile, DaskProfile
+    from bilbo.cluster import create_ec2_instances, wait_instances_running
+
+    pcfg = read_profile(profile, params)
+    if 'dask' not in pcfg:
+        raise RuntimeError("Profile '{}' has no dask cluster.".
+                           format(profile))
+    pobj = DaskProfile(pcfg)
+    pobj.validate()
+    ec2 = boto3.resource('ec2')
+    client = ec2.meta.client
+
+    specs = {}
+    tag_spec = [{'ResourceType': 'instance', 'Tags': POOL_TAGS}]
+    for inst in _profile_instances(pobj):
+        critical("Launch {} {} instance(s) for the warm pool.".
+                 format(cnt, inst.ec2type))
+        ins = create_ec2_instances(ec2, inst, cnt, tag_spec)
+        for wrk in ins:
+            specs[wrk.instance_id] = instance_spec(inst)
+    ids = sorted(specs)
+    if len(ids) == 0:
+        return ids
+    # running 이 되어야 정지할 수 있음
+    wait_instances_running(ec2, ids)
+    client.stop_instances(InstanceIds=ids)
+    store.put_pool_instances(specs)
+    return ids
+
+
+def show_pool():
+    """웜 풀 인스턴스를 사양별로 표시."""
+    groups = {}
+    for row in store.iter_pool_instances():
+        key = tuple(row[k] for k in store.POOL_SPEC)
+        groups.setdefault(key, []).append(row['instance_id'])
+    if len(groups) == 0:
+        print("The warm pool is empty.")
+        return
+    for key, ids in groups.items():
+        spec = dict(zip(store.POOL_SPEC, key))
+        print("{ec2type} {image_id} {security_group} {key_name} "
+              "vol_size={vol_size}".format(**spec))
+        for iid in ids:
+            print("  {}".format(iid))
+
+
+def clear_pool():
+    """웜 풀의 모든 인스턴스를 종료하고 풀을 비움.
+
+    Returns:
+        int: 종료한 인스턴스 수
+    """
+    import boto3
+
+    ids = [row['instance_id'] for row in store.iter_pool_instances()]
+    if len(ids) == 0:
+        return 0
+    critical("Terminate {} warm instance(s).".format(len(ids)))
+    boto3.client('ec2').terminate_instances(InstanceIds=ids)
+    store.delete_pool_instances(ids)
+    return len(ids)
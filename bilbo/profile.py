@@ -4,30 +4,68 @@ import json
 import re
 from copy import copy
 import codecs
+import hashlib
+import threading
 
-import boto3
-import jsonschema
-
-from bilbo.util import error, prof_dir, mod_dir, info, PARAM_PTRN
+from bilbo.util import error, prof_dir, mod_dir, info, PARAM_PTRN, \
+    prof_cache_dir
 
 DEFAULT_WORKER = 1
+SPOT_ALLOCATION_STRATEGY = 'price-capacity-optimized'
+PLACEMENT_STRATEGY = 'cluster'
+
+# 스키마 파일 경로별 (mtime, 컴파일된 validator)
+_validators = {}
+# 검증을 통과한 (스키마 키, 프로파일 내용 해쉬)
+_validated = set()
+_latest_schema_path = None
+_schema_lock = threading.Lock()
+
+
+def get_latest_schema_path():
+    """최신 프로파일 json schema 파일 경로 (프로세스에서 한 번만 찾음)."""
+    global _latest_schema_path
+    if _latest_schema_path is None:
+        scm_dir = os.path.join(mod_dir, '..', 'schemas')
+        schemas = []
+        for scm in os.listdir(scm_dir):
+            # skip test
+            if scm.startswith('_'):
+                continue
+            schemas.append(scm)
+        assert len(schemas)
+        schemas = sorted(schemas)
+        _latest_schema_path = os.path.join(scm_dir, schemas[-1])
+    return _latest_schema_path
+
+
+def get_validator():
+    """최신 스키마의 컴파일된 validator.
+
+    스키마 파일 경로와 mtime 으로 캐쉬해 프로세스 내에서 재사용한다.
+
+    Returns:
+        tuple: (스키마 키, validator)
+    """
+    import jsonschema
+
+    path = get_latest_schema_path()
+    mtime = os.path.getmtime(path)
+    with _schema_lock:
+        cached = _validators.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rt') as f:
+                schema = json.loads(f.read())
+            cls = jsonschema.validators.validator_for(schema)
+            cls.check_schema(schema)
+            cached = (mtime, cls(schema))
+            _validators[path] = cached
+    return "{}:{}".format(path, cached[0]), cached[1]
 
 
 def get_latest_schema():
     """최신 프로파일 json schema를 얻음."""
-    scm_dir = os.path.join(mod_dir, '..', 'schemas')
-    schemas = []
-    for scm in os.listdir(scm_dir):
-        # skip test
-        if scm.startswith('_'):
-            continue
-        schemas.append(scm)
-    assert len(schemas)
-    schemas = sorted(schemas)
-    path = os.path.join(scm_dir, schemas[-1])
-    with open(path, 'rt') as f:
-        parsed = json.loads(f.read())
-    return parsed
+    return get_validator()[1].schema
 
 
 def check_profile(proname):
@@ -50,10 +88,22 @@ def check_profile(proname):
     return path
 
 
+def _cfg_hash(pcfg):
+    body = json.dumps(pcfg, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
 def validate_by_schema(pcfg):
-    """프로파일을 스키마로 점검."""
-    schema = get_latest_schema()
-    jsonschema.validate(pcfg, schema)
+    """프로파일을 스키마로 점검.
+
+    같은 내용은 프로세스 내에서 한 번만 검증한다.
+    """
+    skey, validator = get_validator()
+    key = (skey, _cfg_hash(pcfg))
+    if key in _validated:
+        return
+    validator.validate(pcfg)
+    _validated.add(key)
 
 
 def override_cfg_by_params(cfg, params):
@@ -101,29 +151,83 @@ def override_cfg_by_params(cfg, params):
             target[ke] = value
 
 
+def _profile_cache_key(body, params, skey):
+    """프로파일 내용, 덮어쓸 패러미터, 스키마로 정해지는 캐쉬 키."""
+    src = json.dumps([body, list(params or []), skey], ensure_ascii=False)
+    return hashlib.sha256(src.encode('utf-8')).hexdigest()
+
+
+def _profile_cache_path(proname):
+    """프로파일별 캐쉬 파일 경로. 프로파일마다 마지막 결과 하나만 둔다."""
+    return os.path.join(prof_cache_dir, proname.replace(os.sep, '%'))
+
+
+def _load_profile_cache(cpath, ckey):
+    """캐쉬 키가 같을 때만 캐쉬된 프로파일을 돌려줌."""
+    try:
+        with open(cpath, 'rt') as f:
+            cached = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if type(cached) is not dict or cached.get('key') != ckey:
+        return None
+    return cached.get('profile')
+
+
+def _save_profile_cache(cpath, ckey, pcfg):
+    """프로파일의 캐쉬를 덮어씀."""
+    try:
+        os.makedirs(prof_cache_dir, exist_ok=True)
+        tmp = cpath + '.tmp'
+        with open(tmp, 'wt') as f:
+            f.write(json.dumps({'key': ckey, 'profile': pcfg},
+                               ensure_ascii=False))
+        os.replace(tmp, cpath)
+    except OSError as e:
+        info("Can not write profile cache: {}".format(e))
+
+
 def read_profile(profile, params=None):
-    """프로파일 읽기."""
+    """프로파일 읽기.
+
+    검증을 마친 결과는 프로파일별로 내용과 패러미터의 해쉬와 함께 캐쉬하기에,
+    같은 프로파일을 같은 패러미터로 다시 읽을 때는 검증을 건너뛴다.
+    """
+    import jsonschema
+
     info("read_profile {}".format(profile))
     path = check_profile(profile)
     with codecs.open(path, 'rb', encoding='utf-8') as f:
         body = f.read()
-        pcfg = json.loads(body)
 
-    # 프로파일 내용 검증
-    validate_by_schema(pcfg)
+    skey, _ = get_validator()
+    cpath = _profile_cache_path(profile)
+    ckey = _profile_cache_key(body, params, skey)
+    pcfg = _load_profile_cache(cpath, ckey)
+    if pcfg is not None:
+        info("  use cached profile {}".format(cpath))
+        _validated.add((skey, _cfg_hash(pcfg)))
+        return pcfg
 
+    pcfg = json.loads(body)
     # Override 패러미터가 있으면 적용
     if params is not None:
         override_cfg_by_params(pcfg, params)
-        # 덮어쓴 내용 검증
-        try:
-            validate_by_schema(pcfg)
-        except jsonschema.exceptions.ValidationError:
-            msgs = ["There is an incorrect parameter:"]
-            for param in params:
-                msgs.append('  {}'.format(param))
-            raise RuntimeError('\n'.join(msgs))
 
+    # 프로파일 (덮어쓴) 내용 검증
+    try:
+        validate_by_schema(pcfg)
+    except jsonschema.exceptions.ValidationError:
+        if params is None:
+            raise
+        # 원 프로파일이 잘못되었으면 그 에러를 전달
+        validate_by_schema(json.loads(body))
+        msgs = ["There is an incorrect parameter:"]
+        for param in params:
+            msgs.append('  {}'.format(param))
+        raise RuntimeError('\n'.join(msgs))
+
+    _save_profile_cache(cpath, ckey, pcfg)
     return pcfg
 
 
@@ -166,6 +270,19 @@ class Instance:
         self.ssh_private_key = icfg.get('ssh_private_key')
         self.tags = icfg.get('tags')
 
+    def to_config(self):
+        """현재 멤버 값의 인스턴스 설정 (클러스터 정보에 기록 용)."""
+        return {
+            'ami': self.ami,
+            'ec2type': self.ec2type,
+            'keyname': self.keyname,
+            'security_group': self.secgroup,
+            'vol_size': self.volsize,
+            'ssh_user': self.ssh_user,
+            'ssh_private_key': self.ssh_private_key,
+            'tags': self.tags
+        }
+
     def get_name(self, clname):
         if self.prefix is None:
             return '{}-{}'.format(clname, self.role)
@@ -233,6 +350,8 @@ class Profile:
         self.desc = pcfg.get('description')
         self.inst_prefix = pcfg.get("instance_prefix")
         self.private_command = pcfg.get("private_command")
+        self.bootstrap = pcfg.get("bootstrap", False)
+        self.retry = pcfg.get("retry")
         self.inst = None
         if 'instance' in pcfg:
             self.inst = Instance(pcfg['instance'])
@@ -264,6 +383,35 @@ class Profile:
             self.nb_inst.validate()
 
 
+class WorkerGroup:
+    """같은 사양을 가지는 Dask 워커들의 그룹."""
+
+    def __init__(self, pinst, gcfg, role, prefix):
+        self.inst = Instance.resolve(pinst, gcfg, role, prefix)
+        self.count = DEFAULT_WORKER
+        self.nthread = self.nproc = self.spot = None
+        if gcfg is not None:
+            self.count = gcfg.get('count', self.count)
+            self.nthread = gcfg.get('nthread')
+            self.nproc = gcfg.get('nproc')
+            if 'spot' in gcfg:
+                self.spot = self.resolve_spot(gcfg['spot'])
+
+    def resolve_spot(self, scfg):
+        """스팟 설정에 기본값 적용.
+
+        인스턴스 타입 리스트가 없으면 인스턴스의 타입을, 인스턴스 타입이
+        없으면 리스트의 첫 타입을 쓴다.
+        """
+        spot = dict(scfg)
+        if 'ec2types' not in spot and self.inst.ec2type is not None:
+            spot['ec2types'] = [self.inst.ec2type]
+        if self.inst.ec2type is None and len(spot.get('ec2types', [])) > 0:
+            self.inst.ec2type = spot['ec2types'][0]
+        spot.setdefault('allocation_strategy', SPOT_ALLOCATION_STRATEGY)
+        return spot
+
+
 class DaskProfile(Profile):
     """다스크 프로파일."""
 
@@ -280,22 +428,40 @@ class DaskProfile(Profile):
                                          self.inst_prefix)
         self.scd_cnt = 1
 
-        # 워커
+        # 워커 (하나 또는 여러 그룹)
         wcfg = self.clcfg.get('worker')
-        self.wrk_inst = Instance.resolve(self.inst, wcfg, 'worker',
-                                         self.inst_prefix)
-        self.wrk_cnt = DEFAULT_WORKER
-        self.wrk_nthread = self.wrk_nproc = None
-        if wcfg is not None:
-            self.wrk_cnt = wcfg.get('count', self.wrk_cnt)
-            self.wrk_nthread = wcfg.get('nthread')
-            self.wrk_nproc = wcfg.get('nproc')
+        self.wrk_multi = type(wcfg) is list
+        wcfgs = wcfg if self.wrk_multi else [wcfg]
+        self.wrk_groups = []
+        for idx, gcfg in enumerate(wcfgs):
+            role = 'worker-{}'.format(idx + 1) if self.wrk_multi else 'worker'
+            self.wrk_groups.append(WorkerGroup(self.inst, gcfg, role,
+                                               self.inst_prefix))
+
+        # 자동 스케일 설정
+        self.autoscale = self.clcfg.get('autoscale')
+
+        # 스케쥴러와 워커의 배치 (배치 그룹, 서브넷, 가용 영역)
+        self.placement = None
+        if 'placement' in self.clcfg:
+            self.placement = dict(self.clcfg['placement'])
+            if 'group' in self.placement:
+                self.placement.setdefault('strategy', PLACEMENT_STRATEGY)
+
+        # 첫 번째 그룹 (단일 그룹 프로파일과의 호환)
+        grp = self.wrk_groups[0]
+        self.wrk_inst = grp.inst
+        self.wrk_nthread = grp.nthread
+        self.wrk_nproc = grp.nproc
+        # 전체 워커 수
+        self.wrk_cnt = sum(grp.count for grp in self.wrk_groups)
 
     def validate(self):
         """프로파일 유효성 점검."""
         super(DaskProfile, self).validate()
         self.scd_inst.validate()
-        self.wrk_inst.validate()
+        for grp in self.wrk_groups:
+            grp.inst.validate()
 
 
 def show_plan(profile, clname, params):
@@ -349,7 +515,37 @@ def show_dask_plan(clname, pobj):
     print("  1 Scheduler:")
     show_instance_plan(pobj.scd_inst)
 
-    print("")
-    print("  {} Worker(s):".format(pobj.wrk_cnt))
-    show_instance_plan(pobj.wrk_inst)
+    for grp in pobj.wrk_groups:
+        print("")
+        print("  {} Worker(s):".format(grp.count))
+        show_instance_plan(grp.inst)
+        if grp.spot is not None:
+            print("    Spot Instance Types: {}".
+                  format(', '.join(grp.spot['ec2types'])))
+            print("    Spot Allocation Strategy: {}".
+                  format(grp.spot['allocation_strategy']))
+        if grp.nproc is not None:
+            print("    Processes: {}".format(grp.nproc))
+        if grp.nthread is not None:
+            print("    Threads: {}".format(grp.nthread))
+
+    if pobj.placement is not None:
+        pcfg = pobj.placement
+        print("")
+        print("  Placement (scheduler and workers):")
+        if 'group' in pcfg:
+            print("    Placement Group: {} ({})".format(pcfg['group'],
+                                                      pcfg['strategy']))
+        if 'subnet' in pcfg:
+            print("    Subnet: {}".format(pcfg['subnet']))
+        if 'availability_zone' in pcfg:
+            print("    Availability Zone: {}".
+                  format(pcfg['availability_zone']))
+
+    if pobj.autoscale is not None:
+        acfg = pobj.autoscale
+        print("")
+        print("  Autoscale (worker group {}):".format(acfg.get('group', 0)))
+        print("    Min: {}".format(acfg.get('min')))
+        print("    Max: {}".format(acfg.get('max')))
     print("")
@@ -0,0 +1,376 @@
+"""로컬 클러스터 상태 저장소 모듈.
+
+클러스터 정보를 `~/.bilbo/bilbo.db` SQLite (WAL) 에 저장한다. 클러스터 본문은
+JSON 으로, 인스턴스는 ID 와 IP 로 찾을 수 있게 인덱스된 테이블에 둔다.
+재사용을 위해 정지해둔 웜 풀 인스턴스도 사양별로 기록한다. 파라미터 스윕의
+실행별 상태와 노트북 인스턴스의 원격 작업도 클러스터에 딸려 기록된다.
+이전 버전의 `~/.bilbo/clusters/*.json` 파일은 처음 열 때 옮겨진다.
+"""
+import os
+import json
+import sqlite3
+import datetime
+import threading
+
+from bilbo.util import store_path, clust_dir, iter_clusters, info, \
+    warning, check_dirs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cluster (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    body TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS instance (
+    instance_id TEXT PRIMARY KEY,
+    cluster TEXT NOT NULL REFERENCES cluster(name) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    public_ip TEXT,
+    private_ip TEXT,
+    ssh_user TEXT,
+    ssh_private_key TEXT
+);
+CREATE INDEX IF NOT EXISTS instance_cluster ON instance(cluster);
+CREATE INDEX IF NOT EXISTS instance_public_ip ON instance(public_ip);
+CREATE INDEX IF NOT EXISTS instance_private_ip ON instance(private_ip);
+CREATE TABLE IF NOT EXISTS pool (
+    instance_id TEXT PRIMARY KEY,
+    image_id TEXT NOT NULL,
+    ec2type TEXT NOT NULL,
+    security_group TEXT,
+    key_name TEXT,
+    vol_size INTEGER,
+    added TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pool_spec ON pool(image_id, ec2type);
+CREATE TABLE IF NOT EXISTS sweep_run (
+    cluster TEXT NOT NULL REFERENCES cluster(name) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    host TEXT,
+    output TEXT,
+    log TEXT,
+    exit_code INTEGER,
+    started TEXT,
+    finished TEXT,
+    PRIMARY KEY (cluster, path, run_id)
+);
+CREATE TABLE IF NOT EXISTS job (
+    cluster TEXT NOT NULL REFERENCES cluster(name) ON DELETE CASCADE,
+    job_id TEXT NOT NULL,
+    host TEXT NOT NULL,
+    path TEXT NOT NULL,
+    cmd TEXT NOT NULL,
+    pid INTEGER,
+    status TEXT NOT NULL,
+    exit_code INTEGER,
+    started TEXT,
+    updated TEXT,
+    PRIMARY KEY (cluster, job_id)
+);
+"""
+
+# 웜 풀 인스턴스를 구분하는 사양 컬럼
+POOL_SPEC = ('image_id', 'ec2type', 'security_group', 'key_name', 'vol_size')
+
+_conn = None
+_lock = threading.RLock()
+
+
+def json_default(value):
+    """날짜를 JSON 으로 기록하기 위한 변환."""
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    raise TypeError('not JSON serializable')
+
+
+def dump_cluster_info(clinfo):
+    """클러스터 정보를 JSON 문자열로."""
+    return json.dumps(clinfo, default=json_default, indent=4,
+                      sort_keys=True, ensure_ascii=False)
+
+
+def connect():
+    """저장소 연결 (프로세스에서 하나를 공유)."""
+    global _conn
+    with _lock:
+        if _conn is None:
+            info("store connect: {}".format(store_path))
+            check_dirs()
+            conn = sqlite3.connect(store_path, check_same_thread=False,
+                                   isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            _conn = conn
+            migrate_json_clusters()
+        return _conn
+
+
+def close():
+    """저장소 연결 닫기."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+
+def query(sql, args=()):
+    """읽기 쿼리의 모든 행."""
+    with _lock:
+        return connect().execute(sql, args).fetchall()
+
+
+class transaction:
+    """쓰기 트랜잭션 컨텍스트."""
+
+    def __enter__(self):
+        _lock.acquire()
+        self.conn = connect()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                self.conn.execute("COMMIT")
+            else:
+                self.conn.execute("ROLLBACK")
+        finally:
+            _lock.release()
+
+
+def _iter_instances(clinfo):
+    """클러스터 정보의 (역할, 인스턴스 정보, 접속 정보) 순회."""
+    if 'notebook' in clinfo:
+        yield 'notebook', clinfo['notebook'], clinfo['notebook']
+    if 'scheduler' in clinfo:
+        yield 'scheduler', clinfo['scheduler'], clinfo['scheduler']
+    if 'worker' in clinfo:
+        winfo = clinfo['worker']
+        winfos = winfo if type(winfo) is list else [winfo]
+        for winfo in winfos:
+            for wrk in winfo['instances']:
+                yield 'worker', wrk, winfo
+
+
+def _put_cluster(conn, clname, clinfo):
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("INSERT OR REPLACE INTO cluster (name, description, body, "
+                 "updated) VALUES (?, ?, ?, ?)",
+                 (clname, clinfo.get('description'),
+                  dump_cluster_info(clinfo), now))
+    conn.execute("DELETE FROM instance WHERE cluster = ?", (clname,))
+    rows = []
+    for role, inst, acc in _iter_instances(clinfo):
+        if 'instance_id' not in inst:
+            continue
+        rows.append((inst['instance_id'], clname, role,
+                     inst.get('public_ip'), inst.get('private_ip'),
+                     acc.get('ssh_user'), acc.get('ssh_private_key')))
+    conn.executemany("INSERT OR REPLACE INTO instance (instance_id, cluster, "
+                     "role, public_ip, private_ip, ssh_user, ssh_private_key) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def put_cluster(clname, clinfo):
+    """클러스터 정보를 인스턴스 인덱스와 함께 한 트랜잭션으로 기록."""
+    with transaction() as conn:
+        _put_cluster(conn, clname, clinfo)
+
+
+def get_cluster(clname):
+    """클러스터 정보 읽기. 없으면 None."""
+    rows = query("SELECT body FROM cluster WHERE name = ?", (clname,))
+    if len(rows) == 0:
+        return None
+    return json.loads(rows[0]['body'])
+
+
+def cluster_exists(clname):
+    """클러스터 정보가 존재하는가?"""
+    rows = query("SELECT 1 FROM cluster WHERE name = ?", (clname,))
+    return len(rows) > 0
+
+
+def delete_cluster(clname):
+    """클러스터 정보와 인스턴스 인덱스 제거."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM instance WHERE cluster = ?", (clname,))
+        conn.execute("DELETE FROM sweep_run WHERE cluster = ?", (clname,))
+        conn.execute("DELETE FROM job WHERE cluster = ?", (clname,))
+        conn.execute("DELETE FROM cluster WHERE name = ?", (clname,))
+
+
+def iter_cluster_summary():
+    """모든 클러스터의 (이름, 설명) 순회."""
+    rows = query("SELECT name, description FROM cluster ORDER BY name")
+    for row in rows:
+        yield row['name'], row['description']
+
+
+def find_instance(cluster=None, instance_id=None, public_ip=None,
+                  private_ip=None):
+    """인덱스로 인스턴스 찾기.
+
+    Returns:
+        dict: instance 테이블의 행. 없으면 None
+    """
+    conds = []
+    args = []
+    for col, val in (('cluster', cluster), ('instance_id', instance_id),
+                     ('public_ip', public_ip), ('private_ip', private_ip)):
+        if val is not None:
+            conds.append("{} = ?".format(col))
+            args.append(val)
+    assert len(conds) > 0
+    sql = "SELECT * FROM instance WHERE " + " AND ".join(conds)
+    rows = query(sql, args)
+    return dict(rows[0]) if len(rows) > 0 else None
+
+
+def put_pool_instances(specs):
+    """웜 풀에 인스턴스들을 기록.
+
+    Args:
+        specs (dict): 인스턴스 ID 별 사양 (POOL_SPEC 의 키들)
+    """
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = [(iid,) + tuple(spec.get(k) for k in POOL_SPEC) + (now,)
+            for iid, spec in specs.items()]
+    with transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO pool (instance_id, {}, added) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)".
+                         format(', '.join(POOL_SPEC)), rows)
+
+
+def take_pool_instances(spec, cnt):
+    """사양이 같은 웜 풀 인스턴스를 오래된 것부터 최대 cnt 개 꺼냄.
+
+    꺼낸 인스턴스는 풀에서 지워지기에 여러 프로세스가 같은 인스턴스를
+    가져가지 않는다.
+
+    Returns:
+        list: 인스턴스 ID 리스트
+    """
+    conds = ' AND '.join('{} IS ?'.format(k) for k in POOL_SPEC)
+    args = [spec.get(k) for k in POOL_SPEC]
+    with transaction() as conn:
+        rows = conn.execute("SELECT instance_id FROM pool WHERE {} ORDER BY "
+                            "added, instance_id LIMIT ?".format(conds),
+                            args + [cnt]).fetchall()
+        ids = [row['instance_id'] for row in rows]
+        conn.executemany("DELETE FROM pool WHERE instance_id = ?",
+                         [(iid,) for iid in ids])
+    return ids
+
+
+def delete_pool_instances(ids):
+    """웜 풀에서 인스턴스들을 지움."""
+    with transaction() as conn:
+        conn.executemany("DELETE FROM pool WHERE instance_id = ?",
+                         [(iid,) for iid in ids])
+
+
+def iter_pool_instances():
+    """웜 풀 인스턴스들의 행 순회."""
+    rows = query("SELECT * FROM pool ORDER BY {}, added".
+                 format(', '.join(POOL_SPEC)))
+    for row in rows:
+        yield dict(row)
+
+
+def put_sweep_runs(cluster, path, runs):
+    """스윕 실행들을 pending 으로 기록. 이미 있는 실행은 그대로 둔다.
+
+    Args:
+        runs (dict): 실행 ID 별 파라미터
+    """
+    rows = [(cluster, path, rid, json.dumps(params, sort_keys=True))
+            for rid, params in runs.items()]
+    with transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO sweep_run (cluster, path, "
+                         "run_id, params, status) VALUES (?, ?, ?, ?, "
+                         "'pending')", rows)
+
+
+def update_sweep_run(cluster, path, run_id, **cols):
+    """스윕 실행 하나의 컬럼들을 바꿈."""
+    sets = ', '.join('{} = ?'.format(k) for k in cols)
+    with transaction() as conn:
+        conn.execute("UPDATE sweep_run SET {} WHERE cluster = ? AND path = ? "
+                     "AND run_id = ?".format(sets),
+                     list(cols.values()) + [cluster, path, run_id])
+
+
+def iter_sweep_runs(cluster, path):
+    """스윕 실행들의 행 순회. params 는 dict 로."""
+    rows = query("SELECT * FROM sweep_run WHERE cluster = ? AND path = ? "
+                 "ORDER BY run_id", (cluster, path))
+    for row in rows:
+        row = dict(row)
+        row['params'] = json.loads(row['params'])
+        yield row
+
+
+def put_job(cluster, job):
+    """원격 작업 기록.
+
+    Args:
+        job (dict): job_id, host, path, cmd, pid, status, started
+    """
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO job (cluster, job_id, host, path, "
+                     "cmd, pid, status, started, updated) VALUES (?, ?, ?, ?, "
+                     "?, ?, ?, ?, ?)",
+                     (cluster, job['job_id'], job['host'], job['path'],
+                      job['cmd'], job.get('pid'), job['status'],
+                      job.get('started'), now))
+
+
+def update_job(cluster, job_id, **cols):
+    """원격 작업 하나의 컬럼들을 바꿈."""
+    cols['updated'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    sets = ', '.join('{} = ?'.format(k) for k in cols)
+    with transaction() as conn:
+        conn.execute("UPDATE job SET {} WHERE cluster = ? AND job_id = ?".
+                     format(sets), list(cols.values()) + [cluster, job_id])
+
+
+def iter_jobs(cluster, prefix=''):
+    """클러스터의 원격 작업 행들을 ID 순으로. prefix 로 ID 앞부분 찾기."""
+    rows = query("SELECT * FROM job WHERE cluster = ? AND "
+                 "substr(job_id, 1, ?) = ? ORDER BY job_id",
+                 (cluster, len(prefix), prefix))
+    for row in rows:
+        yield dict(row)
+
+
+def migrate_json_clusters():
+    """이전 버전의 클러스터 JSON 파일들을 저장소로 옮김.
+
+    옮겨진 파일은 `.json.migrated` 로 이름을 바꾼다.
+    """
+    if not os.path.isdir(clust_dir):
+        return
+    for clname in sorted(iter_clusters()):
+        path = os.path.join(clust_dir, clname + '.json')
+        try:
+            with open(path, 'rt') as f:
+                clinfo = json.loads(f.read())
+        except ValueError as e:
+            warning("Can not migrate '{}': {}".format(path, e))
+            continue
+        with transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM cluster WHERE name = ?",
+                                  (clname,)).fetchone()
+            if exists is None:
+                info("migrate cluster '{}' from {}".format(clname, path))
+                _put_cluster(conn, clname, clinfo)
+        os.rename(path, path + '.migrated')
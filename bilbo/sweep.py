@@ -0,0 +1,278 @@
+"""파라미터 스윕 모듈.
+
+파라미터 그리드를 펼쳐 노트북(papermill)이나 파이썬 파일을 조합마다 한 번씩,
+노트북 인스턴스(와 원하면 워커 인스턴스들)에서 동시에 실행한다. 실행마다
+결과 노트북과 표준 출력 로그는 원격 작업 폴더의 `<파일 이름>.sweep/` 아래
+`<실행 ID>.*` 로 남는다. 실행 ID 는 파라미터 조합의 해쉬다.
+
+실행마다 새 세션(프로세스 그룹)으로 시작해 PID 를 `<실행 ID>.pid` 에 남기기에,
+스윕을 중단하면 실행 중인 원격 프로세스들도 그룹째 중지한다.
+
+실행별 상태는 로컬 저장소에 기록되기에, 같은 파일로 다시 스윕하면 이미 성공한
+조합은 건너뛴다.
+"""
+import json
+import shlex
+import time
+import queue
+import hashlib
+import datetime
+import itertools
+import threading
+
+from bilbo import store
+from bilbo.util import info, warning, critical
+
+# 호스트당 기본 동시 실행 수
+SWEEP_PARALLEL = 2
+# 중단할 때 중지한 실행들이 끝나기를 기다리는 시간(초)
+STOP_WAIT = 10
+
+
+def load_grid(path):
+    """파라미터 그리드 파일을 읽어 조합들로 펼침.
+
+    그리드는 파라미터별 값 리스트(`{"lr": [0.1, 0.01], "depth": [3, 5]}`)면 모든
+    조합으로, 파라미터 dict 의 리스트면 그대로 쓴다. 리스트가 아닌 값은 한
+    값으로 본다.
+
+    Returns:
+        list: 파라미터 dict 리스트
+
+    Raises:
+        RuntimeError: 그리드 형식이 틀릴 때
+    """
+    with open(path, 'rt') as f:
+        grid = json.loads(f.read())
+    if isinstance(grid, list):
+        if not all(isinstance(params, dict) for params in grid):
+            raise RuntimeError("Grid list must have parameter objects only.")
+        return grid
+    if not isinstance(grid, dict):
+        raise RuntimeError("Grid must be an object or a list of objects.")
+    keys = sorted(grid)
+    values = [grid[k] if isinstance(grid[k], list) else [grid[k]]
+              for k in keys]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def run_id(params):
+    """파라미터 조합의 실행 ID."""
+    key = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+
+
+def run_paths(path, rid):
+    """실행의 원격 결과 폴더, 결과 노트북, 로그 경로 (작업 폴더 기준).
+
+    Returns:
+        tuple: (폴더, 결과 노트북 또는 None, 로그)
+    """
+    stem, ext = path.rsplit('.', 1)
+    odir = "{}.sweep".format(stem)
+    out = "{}/{}.{}".format(odir, rid, ext) if ext.lower() == 'ipynb' \
+        else None
+    return odir, out, "{}/{}.log".format(odir, rid)
+
+
+def pid_path(path, rid):
+    """실행의 프로세스 그룹 PID 를 기록하는 원격 쉘 경로."""
+    from bilbo.cluster import NB_WORKDIR
+
+    odir, _, _ = run_paths(path, rid)
+    return "{}/{}/{}.pid".format(NB_WORKDIR, shlex.quote(odir), rid)
+
+
+def run_cmd(path, params, scd_addr, rid):
+    """실행 하나의 원격 명령. 새 세션으로 시작해 끝날 때까지 기다린다.
+
+    Args:
+        path (str): 작업 폴더 기준 노트북 또는 파이썬 파일 경로
+        params (dict): 파라미터
+        scd_addr (str): `DASK_SCHEDULER_ADDRESS=...` 또는 None
+        rid (str): 실행 ID
+    """
+    from bilbo.cluster import _get_run_notebook, _get_run_python, NB_WORKDIR
+    from bilbo.jobs import session_cmd
+
+    odir, out, log = run_paths(path, rid)
+    pstrs = ["{}={}".format(k, shlex.quote(str(v)))
+             for k, v in sorted(params.items())]
+    cmd_params = [scd_addr] if scd_addr is not None else []
+    ext = path.split('.')[-1].lower()
+    if ext == 'ipynb':
+        cmd, _ = _get_run_notebook(path, pstrs, cmd_params, out, log)
+    elif ext == 'py':
+        cmd = _get_run_python(path, cmd_params + pstrs) + \
+            " > {} 2>&1".format(shlex.quote(log))
+    else:
+        raise RuntimeError("Unsupported file type: {}".format(path))
+    return "mkdir -p {}/{} && {{ {}; wait $!; }}".format(
+        NB_WORKDIR, shlex.quote(odir), session_cmd(cmd, pid_path(path, rid)))
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _fmt_params(params):
+    return ' '.join("{}={}".format(k, v) for k, v in sorted(params.items()))
+
+
+def _stop_runs(path, running):
+    """실행 중인 원격 실행들의 프로세스 그룹을 중지.
+
+    Args:
+        running (dict): 실행 ID 별 호스트 튜플
+    """
+    from bilbo.cluster import fanout_cmd
+    from bilbo.jobs import kill_group_cmd
+
+    kills = {}
+    for rid, host in running.items():
+        kills.setdefault(host, []).append(kill_group_cmd(pid_path(path, rid)))
+    warning("Stop {} running run(s).".format(len(running)))
+    cmds = {host[2]: '; '.join(cmds) + '; true'
+            for host, cmds in kills.items()}
+    fanout_cmd(list(kills), lambda ip: cmds[ip])
+
+
+def run_sweep(clname, path, grid, parallel=SWEEP_PARALLEL, on_workers=False,
+              rerun=False):
+    """파라미터 그리드로 노트북 또는 파이썬 파일을 동시에 실행.
+
+    호스트마다 parallel 개의 슬롯이 대기중인 실행을 하나씩 가져가 실행한다.
+    워커에서 실행하려면 워커들의 작업 폴더에도 같은 파일이 있어야 한다.
+    Ctrl-C 로 중단하면 실행 중인 원격 실행들을 중지해 interrupted 로, 시작하지
+    않은 실행은 pending 으로 두기에 다시 스윕하면 이어서 실행한다.
+
+    Args:
+        clname (str): 클러스터명
+        path (str): 작업 폴더 기준 노트북 또는 파이썬 파일 경로
+        grid (list): `load_grid` 결과
+        parallel (int): 호스트당 동시 실행 수
+        on_workers (bool): 워커 인스턴스들에서도 실행
+        rerun (bool): 이미 성공한 조합도 다시 실행
+
+    Returns:
+        bool: 모든 실행이 성공했으면 True
+    """
+    from bilbo.cluster import check_cluster, cluster_hosts, \
+        exec_instance_cmd, _get_dask_scheduler_address
+
+    clinfo = check_cluster(clname)
+    if 'notebook' not in clinfo:
+        raise RuntimeError("No notebook instance.")
+    scd_addr = _get_dask_scheduler_address(clinfo) \
+        if 'scheduler' in clinfo else None
+    hosts = [host for _, host in cluster_hosts(clinfo, 'notebook')]
+    if on_workers:
+        hosts += [host for _, host in cluster_hosts(clinfo, 'worker')]
+
+    runs = {run_id(params): params for params in grid}
+    # 실행 명령을 먼저 만들어 파일 형식 오류는 시작 전에
+    cmds = {rid: run_cmd(path, params, scd_addr, rid)
+            for rid, params in runs.items()}
+    store.put_sweep_runs(clname, path, runs)
+    done = set(row['run_id'] for row in store.iter_sweep_runs(clname, path)
+               if row['status'] == 'done')
+    todo = [rid for rid in sorted(runs) if rerun or rid not in done]
+    critical("Sweep '{}': {} run(s), {} already done, on {} host(s) x {}.".
+             format(path, len(runs), len(runs) - len(todo), len(hosts),
+                    parallel))
+
+    pending = queue.Queue()
+    for rid in todo:
+        pending.put(rid)
+    lock = threading.Lock()
+    stop = threading.Event()
+    running = {}
+    results = {}
+
+    def _slot(host):
+        while not stop.is_set():
+            try:
+                rid = pending.get_nowait()
+            except queue.Empty:
+                return
+            _, out, log = run_paths(path, rid)
+            with lock:
+                if stop.is_set():
+                    return
+                running[rid] = host
+                store.update_sweep_run(clname, path, rid, status='running',
+                                       host=host[2], output=out, log=log,
+                                       exit_code=None, started=_now(),
+                                       finished=None)
+            start = time.time()
+            res = exec_instance_cmd(*host, cmds[rid])
+            status = 'done' if res.ok else 'failed'
+            if not res.ok and stop.is_set():
+                # 중단으로 중지된 실행
+                status = 'interrupted'
+            store.update_sweep_run(clname, path, rid, status=status,
+                                   exit_code=res.exit_code, finished=_now())
+            with lock:
+                del running[rid]
+                if status == 'interrupted':
+                    continue
+                results[rid] = res
+                print("[{}/{}] {} {} on {} ({:.1f}s) {}".format(
+                    len(results), len(todo), status, rid, host[2],
+                    time.time() - start, _fmt_params(runs[rid])))
+            if not res.ok:
+                warning("Run {} failed: {}. See {}".format(
+                    rid, res.error or "exit code {}".format(res.exit_code),
+                    log))
+
+    threads = [threading.Thread(target=_slot, args=(host,), daemon=True)
+               for host in hosts for _ in range(parallel)]
+    for th in threads:
+        th.start()
+    # Ctrl-C 를 받을 수 있도록 제한 시간을 두고 기다림
+    try:
+        for th in threads:
+            while th.is_alive():
+                th.join(1)
+    except KeyboardInterrupt:
+        stop.set()
+        with lock:
+            stopping = dict(running)
+        if len(stopping) > 0:
+            _stop_runs(path, stopping)
+        deadline = time.time() + STOP_WAIT
+        for th in threads:
+            th.join(max(0, deadline - time.time()))
+        # 그래도 끝나지 않은 실행
+        with lock:
+            for rid in running:
+                store.update_sweep_run(clname, path, rid,
+                                       status='interrupted', finished=_now())
+        raise
+
+    failed = [rid for rid, res in results.items() if not res.ok]
+    print("{} run(s): {} done, {} failed, {} skipped".format(
+        len(runs), len(results) - len(failed), len(failed),
+        len(runs) - len(todo)))
+    info("run_sweep - failed {}".format(failed))
+    return len(failed) == 0
+
+
+def show_sweep(clname, path):
+    """스윕 실행들의 상태 표시."""
+    from bilbo.cluster import check_cluster
+
+    check_cluster(clname)
+    rows = list(store.iter_sweep_runs(clname, path))
+    if len(rows) == 0:
+        print("No sweep for '{}'.".format(path))
+        return
+    counts = {}
+    for row in rows:
+        counts[row['status']] = counts.get(row['status'], 0) + 1
+        print("{} {:<8} {} {}".format(row['run_id'], row['status'],
+                                      row['host'] or '-',
+                                      row['output'] or row['log'] or '-'),
+              _fmt_params(row['params']))
+    print("{} run(s): {}".format(len(rows), ', '.join(
+        "{} {}".format(cnt, status) for status, cnt in sorted(counts.items()))))
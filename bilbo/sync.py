@@ -0,0 +1,261 @@
+"""작업 폴더 동기화 모듈.
+
+로컬 폴더를 노트북 인스턴스의 작업 폴더(`bilbo.cluster.NB_WORKDIR`)로 한
+방향으로 맞춘다. 로컬 파일 목록(크기, 수정 시간, SHA-256)과 원격 파일 목록을
+비교해 바뀐 파일만 하나의 tar.gz 스트림으로 묶어, 풀의 SSH 연결 하나에서
+SFTP 채널로 보내고 원격에서 푼다. 묶기와 압축, 전송이 스트림으로 겹치기에 로컬
+임시 파일은 만들지 않는다.
+
+로컬 파일의 해쉬와 마지막 동기화 후의 원격 파일 목록은 `~/.bilbo/sync/` 에
+기록해 두고, 크기와 수정 시간이 그대로인 파일은 다시 해쉬하지 않는다. 원격에서
+바뀐 파일은 로컬 것으로 덮어쓴다.
+"""
+import os
+import json
+import gzip
+import time
+import hashlib
+import tarfile
+from fnmatch import fnmatch
+
+from bilbo.util import sync_dir, info, critical
+from bilbo.transfer import file_sha256, remote_path
+
+# 기본으로 제외할 파일 / 폴더 이름 패턴
+EXCLUDES = ('.git', '__pycache__', '.ipynb_checkpoints', '*.pyc',
+            '.DS_Store')
+# 원격 홈 아래 변경분 묶음과 지울 파일 목록
+STAGE = '.bilbo_sync.tar.gz'
+DELETE_LIST = '.bilbo_sync.del'
+# 변경분 압축 수준. 전송과 겹치도록 낮게
+COMPRESS_LEVEL = 3
+# 따라가기에서 로컬 변경 확인 간격(초)
+WATCH_INTERVAL = 1.0
+SYNC_TIMEOUT = 600
+
+
+def is_excluded(rel, excludes):
+    """상대 경로의 한 부분이라도 제외 패턴에 맞는가?"""
+    return any(fnmatch(part, pat) for part in rel.split('/')
+               for pat in excludes)
+
+
+def scan(root, excludes=EXCLUDES):
+    """로컬 폴더 아래 파일들의 크기와 수정 시간.
+
+    Returns:
+        dict: 상대 경로별 (크기, 수정 시간(ns))
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rdir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        rdir = '' if rdir == '.' else rdir + '/'
+        dirnames[:] = [d for d in dirnames if not is_excluded(d, excludes)]
+        for name in filenames:
+            if is_excluded(name, excludes):
+                continue
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                # 깨진 링크나 그 사이 지워진 파일
+                continue
+            files[rdir + name] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def local_manifest(root, excludes=EXCLUDES, cache=None):
+    """로컬 파일 목록. 크기와 수정 시간이 캐쉬와 같으면 해쉬를 다시 쓴다.
+
+    Args:
+        cache (dict): 이전의 `local_manifest` 결과
+
+    Returns:
+        dict: 상대 경로별 [크기, 수정 시간(ns), SHA-256]
+    """
+    cache = cache or {}
+    manifest = {}
+    for rel, (size, mtime) in scan(root, excludes).items():
+        old = cache.get(rel)
+        if old is not None and old[:2] == [size, mtime]:
+            manifest[rel] = old
+        else:
+            manifest[rel] = [size, mtime,
+                             file_sha256(os.path.join(root, rel))]
+    return manifest
+
+
+def list_cmd():
+    """현재 폴더 아래 파일의 상대 경로, 크기, 수정 시간을 출력하는 명령."""
+    return "find . -type f -printf '%P\\t%s\\t%T@\\n'"
+
+
+def parse_listing(lines, excludes=EXCLUDES):
+    """`list_cmd` 출력을 파싱.
+
+    Returns:
+        dict: 상대 경로별 [크기, 수정 시간 문자열]
+    """
+    remote = {}
+    for line in lines:
+        parts = line.rstrip('\n').rsplit('\t', 2)
+        if len(parts) != 3 or is_excluded(parts[0], excludes):
+            continue
+        remote[parts[0]] = [int(parts[1]), parts[2]]
+    return remote
+
+
+def diff(local, remote, known, delete=False):
+    """보낼 파일과 지울 파일 결정.
+
+    원격 파일의 크기와 수정 시간이 마지막 동기화 기록과 같을 때만 기록된 해쉬를
+    믿는다. 그렇지 않으면 보낸다.
+
+    Args:
+        local (dict): `local_manifest` 결과
+        remote (dict): `parse_listing` 결과
+        known (dict): 마지막 동기화 후 원격 파일별 [크기, 수정 시간, SHA-256]
+        delete (bool): 로컬에 없는 원격 파일을 지움
+
+    Returns:
+        tuple: (보낼 상대 경로 리스트, 지울 상대 경로 리스트)
+    """
+    send = []
+    for rel, (_, _, sha) in sorted(local.items()):
+        rinfo, kinfo = remote.get(rel), known.get(rel)
+        if rinfo is None or kinfo is None or kinfo[:2] != rinfo or \
+                kinfo[2] != sha:
+            send.append(rel)
+    deletes = sorted(set(remote) - set(local)) if delete else []
+    return send, deletes
+
+
+def state_path(clname, dest, root):
+    """클러스터, 원격 폴더, 로컬 폴더 조합의 동기화 기록 파일 경로."""
+    key = "{}\t{}\t{}".format(clname, dest, os.path.abspath(root))
+    return os.path.join(sync_dir, "{}-{}.json".format(
+        clname, hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]))
+
+
+def load_state(path):
+    """동기화 기록. 없으면 빈 기록."""
+    try:
+        with open(path, 'rt') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return {'local': {}, 'remote': {}}
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wt') as f:
+        f.write(json.dumps(state))
+
+
+def _upload_changes(client, root, send, deletes):
+    """변경분을 tar.gz 스트림으로, 지울 목록을 NUL 구분 파일로 올림."""
+    sftp = client.open_sftp()
+    try:
+        if len(send) > 0:
+            with sftp.open(STAGE, 'wb') as f:
+                f.set_pipelined(True)
+                with gzip.GzipFile(fileobj=f, mode='wb',
+                                   compresslevel=COMPRESS_LEVEL) as gz:
+                    with tarfile.open(fileobj=gz, mode='w|',
+                                      dereference=True) as tar:
+                        for rel in send:
+                            tar.add(os.path.join(root, rel), arcname=rel,
+                                    recursive=False)
+        if len(deletes) > 0:
+            with sftp.open(DELETE_LIST, 'wb') as f:
+                f.write('\0'.join(deletes).encode('utf-8'))
+    finally:
+        sftp.close()
+
+
+def apply_cmd(dest, send, deletes):
+    """올린 변경분을 풀고 지울 파일을 지운 후 파일 목록을 출력하는 명령."""
+    cmds = ["mkdir -p {}".format(remote_path(dest)),
+            "cd {}".format(remote_path(dest))]
+    if len(send) > 0:
+        cmds += ['tar xzf "$HOME"/{}'.format(STAGE),
+                 'rm -f "$HOME"/{}'.format(STAGE)]
+    if len(deletes) > 0:
+        cmds += ['xargs -0 rm -f -- < "$HOME"/{}'.format(DELETE_LIST),
+                 'rm -f "$HOME"/{}'.format(DELETE_LIST)]
+    return ' && '.join(cmds + [list_cmd()])
+
+
+def sync_notebook(clname, local_dir='.', dest=None, delete=False,
+                  excludes=()):
+    """로컬 폴더를 노트북 인스턴스의 작업 폴더로 동기화.
+
+    Args:
+        clname (str): 클러스터명
+        local_dir (str): 로컬 폴더
+        dest (str): 원격 폴더. 없으면 `bilbo.cluster.NB_WORKDIR`
+        delete (bool): 로컬에 없는 원격 파일을 지움
+        excludes (list): 기본 외에 더 제외할 이름 패턴
+
+    Returns:
+        tuple: (보낸 상대 경로 리스트, 지운 상대 경로 리스트)
+    """
+    from bilbo.cluster import check_cluster, exec_instance_cmd, ssh_pool, \
+        FanoutResult, _host, NB_WORKDIR
+
+    clinfo = check_cluster(clname)
+    if 'notebook' not in clinfo:
+        raise RuntimeError("No notebook instance.")
+    dest = dest or NB_WORKDIR
+    excludes = EXCLUDES + tuple(excludes)
+    host = _host(clinfo['notebook'], clinfo['private_command'])
+    spath = state_path(clname, dest, local_dir)
+    state = load_state(spath)
+
+    local = local_manifest(local_dir, excludes, state['local'])
+    res = exec_instance_cmd(*host, "cd {} 2>/dev/null && {} || true".format(
+        remote_path(dest), list_cmd()), SYNC_TIMEOUT)
+    if not res.ok:
+        FanoutResult({host[2]: res}).log_failures("List remote files")
+        raise RuntimeError("Can not list '{}' on the notebook.".format(dest))
+    remote = parse_listing(res.stdout, excludes)
+    send, deletes = diff(local, remote, state['remote'], delete)
+    info("sync_notebook - {} to send, {} to delete".format(len(send),
+                                                           len(deletes)))
+
+    if len(send) + len(deletes) > 0:
+        client = ssh_pool.get(*host)
+        if client is None:
+            raise RuntimeError("Connection failed to '{}'".format(host[2]))
+        _upload_changes(client, local_dir, send, deletes)
+        res = exec_instance_cmd(*host, apply_cmd(dest, send, deletes),
+                                SYNC_TIMEOUT)
+        if not res.ok:
+            FanoutResult({host[2]: res}).log_failures("Apply sync")
+            raise RuntimeError("Can not apply changes to '{}'.".format(dest))
+        remote = parse_listing(res.stdout, excludes)
+
+    state = {'local': local,
+             'remote': {rel: rinfo + [local[rel][2]]
+                        for rel, rinfo in remote.items() if rel in local}}
+    save_state(spath, state)
+    return send, deletes
+
+
+def watch_notebook(clname, local_dir='.', dest=None, delete=False,
+                   excludes=(), interval=WATCH_INTERVAL):
+    """로컬 폴더가 바뀔 때마다 동기화. Ctrl-C 로 멈춘다.
+
+    로컬 파일들의 크기와 수정 시간만 주기적으로 확인하기에 가볍다.
+    """
+    all_excludes = EXCLUDES + tuple(excludes)
+    last = None
+    while True:
+        files = scan(local_dir, all_excludes)
+        if files != last:
+            send, deletes = sync_notebook(clname, local_dir, dest, delete,
+                                          excludes)
+            if last is not None or len(send) + len(deletes) > 0:
+                critical("Synced {} file(s), deleted {}.".format(
+                    len(send), len(deletes)))
+            last = files
+        time.sleep(interval)
@@ -0,0 +1,371 @@
+"""파일 배포 모듈.
+
+로컬 파일이나 폴더를 클러스터 인스턴스들에 보낸다. 폴더는 tar 로 한 번 묶어
+보내고 원격에서 풀며, 압축을 주면 gzip 으로 줄여 보낸다. 호스트마다 풀의 SSH
+연결에 SFTP 채널을 열어 동시에 올리고, 대상의 내용 해쉬(SHA-256)가 같은
+호스트는 건너뛴다.
+
+중계(relay) 모드에서는 시드 인스턴스(스케쥴러, 없으면 노트북)에 한 번만 올린
+후, 시드에 띄운 임시 HTTP 서버에서 나머지 인스턴스들이 VPC 안에서 받아간다.
+서버는 임의의 포트에서 무작위 토큰 경로로 올린 파일 하나만 내주고, 전송이
+끝나면 멈춘다. 받기에 실패한 호스트에는 직접 올린다. 로컬 업링크로는 한 벌만
+나가기에 큰 파일을 많은 워커에 보낼 때 쓴다.
+"""
+import os
+import gzip
+import shlex
+import shutil
+import tarfile
+import hashlib
+import secrets
+import tempfile
+
+from bilbo.util import info, warning, critical
+
+# 원격 홈 아래 올린 파일을 잠시 두는 폴더
+STAGE_DIR = '.bilbo_put'
+# 폴더를 보낸 대상에 남기는 내용 해쉬 파일
+DIGEST_FILE = '.bilbo_put.sha256'
+# 중계 모드에서 서버 포트를 기다리는 최대 시간(초)
+RELAY_START_TIMEOUT = 10
+# 호스트당 업로드 / 설치 제한 시간(초)
+PUT_TIMEOUT = 3600
+HASH_CHUNK = 1024 * 1024
+
+# 중계 모드에서 시드에 띄우는 HTTP 서버. 환경 변수의 토큰 경로로 한 파일만
+# 내주고, 운영체제가 고른 포트를 첫 줄에 출력한다.
+RELAY_SERVER = """
+import os, sys, hmac, shutil
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+path, bind = sys.argv[1:]
+token = "/" + os.environ.pop("BILBO_RELAY_TOKEN")
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not hmac.compare_digest(self.path, token):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Length",
+                             str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer((bind, 0), Handler)
+print(server.server_address[1], flush=True)
+server.serve_forever()
+"""
+
+
+def file_sha256(path):
+    """파일 내용의 SHA-256."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def iter_files(root):
+    """폴더 아래 모든 파일의 (상대 경로, 경로). 상대 경로 순으로."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            files.append((os.path.relpath(path, root).replace(os.sep, '/'),
+                          path))
+    return sorted(files)
+
+
+def tree_sha256(root):
+    """폴더 아래 파일들의 상대 경로와 내용으로 만든 SHA-256."""
+    h = hashlib.sha256()
+    for rel, path in iter_files(root):
+        h.update("{}\t{}\n".format(rel, file_sha256(path)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def remote_path(path):
+    """원격 쉘에서 쓸 경로. `~/` 는 홈으로 확장되게 두고 나머지는 따옴표로."""
+    if path == '~':
+        return '"$HOME"'
+    if path.startswith('~/'):
+        return '"$HOME"/' + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+class Payload:
+    """원격으로 보낼 한 벌의 파일.
+
+    Attributes:
+        src (str): 로컬 원본 경로
+        is_dir (bool): 원본이 폴더인가
+        compress (bool): gzip 으로 압축해 보내는가
+        digest (str): 원본 내용의 SHA-256 (폴더는 `tree_sha256`)
+        path (str): 실제로 올릴 로컬 파일 (원본 또는 묶은 파일)
+        sha256 (str): 올릴 파일의 SHA-256
+        name (str): 원격 임시 폴더 안의 파일 이름
+    """
+
+    def __init__(self, src, compress, tmp_dir):
+        self.src = src.rstrip(os.sep) or src
+        self.is_dir = os.path.isdir(self.src)
+        self.compress = compress
+        base = os.path.basename(os.path.abspath(self.src))
+        if self.is_dir:
+            self.digest = tree_sha256(self.src)
+            ext = '.tar.gz' if compress else '.tar'
+            self.path = os.path.join(tmp_dir, base + ext)
+            with tarfile.open(self.path, 'w:gz' if compress else 'w') as tar:
+                for name in sorted(os.listdir(self.src)):
+                    tar.add(os.path.join(self.src, name), arcname=name)
+        else:
+            self.digest = file_sha256(self.src)
+            ext = '.gz' if compress else ''
+            self.path = self.src
+            if compress:
+                self.path = os.path.join(tmp_dir, base + ext)
+                with open(self.src, 'rb') as fi, \
+                        gzip.open(self.path, 'wb') as fo:
+                    shutil.copyfileobj(fi, fo)
+        self.sha256 = self.digest if self.path == self.src else \
+            file_sha256(self.path)
+        self.name = "{}-{}{}".format(self.digest[:16], base, ext)
+        self.size = os.path.getsize(self.path)
+
+    @property
+    def stage(self):
+        """원격 쉘에서 쓸 임시 파일 경로."""
+        return '"$HOME"/{}/{}'.format(STAGE_DIR, shlex.quote(self.name))
+
+    def check_cmd(self, dst):
+        """대상의 현재 내용 해쉬를 출력하는 명령."""
+        if self.is_dir:
+            return "cat {} 2>/dev/null || true".format(
+                remote_path(dst.rstrip('/') + '/' + DIGEST_FILE))
+        return "sha256sum {} 2>/dev/null || true".format(remote_path(dst))
+
+    def install_cmd(self, dst):
+        """임시 파일을 확인하고 대상에 풀거나 옮긴 후 임시 파일을 지우는 명령."""
+        verify = 'test "$(sha256sum < {} | cut -d" " -f1)" = {}'.format(
+            self.stage, self.sha256)
+        if self.is_dir:
+            rdst = remote_path(dst.rstrip('/'))
+            rdigest = remote_path(dst.rstrip('/') + '/' + DIGEST_FILE)
+            cmds = ["mkdir -p {}".format(rdst),
+                    "tar x{}f {} -C {}".format('z' if self.compress else '',
+                                               self.stage, rdst),
+                    "echo {} > {}".format(self.digest, rdigest),
+                    "rm -f {}".format(self.stage)]
+        else:
+            rdst = remote_path(dst)
+            part = remote_path(dst + '.bilbo_part')
+            if self.compress:
+                copy = "gunzip -c {} > {}".format(self.stage, part)
+            else:
+                copy = "cp {} {}".format(self.stage, part)
+            cmds = ['mkdir -p "$(dirname {})"'.format(rdst), copy,
+                    'test "$(sha256sum < {} | cut -d" " -f1)" = {}'.
+                    format(part, self.digest),
+                    "mv {} {}".format(part, rdst),
+                    "rm -f {}".format(self.stage)]
+        return ' && '.join([verify] + cmds)
+
+
+def _is_current(hres, payload):
+    """해쉬 확인 결과가 보낼 내용과 같은가?"""
+    return hres.ok and len(hres.stdout) > 0 and \
+        hres.stdout[0].split()[:1] == [payload.digest]
+
+
+def upload(host, local, remote):
+    """풀의 연결에 SFTP 채널을 열어 파일 올리기.
+
+    Args:
+        host (tuple): (ssh_user, ssh_private_key, ip)
+        local (str): 로컬 파일 경로
+        remote (str): 원격 홈 기준 상대 경로
+
+    Returns:
+        bilbo.cluster.HostResult: 결과
+    """
+    from bilbo.cluster import ssh_pool, HostResult
+
+    ip = host[2]
+    client = ssh_pool.get(*host)
+    if client is None:
+        return HostResult(ip, error="connection failed")
+    try:
+        sftp = client.open_sftp()
+        try:
+            try:
+                sftp.mkdir(os.path.dirname(remote))
+            except IOError:
+                # 이미 있음
+                pass
+            sftp.put(local, remote)
+        finally:
+            sftp.close()
+    except Exception as e:
+        return HostResult(ip, error=str(e))
+    return HostResult(ip, exit_code=0)
+
+
+def _put_direct(hosts, payload, dst):
+    """호스트마다 직접 올리고 설치."""
+    from bilbo.cluster import exec_instance_cmd, fanout_call
+
+    remote = "{}/{}".format(STAGE_DIR, payload.name)
+    cmd = payload.install_cmd(dst)
+
+    def _put(host):
+        res = upload(host, payload.path, remote)
+        if not res.ok:
+            return res
+        return exec_instance_cmd(*host, cmd, PUT_TIMEOUT)
+
+    return fanout_call(hosts, _put)
+
+
+def _relay_serve_cmd(payload, seed_ip, token):
+    """시드에 중계 서버를 띄우고 PID 와 포트를 출력하는 명령."""
+    portf = '"$HOME"/{}/{}'.format(STAGE_DIR,
+                                   shlex.quote(payload.name + '.port'))
+    wait = int(RELAY_START_TIMEOUT * 10)
+    return "rm -f {portf} && {{ BILBO_RELAY_TOKEN={token} nohup python -c " \
+        "{script} {path} {bind} > {portf} 2> /dev/null < /dev/null & " \
+        "echo $!; }} && for i in $(seq {wait}); do test -s {portf} && " \
+        "break; sleep 0.1; done; cat {portf}; rm -f {portf}".format(
+            portf=portf, token=token, script=shlex.quote(RELAY_SERVER),
+            path=payload.stage, bind=seed_ip, wait=wait)
+
+
+def _put_relay(seed, seed_ip, hosts, payload, dst):
+    """시드에 한 번 올리고, 나머지 호스트들은 시드의 HTTP 서버에서 받음.
+
+    서버는 시드의 사설 IP 에서 임의의 포트로 열리기에, 보안 그룹이 인스턴스
+    사이의 TCP 통신을 허용해야 한다. 서버를 띄우지 못하거나 받기에 실패한
+    호스트에는 직접 올린다.
+
+    Args:
+        seed (tuple): 시드의 호스트 튜플
+        seed_ip (str): 다른 인스턴스에서 시드에 접속할 (사설) IP
+        hosts (list): 받을 호스트 튜플 리스트. 시드가 있으면 시드는 마지막에
+            설치
+    """
+    from bilbo.cluster import exec_instance_cmd, fanout_cmd, FanoutResult
+
+    results = {}
+    res = upload(seed, payload.path, "{}/{}".format(STAGE_DIR, payload.name))
+    if not res.ok:
+        return FanoutResult({host[2]: res for host in hosts})
+
+    critical("Relay from {} to {} host(s).".format(seed[2], len(hosts)))
+    others = [host for host in hosts if host[2] != seed[2]]
+    token = secrets.token_urlsafe(24)
+    res = exec_instance_cmd(*seed, _relay_serve_cmd(payload, seed_ip, token))
+    pid = res.stdout[0].strip() if res.ok and len(res.stdout) > 0 else None
+    try:
+        if pid is None or len(res.stdout) < 2:
+            FanoutResult({seed[2]: res}).log_failures("Start relay server")
+            retry = others
+        else:
+            url = "http://{}:{}/{}".format(seed_ip, res.stdout[1].strip(),
+                                           token)
+            fetch = "mkdir -p {} && curl -sf --retry 5 " \
+                "--retry-connrefused -o {} {} && {}".format(
+                    '"$HOME"/' + STAGE_DIR, payload.stage, url,
+                    payload.install_cmd(dst))
+            fres = fanout_cmd(others, fetch, timeout=PUT_TIMEOUT)
+            results.update(fres.results)
+            retry = [host for host in others if not fres[host[2]].ok]
+    finally:
+        if pid is not None:
+            exec_instance_cmd(*seed, "kill {}".format(pid))
+
+    if len(retry) > 0:
+        warning("Relay failed on {} host(s). Send directly.".format(
+            len(retry)))
+        results.update(_put_direct(retry, payload, dst).results)
+
+    if seed[2] in [host[2] for host in hosts]:
+        results[seed[2]] = exec_instance_cmd(*seed, payload.install_cmd(dst),
+                                             PUT_TIMEOUT)
+    else:
+        exec_instance_cmd(*seed, "rm -f {}".format(payload.stage))
+    return FanoutResult(results)
+
+
+def _relay_seed(clinfo):
+    """중계 모드의 시드 인스턴스 (역할, 인스턴스 정보). 스케쥴러 우선."""
+    for role in ('scheduler', 'notebook'):
+        if role in clinfo:
+            return role, clinfo[role]
+
+
+def put_files(clname, src, dst, role=None, compress=False, relay=False,
+              force=False):
+    """로컬 파일이나 폴더를 클러스터 인스턴스들에 보냄.
+
+    파일은 dst 경로로 (dst 가 `/` 로 끝나면 그 아래 같은 이름으로), 폴더는
+    내용을 dst 폴더 아래로 보낸다.
+
+    Args:
+        clname (str): 클러스터명
+        src (str): 로컬 파일 또는 폴더 경로
+        dst (str): 원격 경로. `~/` 로 시작하면 원격 홈 기준
+        role (str): notebook, scheduler, worker 중 하나. 없으면 모두
+        compress (bool): gzip 으로 압축해 보냄
+        relay (bool): 시드 인스턴스를 거쳐 VPC 안에서 나눠 받음
+        force (bool): 내용이 같아도 보냄
+
+    Returns:
+        bool: 모든 호스트에 보냈거나 이미 같으면 True
+    """
+    from bilbo.cluster import check_cluster, cluster_hosts, fanout_cmd, \
+        _host
+
+    clinfo = check_cluster(clname)
+    hosts = [host for _, host in cluster_hosts(clinfo, role)]
+    if len(hosts) == 0:
+        print("No instance to put files.")
+        return True
+    if not os.path.isdir(src) and dst.endswith('/'):
+        dst += os.path.basename(src)
+
+    with tempfile.TemporaryDirectory(prefix='bilbo_put_') as tmp_dir:
+        payload = Payload(src, compress, tmp_dir)
+        info("put_files - {} ({} bytes) to {}".format(payload.name,
+                                                      payload.size, dst))
+        unchanged = []
+        if not force:
+            res = fanout_cmd(hosts, payload.check_cmd(dst))
+            unchanged = [hres.ip for hres in res if _is_current(hres, payload)]
+        targets = [host for host in hosts if host[2] not in unchanged]
+
+        critical("Put '{}' to {} host(s) ({} unchanged).".format(
+            src, len(targets), len(unchanged)))
+        if len(targets) == 0:
+            res = None
+        elif relay and len(targets) > 1:
+            _, scfg = _relay_seed(clinfo)
+            seed = _host(scfg, clinfo['private_command'])
+            res = _put_relay(seed, scfg['private_ip'], targets, payload, dst)
+        else:
+            if relay:
+                warning("Only one host to put. Send directly.")
+            res = _put_direct(targets, payload, dst)
+
+    failed = res.failed() if res is not None else []
+    if len(failed) > 0:
+        res.log_failures("Put '{}'".format(src))
+    print("{} host(s): {} sent, {} unchanged, {} failed".format(
+        len(hosts), len(targets) - len(failed), len(unchanged), len(failed)))
+    return len(failed) == 0
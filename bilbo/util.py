@@ -1,7 +1,11 @@
 """각종 유틸리티 함수."""
 import os
 import sys
+import time
+import random
 import logging
+import threading
+from contextlib import contextmanager
 from configparser import ConfigParser
 from logging.handlers import RotatingFileHandler
 import re
@@ -19,6 +23,10 @@ log_dir = os.path.join(bilbo_dir, 'logs')
 log_path = os.path.join(log_dir, LOG_FILE)
 prof_dir = os.path.join(bilbo_dir, 'profiles')
 clust_dir = os.path.join(bilbo_dir, 'clusters')
+catalog_path = os.path.join(bilbo_dir, 'instance_types.json')
+store_path = os.path.join(bilbo_dir, 'bilbo.db')
+prof_cache_dir = os.path.join(bilbo_dir, 'cache', 'profiles')
+sync_dir = os.path.join(bilbo_dir, 'sync')
 
 
 def make_dir(dir_name, log=True):
@@ -33,8 +41,11 @@ def make_dir(dir_name, log=True):
         sys.exit(-1)
 
 
-def _check_dirs():
-    """필요한 디렉토리 체크."""
+def check_dirs():
+    """필요한 디렉토리 체크.
+
+    임포트 시점이 아닌, 디렉토리가 필요한 시점에 부른다.
+    """
     if not os.path.isdir(bilbo_dir):
         make_dir(bilbo_dir, False)
     if not os.path.isdir(log_dir):
@@ -45,9 +56,6 @@ def _check_dirs():
         make_dir(clust_dir, False)
 
 
-_check_dirs()
-
-
 def log_level_from_verbosity(verbosity):
     if verbosity == 0:
         return 40
@@ -71,6 +79,7 @@ def query_stream_log_handler(logger):
 def set_log_verbosity(verbosity):
     """Verbosity로 로그 레벨 지정."""
     level = log_level_from_verbosity(verbosity)
+    check_dirs()
     rotfile = RotatingFileHandler(
         log_path,
         maxBytes=1024**2,
@@ -116,8 +125,196 @@ def critical(msg):
     logging.getLogger().critical(msg)
 
 
+class RetryPolicy:
+    """지수 백오프와 지터를 가진 재시도 정책.
+
+    처음에는 짧은 간격으로 확인해 준비되면 바로 알아채고, 시도가 거듭될수록
+    간격을 늘려 호스트에 부담을 주지 않는다. 전체 제한 시간이 지나면 멈춘다.
+    """
+
+    DEFAULTS = {
+        'initial': 0.5,
+        'multiplier': 1.5,
+        'cap': 10.0,
+        'jitter': 0.2,
+        'deadline': 300.0
+    }
+
+    def __init__(self, initial=None, multiplier=None, cap=None, jitter=None,
+                 deadline=None):
+        """초기화.
+
+        Args:
+            initial (float): 첫 대기 시간(초)
+            multiplier (float): 시도마다 대기 시간에 곱할 값
+            cap (float): 최대 대기 시간(초)
+            jitter (float): 대기 시간에서 무작위로 뺄 비율 (0 ~ 1)
+            deadline (float): 전체 제한 시간(초)
+        """
+        dft = RetryPolicy.DEFAULTS
+        self.initial = initial if initial is not None else dft['initial']
+        self.multiplier = multiplier if multiplier is not None \
+            else dft['multiplier']
+        self.cap = cap if cap is not None else dft['cap']
+        self.jitter = jitter if jitter is not None else dft['jitter']
+        self.deadline = deadline if deadline is not None \
+            else dft['deadline']
+
+    @staticmethod
+    def from_config(cfg):
+        """프로파일의 `retry` 설정으로 정책 생성."""
+        return RetryPolicy(**(cfg or {}))
+
+    def to_config(self):
+        """클러스터 정보에 기록할 설정."""
+        return {k: getattr(self, k) for k in RetryPolicy.DEFAULTS}
+
+    def delay(self, attempt):
+        """시도 번호(0 부터)에 해당하는 대기 시간(초)."""
+        base = min(self.cap, self.initial * self.multiplier ** attempt)
+        return base * (1 - self.jitter * random.random())
+
+    def attempts(self, max_attempts=None, sleep=None):
+        """시도 번호를 돌려주며, 다음 시도 전에 대기하는 이터레이터.
+
+        성공하면 루프를 빠져나오면 된다. 전체 제한 시간이나 최대 시도 수가
+        넘으면 이터레이션이 끝난다.
+
+        Args:
+            max_attempts (int): 최대 시도 수. None 이면 제한 시간까지
+            sleep: 대기 함수. 기본은 `time.sleep`
+
+        Yields:
+            int: 0 부터 시작하는 시도 번호
+        """
+        sleep = sleep or time.sleep
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            yield attempt
+            attempt += 1
+            if max_attempts is not None and attempt >= max_attempts:
+                return
+            delay = self.delay(attempt - 1)
+            if time.monotonic() - start + delay > self.deadline:
+                return
+            sleep(delay)
+
+    async def async_attempts(self, max_attempts=None, sleep=None):
+        """`attempts` 의 asyncio 버전. 대기중에 이벤트 루프를 막지 않는다.
+
+        Args:
+            max_attempts (int): 최대 시도 수. None 이면 제한 시간까지
+            sleep: 대기 코루틴 함수. 기본은 `asyncio.sleep`
+        """
+        import asyncio
+
+        sleep = sleep or asyncio.sleep
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            yield attempt
+            attempt += 1
+            if max_attempts is not None and attempt >= max_attempts:
+                return
+            delay = self.delay(attempt - 1)
+            if time.monotonic() - start + delay > self.deadline:
+                return
+            await sleep(delay)
+
+    def __repr__(self):
+        return "<RetryPolicy {}>".format(self.to_config())
+
+
+_retry_policy = RetryPolicy()
+
+
+def set_retry_policy(cfg):
+    """프로세스 기본 재시도 정책을 설정에서 지정."""
+    global _retry_policy
+    _retry_policy = RetryPolicy.from_config(cfg)
+    info("set_retry_policy: {}".format(_retry_policy))
+    return _retry_policy
+
+
+def get_retry_policy():
+    """프로세스 기본 재시도 정책."""
+    return _retry_policy
+
+
+_timing_lock = threading.Lock()
+
+
+def _get_timing(clinfo):
+    with _timing_lock:
+        if 'timing' not in clinfo:
+            clinfo['timing'] = {'started': time.time(), 'spans': [],
+                                'counters': {}}
+        return clinfo['timing']
+
+
+@contextmanager
+def timing_span(clinfo, name):
+    """단계별 소요 시간을 클러스터 정보에 기록하는 컨텍스트.
+
+    `clinfo['timing']['spans']` 에 (이름, 시작 오프셋, 소요 시간) 을 남긴다.
+    여러 스레드에서 동시에 써도 된다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        name (str): 단계 이름. 하위 단계는 `notebook.git` 처럼 점으로 구분
+    """
+    timing = _get_timing(clinfo)
+    t0 = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - t0
+        with _timing_lock:
+            timing['spans'].append({
+                'name': name,
+                'start': round(t0 - timing['started'], 3),
+                'elapsed': round(elapsed, 3)
+            })
+        info("timing: {} {:.3f}s".format(name, elapsed))
+
+
+def timing_count(clinfo, name, value):
+    """소요 시간 외의 수치(재시도 수 등)를 클러스터 정보에 누적."""
+    timing = _get_timing(clinfo)
+    with _timing_lock:
+        counters = timing['counters']
+        counters[name] = round(counters.get(name, 0) + value, 3)
+
+
+def format_timing(timing):
+    """기록된 단계별 소요 시간을 표시용 문자열 리스트로.
+
+    Returns:
+        list: 시작 순서로 정렬된 행 문자열 리스트
+    """
+    spans = sorted(timing['spans'], key=lambda s: (s['start'], s['name']))
+    total = max([s['start'] + s['elapsed'] for s in spans] + [0])
+    width = max([len(s['name']) for s in spans] + [len('Total')])
+    lines = ["{:<{w}}  {:>10}  {:>9}".format('Phase', 'Start', 'Elapsed',
+                                             w=width + 4)]
+    for span in spans:
+        depth = span['name'].count('.')
+        name = '  ' * depth + span['name']
+        lines.append("{:<{w}}  +{:8.2f}s  {:8.2f}s".format(
+            name, span['start'], span['elapsed'], w=width + 4))
+    lines.append("{:<{w}}  {:>10}  {:8.2f}s".format('Total', '', total,
+                                                     w=width + 4))
+    for name, value in sorted(timing.get('counters', {}).items()):
+        lines.append("{:<{w}}  {:>10}  {:>9}".format(name, '', value,
+                                                    w=width + 4))
+    return lines
+
+
 def iter_profiles():
     """프로파일을 순회."""
+    if not os.path.isdir(prof_dir):
+        return
     for prof in os.listdir(prof_dir):
         if prof.endswith('.json'):
             yield prof
@@ -125,6 +322,8 @@ def iter_profiles():
 
 def iter_clusters():
     """프로파일을 순회."""
+    if not os.path.isdir(clust_dir):
+        return
     for cl in os.listdir(clust_dir):
         if cl.endswith('.json'):
             name = '.'.join(cl.split('.')[0:-1])
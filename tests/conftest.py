@@ -0,0 +1,106 @@
+"""테스트 공용 픽스쳐."""
+import io
+import os
+import types
+import shutil
+import subprocess
+
+import pytest
+
+import bilbo.store as store
+
+
+@pytest.fixture
+def tmp_store(tmp_path, monkeypatch):
+    """임시 파일의 클러스터 상태 저장소."""
+    cdir = tmp_path / 'clusters'
+    cdir.mkdir()
+    monkeypatch.setattr(store, 'store_path', str(tmp_path / 'bilbo.db'))
+    monkeypatch.setattr(store, 'clust_dir', str(cdir))
+    monkeypatch.setattr('bilbo.util.clust_dir', str(cdir))
+    store.close()
+    yield cdir
+    store.close()
+
+
+class EC2Client:
+    """호출을 기록하는 boto EC2 client 대역. 응답은 API 이름별로 주거나
+    인자를 받는 함수로 준다."""
+
+    def __init__(self, **responses):
+        self.calls = []
+        self.responses = responses
+
+    def __getattr__(self, name):
+        def _call(**kwargs):
+            self.calls.append((name, kwargs))
+            res = self.responses.get(name, {})
+            return res(**kwargs) if callable(res) else res
+        return _call
+
+
+@pytest.fixture
+def ec2_client():
+    """EC2 client 대역 클래스."""
+    return EC2Client
+
+
+class _LocalFile(io.FileIO):
+    def set_pipelined(self, pipelined=True):
+        pass
+
+
+class LocalSFTP:
+    """paramiko.SFTPClient 대신 로컬 홈 폴더에 읽고 쓰는 대역."""
+
+    def __init__(self, home):
+        self.home = home
+
+    def open(self, filename, mode='r'):
+        return _LocalFile(str(self.home / filename), mode.replace('b', ''))
+
+    def mkdir(self, path):
+        (self.home / path).mkdir()
+
+    def put(self, localpath, remotepath):
+        shutil.copyfile(localpath, str(self.home / remotepath))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def local_shell(tmp_path, monkeypatch):
+    """인스턴스 명령과 SFTP 를 로컬 bash 와 폴더로 실행.
+
+    `bilbo.cluster.exec_instance_cmd` 는 호스트(IP)마다 `tmp_path/hosts/IP`
+    를 HOME 으로 하는 `bash -c` 로 명령을 실행하고, `ssh_pool.get` 의 연결은
+    같은 폴더에 SFTP 로 읽고 쓴다.
+
+    Returns:
+        function: IP 를 받아 그 호스트의 홈 폴더(pathlib.Path)를 줌
+    """
+    import bilbo.cluster as bc
+
+    def _home(ip):
+        home = tmp_path / 'hosts' / ip
+        home.mkdir(parents=True, exist_ok=True)
+        return home
+
+    def _exec(ssh_user, ssh_private_key, ip, cmd, timeout=None,
+              retry_count=None):
+        home = _home(ip)
+        proc = subprocess.run(['bash', '-c', cmd], cwd=str(home),
+                              env=dict(os.environ, HOME=str(home)),
+                              stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              timeout=timeout or 60)
+        return bc.HostResult(ip, proc.stdout.decode('utf-8').splitlines(True),
+                             proc.stderr, proc.returncode)
+
+    def _get(ssh_user, ssh_private_key, ip, retry_count=None):
+        return types.SimpleNamespace(open_sftp=lambda: LocalSFTP(_home(ip)))
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    monkeypatch.setattr(bc.ssh_pool, 'get', _get)
+    return _home
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+
+import pytest
+
+import bilbo.aio as aio
+import bilbo.cluster as bc
+from bilbo.profile import DaskProfile
+from bilbo.util import RetryPolicy
+
+HOSTS = [('ubuntu', 'key.pem', '10.0.0.{}'.format(i)) for i in range(3)]
+
+
+def _record_exec(monkeypatch, reply=None):
+    """명령을 기록하고 정상 종료로 답하는 대역."""
+    lock = threading.Lock()
+    calls = []
+
+    def _exec(user, private_key, ip, cmd, timeout=None, retry_count=None):
+        with lock:
+            calls.append((ip, cmd))
+        stdout = reply(cmd) if reply is not None else []
+        return bc.HostResult(ip, stdout, b'', 0)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    return calls
+
+
+def test_run(monkeypatch):
+    """동기 API 를 실행기 스레드나 루프가 도는 스레드에서 불러도 끝나기."""
+    calls = _record_exec(monkeypatch)
+    # 실행기를 채울 만큼 동시에 동기 fanout 을 부름
+    monkeypatch.setattr(aio, 'EXECUTOR_WORKERS', 2)
+
+    async def _nested():
+        return await asyncio.gather(*[
+            aio.run_blocking(bc.fanout_cmd, HOSTS, 'true') for _ in range(4)])
+
+    results = aio.run(_nested())
+    assert [len(res) for res in results] == [3, 3, 3, 3]
+    assert len(calls) == 12
+
+    async def _in_loop():
+        return bc.fanout_cmd(HOSTS[:1], 'true')
+
+    assert asyncio.run(_in_loop()).ok
+
+
+def test_fanout_on_result(monkeypatch):
+    """결과가 나올 때마다 알리고, 명령 함수의 예외는 실패 결과로."""
+    _record_exec(monkeypatch)
+
+    def _cmd(ip):
+        if ip == '10.0.0.1':
+            raise ValueError("no command")
+        return 'echo ' + ip
+
+    shown = []
+    res = bc.fanout_cmd(HOSTS, _cmd, concurrency=1, on_result=shown.append)
+    assert sorted(r.ip for r in shown) == ['10.0.0.0', '10.0.0.1', '10.0.0.2']
+    assert [r.ip for r in res.failed()] == ['10.0.0.1']
+    assert res['10.0.0.1'].error == 'no command'
+
+
+def _notebook_clinfo():
+    return {'private_command': False, 'type': 'dask',
+            'notebook': {'public_ip': '1.1.1.2', 'ssh_user': 'ubuntu',
+                         'ssh_private_key': 'key.pem'},
+            'scheduler': {'public_ip': '1.1.1.1',
+                          'private_dns_name': 'ip-10-0-0-1.internal'}}
+
+
+def _notebook_profile(**kw):
+    cfg = {"instance": {"ami": "ami-000", "ec2type": "t3.micro",
+                        "keyname": "key", "ssh_user": "ubuntu",
+                        "ssh_private_key": "key.pem"},
+           "notebook": {}, "dask": {}}
+    cfg.update(kw)
+    return DaskProfile(cfg)
+
+
+def test_start_notebook(monkeypatch):
+    """노트북 설정 명령을 차례로 보내고 URL 이 나올 때까지 기다리기."""
+    polls = []
+
+    def _reply(cmd):
+        if cmd.startswith('jupyter notebook list'):
+            polls.append(cmd)
+            if len(polls) < 3:
+                return ['Currently running servers:\n']
+            return ['Currently running servers:\n',
+                    'http://0.0.0.0:8888/?token=abc\n']
+        return []
+
+    calls = _record_exec(monkeypatch, _reply)
+    monkeypatch.setattr(bc, 'get_aws_config', lambda: ('ak', 'sk', 'rg'))
+    policy = RetryPolicy(initial=0.01, jitter=0, deadline=5)
+    monkeypatch.setattr(aio, 'get_retry_policy', lambda: policy)
+    clinfo = _notebook_clinfo()
+    bc.start_notebook(_notebook_profile(), clinfo)
+
+    assert clinfo['notebook_url'] == 'http://1.1.1.2:8888/?token=abc'
+    cmds = [cmd for _, cmd in calls]
+    assert 'aws_secret_access_key = sk' in cmds[0]
+    assert cmds[0].endswith('; mkdir -p ~/works')
+    assert 'http://1.1.1.1:8787' in cmds[1]
+    assert 'DASK_SCHEDULER_ADDRESS=tcp://ip-10-0-0-1.internal:8786' in cmds[2]
+    assert 'jupyter lab' in cmds[2]
+    assert len(polls) == 3 and len(cmds) == 6
+    spans = [sp['name'] for sp in clinfo['timing']['spans']]
+    assert spans == ['notebook.setup', 'notebook.labext', 'notebook.jupyter',
+                     'notebook.url']
+
+    # 부트스트랩된 노트북은 완료 확인 후 URL 만
+    calls.clear()
+    clinfo = _notebook_clinfo()
+    bc.start_notebook(_notebook_profile(), clinfo, bootstrapped=True,
+                      retry_count=1)
+    assert calls[0][1] == bc._bootstrap_wait_cmd()
+    assert 'jupyter lab' not in ''.join(cmd for _, cmd in calls)
+
+    polls.clear()
+    with pytest.raises(TimeoutError):
+        bc.start_notebook(_notebook_profile(), _notebook_clinfo(),
+                          retry_count=1)
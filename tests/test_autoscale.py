@@ -0,0 +1,119 @@
+"""자동 스케일 테스트."""
+import pytest
+
+from bilbo.autoscale import decide, resolve_config
+
+
+def _load(processing=0, queued=0, hosts=4, nthreads=16, memory=0,
+          memory_limit=4 * 16 * 2**30):
+    return {'processing': processing, 'queued': queued, 'unrunnable': 0,
+            'workers': hosts, 'hosts': hosts, 'nthreads': nthreads,
+            'memory': memory, 'memory_limit': memory_limit}
+
+
+def test_resolve_config():
+    with pytest.raises(RuntimeError, match=r".*maximum.*"):
+        resolve_config({})
+    cfg = resolve_config({'autoscale': {'min': 1, 'max': 10}}, max=20,
+                         interval=None)
+    assert cfg['min'] == 1
+    assert cfg['max'] == 20
+    assert cfg['interval'] == 30
+    with pytest.raises(RuntimeError, match=r".*less than minimum.*"):
+        resolve_config({'autoscale': {'min': 5, 'max': 10}}, max=2)
+
+
+def test_decide():
+    cfg = resolve_config({'autoscale': {'min': 1, 'max': 10,
+                                        'up_cooldown': 60,
+                                        'down_cooldown': 300}})
+    # 호스트당 4 스레드, 스레드당 2 태스크 -> 호스트당 8 태스크
+    assert decide(_load(processing=32), 4, cfg, 0, None) == (4, 'steady')
+    assert decide(_load(processing=64), 4, cfg, 0, None) == (8, 'scale_up')
+    assert decide(_load(processing=500), 4, cfg, 0, None) == (10, 'scale_up')
+    assert decide(_load(processing=8), 4, cfg, 0, None) == (1, 'scale_down')
+
+    # 쿨다운
+    assert decide(_load(processing=64), 4, cfg, 100, 50) == \
+        (4, 'up_cooldown')
+    assert decide(_load(), 4, cfg, 100, 0) == (4, 'down_cooldown')
+    assert decide(_load(), 4, cfg, 400, 0) == (1, 'scale_down')
+
+    # 메모리를 담을 수 있는 만큼은 유지
+    mem = int(4 * 16 * 2**30 * 0.7)
+    assert decide(_load(memory=mem), 4, cfg, 0, None) == (4, 'steady')
+
+    # 범위 밖은 바로 맞춤
+    assert decide(_load(), 0, cfg, 10, 5) == (1, 'below_min')
+    assert decide(_load(), 12, cfg, 10, 5) == (10, 'above_max')
+
+    # 워커가 없으면 태스크가 있을 때 하나
+    cfg['min'] = 0
+    assert decide(_load(hosts=0, nthreads=0, processing=3), 0, cfg, 0,
+                  None) == (1, 'scale_up')
+
+
+def test_decide_groups():
+    """워커 그룹이 여럿이면 다른 그룹의 워커 수를 빼고 결정."""
+    cfg = resolve_config({'autoscale': {'min': 1, 'max': 10}})
+    # 8 호스트분 부하를 그룹 [4, 4] 가 이미 처리중
+    load = _load(processing=64, hosts=8, nthreads=32,
+                 memory_limit=8 * 16 * 2**30)
+    assert decide(load, 4, cfg, 0, None, others=4) == (4, 'steady')
+    load['processing'] = 96
+    assert decide(load, 4, cfg, 0, None, others=4) == (8, 'scale_up')
+    load['processing'] = 8
+    assert decide(load, 4, cfg, 0, None, others=4) == (1, 'scale_down')
+
+
+def test_run_groups(monkeypatch):
+    """그룹 하나만 바꾸고, 실패한 변경으로는 쿨다운을 시작하지 않음."""
+    import bilbo.cluster as bc
+    from bilbo import autoscale
+
+    clinfo = {'type': 'dask', 'worker': [
+        {'instances': [{}] * 4, 'count': 4},
+        {'instances': [{}] * 4, 'count': 4}]}
+    records = []
+    scaled = []
+    sleeps = []
+
+    def _scale(clname, count, group):
+        scaled.append((count, group))
+        if len(scaled) == 1:
+            raise RuntimeError("insufficient capacity")
+
+    def _sleep(sec):
+        sleeps.append(sec)
+        if len(sleeps) == 2:
+            raise KeyboardInterrupt()
+
+    monkeypatch.setattr(bc, 'check_cluster', lambda clname: clinfo)
+    monkeypatch.setattr(bc, 'scale_cluster', _scale)
+    monkeypatch.setattr(autoscale, 'poll_scheduler', lambda clinfo: _load(
+        processing=96, hosts=8, nthreads=32, memory_limit=8 * 16 * 2**30))
+    monkeypatch.setattr(autoscale, 'log_decision',
+                        lambda clname, record: records.append(record))
+    monkeypatch.setattr(autoscale.time, 'sleep', _sleep)
+
+    with pytest.raises(KeyboardInterrupt):
+        autoscale.run('test', max=10, group=1)
+    # 전체 12 호스트 중 다른 그룹의 4 를 뺀 8, 실패 후 바로 다시 시도
+    assert scaled == [(8, 1), (8, 1)]
+    assert [r['reason'] for r in records] == ['scale_up', 'scale_up']
+    assert records[0]['error'] == "insufficient capacity"
+    assert records[0]['others'] == 4
+
+
+def test_poll_scheduler(monkeypatch, caplog):
+    """출력 없이 끝난 부하 확인은 경고를 남기고 None."""
+    import bilbo.cluster as bc
+    from bilbo.autoscale import poll_scheduler
+
+    res = bc.HostResult('1.1.1.1', [], b'', 0)
+    monkeypatch.setattr(bc, 'run_on_scheduler', lambda *a: res)
+    assert poll_scheduler({}) is None
+    assert "Can not poll scheduler load" in caplog.text
+
+    res.stdout = ['{"processing": 3}\n']
+    assert poll_scheduler({}) == {'processing': 3}
@@ -0,0 +1,20 @@
+"""오케스트레이션 벤치마크 하네스 테스트."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'benchmarks'))
+
+from bench_cluster import run_once  # noqa
+
+
+def test_bench_smoke():
+    """가짜 백엔드로 생성부터 제거까지 실행."""
+    res = run_once(3, fail_rate=0.3)
+    assert set(res['elapsed']) == {'create', 'start', 'stop', 'destroy'}
+    # 노트북, 스케쥴러, 워커 3 대에 한 번씩만 연결
+    assert res['ssh_connects'] == 5
+    assert res['calls']['api.run_instances'] == 3
+    assert res['calls']['api.terminate_instances'] == 1
+    # 대쉬보드 확인은 이벤트 루프에서 한 번
+    assert res['calls']['http.8787'] == 1
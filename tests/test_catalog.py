@@ -0,0 +1,34 @@
+"""인스턴스 타입 카탈로그 테스트."""
+import bilbo.catalog as cat
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def describe_instance_types(self, InstanceTypes):
+        self.calls.append(InstanceTypes)
+        return {'InstanceTypes': [{
+            'InstanceType': t,
+            'VCpuInfo': {'DefaultVCpus': 4, 'DefaultCores': 2,
+                         'DefaultThreadsPerCore': 2},
+            'MemoryInfo': {'SizeInMiB': 16384}
+        } for t in InstanceTypes]}
+
+
+def test_catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(cat, 'catalog_path', str(tmp_path / 'types.json'))
+    monkeypatch.setattr(cat, '_catalog', None)
+    client = FakeClient()
+
+    hw = cat.get_instance_type('m5.xlarge', client)
+    assert hw == {'vcpus': 4, 'cores': 2, 'threads_per_core': 2,
+                  'memory': 16 * 1024 ** 3}
+    # 캐쉬에 있으면 다시 조회하지 않음
+    cat.get_instance_types(['m5.xlarge', 'r5.large'], client)
+    assert client.calls == [['m5.xlarge'], ['r5.large']]
+
+    # 파일에 저장된 캐쉬 사용
+    monkeypatch.setattr(cat, '_catalog', None)
+    assert cat.get_instance_type('r5.large', client)['vcpus'] == 4
+    assert len(client.calls) == 2
@@ -0,0 +1,45 @@
+"""명령행 인터페이스 테스트."""
+import os
+import sys
+import json
+import subprocess
+
+# 임포트 시간 예산(초). 느린 CI 를 감안해 넉넉히 잡는다.
+IMPORT_BUDGET = 1.0
+HEAVY_MODULES = ['boto3', 'botocore', 'paramiko', 'jsonschema']
+
+PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import bilbo.cli
+elapsed = time.perf_counter() - t
+if len(sys.argv) > 1:
+    try:
+        bilbo.cli.main(sys.argv[1:], standalone_mode=False)
+    except SystemExit:
+        pass
+heavy = [m for m in {} if m in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'heavy': heavy}}))
+""".format(HEAVY_MODULES)
+
+
+def _probe(tmp_path, *args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, HOME=str(tmp_path), PYTHONPATH=root)
+    out = subprocess.check_output([sys.executable, '-c', PROBE] + list(args),
+                                  env=env, cwd=str(tmp_path))
+    return json.loads(out.decode('utf-8').strip().split('\n')[-1])
+
+
+def test_import_budget(tmp_path):
+    res = _probe(tmp_path)
+    assert res['heavy'] == []
+    assert res['elapsed'] < IMPORT_BUDGET
+    # 임포트만으로는 디렉토리를 만들지 않음
+    assert not os.path.exists(str(tmp_path / '.bilbo'))
+
+
+def test_light_commands(tmp_path):
+    for cmd in ('version', 'profiles', 'ls'):
+        res = _probe(tmp_path, cmd)
+        assert res['heavy'] == [], cmd
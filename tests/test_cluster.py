@@ -123,3 +123,641 @@ def test_dask(cluster):
     wins = winfo['instances']
     assert 'public_ip' in wins[0]
     assert 'private_dns_name' in wins[0]
+
+
+def test_fanout(monkeypatch):
+    """여러 호스트 동시 명령 테스트."""
+    import bilbo.cluster as bc
+
+    def _exec(user, private_key, ip, cmd, timeout=None,
+              retry_count=None):
+        if ip == '10.0.0.2':
+            return bc.HostResult(ip, error="timeout")
+        return bc.HostResult(ip, [cmd + '\n'], b'', 0)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    hosts = [('ubuntu', 'key.pem', '10.0.0.{}'.format(i)) for i in range(5)]
+    res = bc.fanout_cmd(hosts, lambda ip: 'echo ' + ip, concurrency=2)
+    assert len(res) == 5
+    assert not res.ok
+    assert [r.ip for r in res.failed()] == ['10.0.0.2']
+    assert res['10.0.0.3'].stdout == ['echo 10.0.0.3\n']
+
+
+def test_fanout_call():
+    """호스트별 함수 실행과 예외를 실패 결과로 바꾸기 테스트."""
+    import bilbo.cluster as bc
+
+    def _call(host):
+        if host[2] == '10.0.0.1':
+            raise IOError("sftp")
+        return bc.HostResult(host[2], exit_code=0)
+
+    shown = []
+    hosts = [('ubuntu', 'key.pem', '10.0.0.{}'.format(i)) for i in range(3)]
+    res = bc.fanout_call(hosts, _call, on_result=shown.append)
+    assert sorted(r.ip for r in shown) == ['10.0.0.0', '10.0.0.1', '10.0.0.2']
+    assert [r.ip for r in res.failed()] == ['10.0.0.1']
+    assert res['10.0.0.1'].error == 'sftp'
+    assert len(bc.fanout_call([], _call)) == 0
+
+
+def test_ssh_pool_expire(monkeypatch):
+    """유휴 시간이 지나도 채널이 열린 연결은 닫지 않기 테스트."""
+    import bilbo.cluster as bc
+
+    class _Client:
+        def __init__(self):
+            self.closed = False
+            self.transport = type('Transport', (), {})()
+            self.transport._channels = []
+            self.transport.is_active = lambda: not self.closed
+
+        def get_transport(self):
+            return self.transport
+
+        def close(self):
+            self.closed = True
+
+    pool = bc.SSHPool()
+    monkeypatch.setattr(pool, '_connect', lambda *args: _Client())
+    busy = pool.get('ubuntu', 'key.pem', '10.0.0.1')
+    idle = pool.get('ubuntu', 'key.pem', '10.0.0.2')
+    busy.transport._channels.append('logs -f')
+    for conn in pool._conns.values():
+        conn[1] -= 100
+
+    # 유지 시간이 없으면 계속 유지
+    pool.expire_idle()
+    assert not busy.closed and not idle.closed
+    pool.set_idle_ttl(60)
+    pool.expire_idle()
+    assert idle.closed and not busy.closed
+    assert pool.get('ubuntu', 'key.pem', '10.0.0.1') is busy
+
+    # 채널이 닫힌 후에는 유휴 시간이 지나야 닫음
+    busy.transport._channels.clear()
+    pool.expire_idle()
+    assert not busy.closed
+    pool._conns[('ubuntu', 'key.pem', '10.0.0.1')][1] -= 100
+    pool.expire_idle()
+    assert busy.closed and pool._conns == {}
+
+
+def test_bootstrap_user_data(monkeypatch):
+    """cloud-init 부트스트랩 스크립트 테스트."""
+    import bilbo.cluster as bc
+    from bilbo.profile import DaskProfile
+
+    monkeypatch.setattr(bc, 'get_aws_config', lambda: ('ak', 'sk', 'rg'))
+    pobj = DaskProfile({
+        "bootstrap": True,
+        "instance": {
+            "ami": "ami-000",
+            "ec2type": "t3.micro",
+            "keyname": "key",
+            "ssh_user": "ubuntu",
+            "ssh_private_key": "key.pem"
+        },
+        "dask": {"worker": {"nproc": 2}}
+    })
+    ud = bc.render_worker_user_data(pobj.wrk_groups[0],
+                                    'ip-10-0-0-1.internal')
+    assert ud.startswith("#!/bin/bash\nsudo -u ubuntu -i bash <<'BILBO'\n")
+    assert "NPROC=2\n" in ud
+    assert "dask-worker ip-10-0-0-1.internal:8786 --nprocs $NPROC" in ud
+    assert bc.BOOTSTRAP_DONE in ud
+    # 크레덴셜은 UserData 에 넣지 않음
+    for ud in (ud, bc.render_scheduler_user_data(pobj)):
+        assert '.aws' not in ud and 'aws_secret_access_key' not in ud
+
+
+def test_wait_bootstrap(local_shell, monkeypatch):
+    """부트스트랩이 끝난 호스트에만 SSH 로 크레덴셜을 설치하기 테스트."""
+    import bilbo.cluster as bc
+
+    monkeypatch.setattr(bc, 'get_aws_config', lambda: ('ak', 'sk', 'rg'))
+    monkeypatch.setattr(bc, 'BOOTSTRAP_WAIT', 1)
+    done, slow = ('ubuntu', 'key.pem', '10.0.0.1'), \
+        ('ubuntu', 'key.pem', '10.0.0.2')
+    (local_shell(done[2]) / '.bilbo_bootstrap_done').touch()
+    with pytest.raises(TimeoutError):
+        bc.wait_bootstrap([done, slow], "Dask bootstrap")
+    creds = local_shell(done[2]) / '.aws' / 'credentials'
+    assert 'aws_secret_access_key = sk' in creds.read_text()
+    assert not (local_shell(slow[2]) / '.aws').exists()
+
+    (local_shell(slow[2]) / '.bilbo_bootstrap_done').touch()
+    bc.wait_bootstrap([slow], "Dask bootstrap")
+    assert (local_shell(slow[2]) / '.aws' / 'config').read_text() == \
+        "[default]\nregion = rg\n"
+
+
+def test_timing(capsys):
+    """생성 단계별 소요 시간 기록 테스트."""
+    import json
+    import bilbo.cluster as bc
+    from bilbo.util import timing_span, timing_count
+
+    clinfo = {'name': 'test'}
+    with timing_span(clinfo, 'launch.dask'):
+        pass
+    with pytest.raises(ValueError):
+        with timing_span(clinfo, 'wait_running'):
+            raise ValueError()
+    timing_count(clinfo, 'ssh_connect_retries', 2)
+    timing_count(clinfo, 'ssh_connect_retries', 1)
+
+    timing = clinfo['timing']
+    assert [s['name'] for s in timing['spans']] == ['launch.dask',
+                                                    'wait_running']
+    assert timing['counters'] == {'ssh_connect_retries': 3}
+    # 저장소에 JSON 으로 기록될 수 있어야 함
+    json.loads(json.dumps(clinfo))
+
+    bc.show_cluster_timing(clinfo)
+    out = capsys.readouterr().out
+    assert '  launch.dask' in out
+    assert 'Total' in out
+    assert 'ssh_connect_retries' in out
+
+
+def _dask_clinfo(workers=3):
+    """워커 그룹 하나인 Dask 클러스터 정보."""
+    wrks = [{'instance_id': 'i-w{}'.format(i),
+             'public_ip': '1.1.1.{}'.format(10 + i),
+             'private_ip': '10.0.0.{}'.format(10 + i)}
+            for i in range(workers)]
+    return {
+        'name': 'test',
+        'type': 'dask',
+        'private_command': False,
+        'instances': ['i-s'] + [wrk['instance_id'] for wrk in wrks],
+        'scheduler': {'instance_id': 'i-s', 'public_ip': '1.1.1.1',
+                      'private_ip': '10.0.0.1',
+                      'private_dns_name': 'ip-10-0-0-1.internal',
+                      'ssh_user': 'ubuntu', 'ssh_private_key': 'key.pem'},
+        'worker': {'ssh_user': 'ubuntu', 'ssh_private_key': 'wkey.pem',
+                   'count': workers, 'instances': wrks}
+    }
+
+
+def test_remove_workers(tmp_store, monkeypatch, ec2_client):
+    """워커 은퇴 후 종료하고 클러스터 정보에서 빼기 테스트."""
+    import boto3
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    client = ec2_client()
+    retired = []
+    monkeypatch.setattr(boto3, 'client', lambda *a, **kw: client)
+    monkeypatch.setattr(bc, 'retire_workers',
+                        lambda clinfo, ips, timeout: retired.append(ips)
+                        or False)
+    clinfo = _dask_clinfo(3)
+    store.put_cluster('test', clinfo)
+    winfo = clinfo['worker']
+
+    # 은퇴에 실패해도 종료
+    bc.remove_workers(clinfo, winfo, winfo['instances'][1:])
+    assert retired == [['10.0.0.11', '10.0.0.12']]
+    assert client.calls == [('terminate_instances',
+                             {'InstanceIds': ['i-w1', 'i-w2']})]
+    assert [wrk['instance_id'] for wrk in winfo['instances']] == ['i-w0']
+    assert clinfo['instances'] == ['i-s', 'i-w0']
+    assert store.find_instance(instance_id='i-w1') is None
+    assert store.find_instance(instance_id='i-w0')['role'] == 'worker'
+
+    bc.remove_workers(clinfo, winfo, winfo['instances'], retire=False)
+    assert len(retired) == 1
+    assert store.get_cluster('test')['worker']['instances'] == []
+
+
+def test_scale_cluster(tmp_store, monkeypatch):
+    """늘거나 줄어든 만큼만 추가 / 제거하기 테스트."""
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    calls = []
+    launched = [None]
+
+    def _scale_out(clinfo, winfo, cnt):
+        calls.append(('out', cnt))
+        # 용량 부족으로 요청보다 적게 생성될 수 있음
+        for i in range(cnt if launched[0] is None else launched[0]):
+            winfo['instances'].append({'instance_id': 'i-n{}'.format(i)})
+
+    monkeypatch.setattr(bc, 'scale_out', _scale_out)
+    monkeypatch.setattr(bc, 'remove_workers',
+                        lambda clinfo, winfo, wrks, retire:
+                        calls.append(('in', [w['instance_id'] for w in wrks],
+                                      retire)))
+    store.put_cluster('test', _dask_clinfo(3))
+
+    bc.scale_cluster('test', 5)
+    assert store.get_cluster('test')['worker']['count'] == 5
+    launched[0] = 1
+    bc.scale_cluster('test', 8)
+    assert store.get_cluster('test')['worker']['count'] == 6
+
+    # 제거 대역은 인스턴스를 바꾸지 않기에 매번 3 대에서 시작
+    store.put_cluster('test', _dask_clinfo(3))
+    calls.clear()
+    bc.scale_cluster('test', 1)
+    bc.scale_cluster('test', 2, force=True)
+    assert calls == [('in', ['i-w1', 'i-w2'], True),
+                     ('in', ['i-w2'], False)]
+    bc.scale_cluster('test', 3)
+    assert len(calls) == 2
+
+    with pytest.raises(IndexError):
+        bc.scale_cluster('test', 3, group=1)
+    with pytest.raises(ValueError):
+        bc.scale_cluster('test', -1)
+
+
+def test_scale_out(tmp_store, monkeypatch):
+    """새 워커에서만 dask-worker 시작하기 테스트."""
+    import boto3
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    launched = []
+    started = {}
+    monkeypatch.setattr(boto3, 'resource', lambda *a, **kw: None)
+    monkeypatch.setattr(bc, 'get_aws_config', lambda: ('ak', 'sk', 'rg'))
+    monkeypatch.setattr(bc, 'launch_workers',
+                        lambda ec2, inst, cnt, *args: launched.append(cnt)
+                        or ['i-w3', 'i-w4'])
+    monkeypatch.setattr(bc, 'wait_instances_running', lambda ec2, ids: {
+        iid: {'InstanceId': iid, 'PublicIpAddress': '1.1.1.{}'.format(i),
+              'PrivateIpAddress': '10.0.0.{}'.format(i)}
+        for i, iid in zip((13, 14), ids)})
+
+    def _fanout(hosts, cmd):
+        started.update({host[2]: cmd(host[2]) for host in hosts})
+        return bc.FanoutResult({})
+
+    monkeypatch.setattr(bc, 'fanout_cmd', _fanout)
+    clinfo = _dask_clinfo(3)
+    winfo = clinfo['worker']
+    winfo.update(ec2type='m5.xlarge', nproc=2, nthread=2, memory=8 * 2**30,
+                 launch={'instance': {'ami': 'ami-000',
+                                      'ec2type': 'm5.xlarge'},
+                         'name': 'test-worker', 'description': None})
+    store.put_cluster('test', clinfo)
+
+    bc.scale_out(clinfo, winfo, 2)
+    assert launched == [2]
+    assert sorted(started) == ['1.1.1.13', '1.1.1.14']
+    assert all('dask-worker ip-10-0-0-1.internal:8786' in cmd
+               for cmd in started.values())
+    assert len(store.get_cluster('test')['worker']['instances']) == 5
+    assert store.find_instance(instance_id='i-w4')['role'] == 'worker'
+
+
+def _scheduler_code(cmd):
+    """run_on_scheduler 명령에서 파이썬 코드 꺼내기."""
+    assert cmd.startswith('timeout ')
+    code = cmd[cmd.index('"') + 1:cmd.rindex('"')]
+    # 쉘의 큰따옴표 안에서 바뀌면 안 됨
+    assert '$' not in code and '`' not in code
+    compile(code, '<scheduler>', 'exec')
+    return code
+
+
+def _scheduler_ips(code):
+    import ast
+    import re
+
+    return ast.literal_eval(re.search(r"^ips = (?:set\()?(\[.*?\])", code,
+                                      re.M).group(1))
+
+
+def _record_events(monkeypatch, sip='1.1.1.1'):
+    """스케쥴러의 drain / retire / wait 와 워커 명령을 순서대로 기록."""
+    import threading
+    import bilbo.cluster as bc
+
+    lock = threading.Lock()
+    events = []
+
+    def _exec(user, private_key, ip, cmd, timeout=None, retry_count=None):
+        if ip == sip and cmd.startswith('timeout '):
+            code = _scheduler_code(cmd)
+            if 'retire_workers' in code:
+                event = ('retire', tuple(_scheduler_ips(code)))
+            elif 'did not join' in code:
+                event = ('wait', tuple(_scheduler_ips(code)))
+            else:
+                assert 'busy' in code
+                event = ('drain',)
+        else:
+            event = ('stop' if cmd.endswith('quit') else 'restart', ip)
+        with lock:
+            events.append(event)
+        return bc.HostResult(ip, [], b'', 0)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    monkeypatch.setattr(bc, 'get_aws_config', lambda: ('ak', 'sk', 'rg'))
+    return events
+
+
+def test_scheduler_snippets():
+    """포맷한 스케쥴러 코드들이 컴파일되는가?"""
+    import bilbo.cluster as bc
+
+    ips = ['10.0.0.10', '10.0.0.11']
+    for code in (bc.RETIRE_PY.format(ips=ips),
+                 bc.DRAIN_PY.format(timeout=10),
+                 bc.WAIT_WORKERS_PY.format(ips=ips, timeout=10)):
+        compile(code, '<scheduler>', 'exec')
+    assert _scheduler_ips(bc.WAIT_WORKERS_PY.format(ips=ips, timeout=1)) \
+        == ips
+
+
+def test_drain_stop(tmp_store, monkeypatch):
+    """태스크를 기다리고 모든 워커를 은퇴시킨 후 중지."""
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    events = _record_events(monkeypatch)
+    store.put_cluster('test', _dask_clinfo(3))
+    bc.stop_cluster('test', drain=True, timeout=10)
+    assert events[:2] == [('drain',),
+                          ('retire', ('10.0.0.10', '10.0.0.11',
+                                      '10.0.0.12'))]
+    assert sorted(events[2:]) == [('stop', '1.1.1.1'), ('stop', '1.1.1.10'),
+                                  ('stop', '1.1.1.11'), ('stop', '1.1.1.12')]
+
+
+def test_rolling_restart(tmp_store, monkeypatch):
+    """배치마다 은퇴, 재시작, 합류 대기 순서로."""
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    events = _record_events(monkeypatch)
+    clinfo = _dask_clinfo(5)
+    clinfo['worker'].update(ec2type='m5.xlarge', nproc=2, nthread=2,
+                            memory=8 * 2**30)
+    store.put_cluster('test', clinfo)
+    bc.rolling_restart('test', batch=2, timeout=10)
+
+    # 배치 안의 재시작은 동시에 하기에 순서는 무관
+    pos = 0
+    for batch in ((10, 11), (12, 13), (14,)):
+        n = len(batch)
+        pips = tuple('10.0.0.{}'.format(i) for i in batch)
+        seg = events[pos:pos + n + 2]
+        assert seg[0] == ('retire', pips)
+        assert sorted(seg[1:-1]) == [('restart', '1.1.1.{}'.format(i))
+                                     for i in batch]
+        assert seg[-1] == ('wait', pips)
+        pos += n + 2
+    assert pos == len(events)
+
+
+def test_rolling_restart_timeout(tmp_store, monkeypatch):
+    """합류하지 않으면 다음 배치로 넘어가지 않음."""
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    events = _record_events(monkeypatch)
+    run = bc.run_on_scheduler
+    monkeypatch.setattr(bc, 'run_on_scheduler', lambda clinfo, code, *a: (
+        bc.HostResult('1.1.1.1', exit_code=1) if 'did not join' in code
+        else run(clinfo, code, *a)))
+    clinfo = _dask_clinfo(3)
+    clinfo['worker'].update(ec2type='m5.xlarge', nproc=2, nthread=2,
+                            memory=8 * 2**30)
+    store.put_cluster('test', clinfo)
+    with pytest.raises(TimeoutError):
+        bc.rolling_restart('test', batch=2, timeout=10)
+    assert [e[0] for e in events] == ['retire', 'restart', 'restart']
+
+
+def test_placement_kwargs(ec2_client):
+    """배치 설정을 인스턴스 생성 인자로 바꾸기."""
+    import bilbo.cluster as bc
+    from bilbo.profile import Instance
+
+    assert bc._placement_kwargs(None) == {}
+    assert bc._placement_kwargs({'subnet': 'subnet-1'}) == \
+        {'SubnetId': 'subnet-1'}
+    assert bc._placement_kwargs({'group': 'pg', 'strategy': 'cluster',
+                                 'availability_zone': 'az-1'}) == \
+        {'Placement': {'GroupName': 'pg', 'AvailabilityZone': 'az-1'}}
+
+    ec2 = ec2_client(create_instances=['inst'])
+    inst = Instance({'ami': 'ami-000', 'ec2type': 'm5.xlarge',
+                     'keyname': 'key', 'security_group': 'sg-1'})
+    placement = {'group': 'pg', 'strategy': 'cluster', 'subnet': 'subnet-1'}
+    assert bc.create_ec2_instances(ec2, inst, 2, [], placement=placement) \
+        == ['inst']
+    kwargs = ec2.calls[0][1]
+    assert kwargs['Placement'] == {'GroupName': 'pg'}
+    assert kwargs['SubnetId'] == 'subnet-1'
+    assert kwargs['MaxCount'] == 2
+
+
+def test_ensure_placement_group(ec2_client):
+    """배치 그룹은 없을 때만 만들고, 다른 에러는 그대로 던지기."""
+    import botocore
+    import bilbo.cluster as bc
+
+    def _error(code):
+        def _raise(**kwargs):
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': code, 'Message': 'pg'}},
+                'DescribePlacementGroups')
+        return _raise
+
+    client = ec2_client(
+        describe_placement_groups=_error('InvalidPlacementGroup.Unknown'))
+    assert bc.ensure_placement_group(client, 'pg', 'cluster') is True
+    assert client.calls[-1] == ('create_placement_group',
+                                {'GroupName': 'pg', 'Strategy': 'cluster'})
+
+    # 전략이 달라도 기존 그룹을 재사용
+    client = ec2_client(describe_placement_groups={'PlacementGroups': [
+        {'GroupName': 'pg', 'Strategy': 'spread'}]})
+    assert bc.ensure_placement_group(client, 'pg', 'cluster') is False
+    assert [name for name, _ in client.calls] == ['describe_placement_groups']
+
+    client = ec2_client(
+        describe_placement_groups=_error('UnauthorizedOperation'))
+    with pytest.raises(botocore.exceptions.ClientError):
+        bc.ensure_placement_group(client, 'pg', 'cluster')
+    assert len(client.calls) == 1
+
+
+def test_create_fleet_instances(ec2_client):
+    """임시 런치 템플릿으로 스팟 플릿을 요청하고 템플릿은 지우기."""
+    import types
+    import bilbo.cluster as bc
+    from bilbo.profile import Instance
+
+    client = ec2_client(
+        create_launch_template={'LaunchTemplate': {
+            'LaunchTemplateId': 'lt-1'}},
+        create_fleet={'Instances': [{'InstanceType': 'm5.xlarge',
+                                     'InstanceIds': ['i-1', 'i-2']}],
+                      'Errors': [{'ErrorCode': 'InsufficientCapacity',
+                                  'ErrorMessage': 'm5a.xlarge'}]})
+    ec2 = types.SimpleNamespace(meta=types.SimpleNamespace(client=client))
+    inst = Instance({'ami': 'ami-000', 'keyname': 'key',
+                     'security_group': 'sg-1'})
+    tag_spec = bc._build_tag_spec('test-worker', None, None)
+    spot = {'ec2types': ['m5.xlarge', 'm5a.xlarge'],
+            'allocation_strategy': 'lowest-price', 'max_price': 0.1}
+
+    ids = bc.create_fleet_instances(ec2, inst, 3, tag_spec, spot,
+                                    placement={'subnet': 'subnet-1'})
+    assert ids == ['i-1', 'i-2']
+    assert [name for name, _ in client.calls] == [
+        'create_launch_template', 'create_fleet', 'delete_launch_template']
+    ltdata = client.calls[0][1]['LaunchTemplateData']
+    assert ltdata['TagSpecifications'] == tag_spec
+    fleet = client.calls[1][1]
+    assert fleet['TargetCapacitySpecification']['TotalTargetCapacity'] == 3
+    assert fleet['SpotOptions'] == {'AllocationStrategy': 'lowest-price',
+                                    'MaxTotalPrice': str(0.1 * 3)}
+    assert fleet['LaunchTemplateConfigs'][0]['Overrides'] == [
+        {'InstanceType': 'm5.xlarge', 'SubnetId': 'subnet-1'},
+        {'InstanceType': 'm5a.xlarge', 'SubnetId': 'subnet-1'}]
+    assert client.calls[2][1] == {'LaunchTemplateId': 'lt-1'}
+
+    # 플릿 요청이 실패해도 템플릿은 지움
+    def _fail(**kwargs):
+        raise RuntimeError("fleet")
+
+    client.responses['create_fleet'] = _fail
+    with pytest.raises(RuntimeError):
+        bc.create_fleet_instances(ec2, inst, 1, tag_spec, spot)
+    assert client.calls[-1][0] == 'delete_launch_template'
+
+
+def _spot_clinfo():
+    """워커 그룹이 온디맨드 2 대, 스팟 2 대인 클러스터 정보."""
+    clinfo = _dask_clinfo(4)
+    wrks = clinfo['worker']['instances']
+    clinfo['worker'] = [
+        dict(clinfo['worker'], count=2, instances=wrks[:2]),
+        dict(clinfo['worker'], count=2, instances=wrks[2:],
+             spot={'ec2types': ['m5.xlarge']})]
+    return clinfo
+
+
+def test_find_spot_interruptions(monkeypatch):
+    """스팟 워커들의 메타데이터만 확인해 알림 받은 것 찾기."""
+    import bilbo.cluster as bc
+
+    asked = []
+
+    def _exec(user, private_key, ip, cmd, timeout=None, retry_count=None):
+        assert cmd == bc.SPOT_NOTICE_CMD
+        asked.append(ip)
+        if ip == '1.1.1.13':
+            return bc.HostResult(ip, ['{"action": "terminate"}'], b'', 0)
+        # 알림이 없으면 curl -f 가 실패
+        return bc.HostResult(ip, [], b'', 22)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    clinfo = _spot_clinfo()
+    doomed = bc.find_spot_interruptions(clinfo)
+    assert sorted(asked) == ['1.1.1.12', '1.1.1.13']
+    assert [(winfo is clinfo['worker'][1], wrk['instance_id'])
+            for winfo, wrk in doomed] == [(True, 'i-w3')]
+
+    asked.clear()
+    assert bc.find_spot_interruptions(_dask_clinfo(2)) == []
+    assert asked == []
+
+
+def test_replace_interrupted_workers(tmp_store, monkeypatch):
+    """알림 받은 워커를 짧게 은퇴시켜 제거하고 같은 수를 띄움."""
+    import bilbo.cluster as bc
+    from bilbo import store
+
+    calls = []
+    monkeypatch.setattr(bc, 'find_spot_interruptions', lambda clinfo: [
+        (clinfo['worker'][1], clinfo['worker'][1]['instances'][1])])
+    monkeypatch.setattr(bc, 'remove_workers',
+                        lambda clinfo, winfo, wrks, retire, timeout:
+                        calls.append(('remove', [w['instance_id']
+                                                 for w in wrks], timeout)))
+    monkeypatch.setattr(bc, 'scale_out', lambda clinfo, winfo, cnt:
+                        calls.append(('add', 'spot' in winfo, cnt)))
+    store.put_cluster('test', _spot_clinfo())
+    assert bc.replace_interrupted_workers('test') == 1
+    assert calls == [('remove', ['i-w3'], bc.SPOT_RETIRE_TIMEOUT),
+                     ('add', True, 1)]
+
+
+def test_cluster_hosts():
+    """역할별 호스트 튜플과 private_command 의 사설 IP."""
+    import bilbo.cluster as bc
+
+    clinfo = _dask_clinfo(2)
+    clinfo['notebook'] = {'instance_id': 'i-n', 'public_ip': '1.1.1.2',
+                          'private_ip': '10.0.0.2', 'ssh_user': 'ubuntu',
+                          'ssh_private_key': 'nkey.pem'}
+    assert bc.cluster_hosts(clinfo) == [
+        ('notebook', ('ubuntu', 'nkey.pem', '1.1.1.2')),
+        ('scheduler', ('ubuntu', 'key.pem', '1.1.1.1')),
+        ('worker', ('ubuntu', 'wkey.pem', '1.1.1.10')),
+        ('worker', ('ubuntu', 'wkey.pem', '1.1.1.11'))]
+    assert [ip for _, (_, _, ip) in bc.cluster_hosts(clinfo, 'worker')] == \
+        ['1.1.1.10', '1.1.1.11']
+
+    clinfo['private_command'] = True
+    assert [ip for _, (_, _, ip) in bc.cluster_hosts(clinfo, 'scheduler')] \
+        == ['10.0.0.1']
+
+    # 노트북만 있는 클러스터
+    del clinfo['type']
+    assert [r for r, _ in bc.cluster_hosts(clinfo)] == ['notebook']
+    assert bc.cluster_hosts(clinfo, 'worker') == []
+
+
+def test_group_results():
+    """같은 상태와 출력을 낸 호스트끼리 많은 순으로 묶기."""
+    import bilbo.cluster as bc
+
+    res = [bc.HostResult('1.1.1.3', ['ok\n'], b'', 0),
+           bc.HostResult('1.1.1.1', ['ok\n'], b'', 0),
+           bc.HostResult('1.1.1.2', ['ok\n'], b'warn\n', 0),
+           bc.HostResult('1.1.1.4', [], b'', 2),
+           bc.HostResult('1.1.1.5', error='timeout')]
+    assert bc.group_results(res) == [
+        ('exit 0', ['ok'], ['1.1.1.1', '1.1.1.3']),
+        ('error: timeout', [], ['1.1.1.5']),
+        ('exit 0', ['ok', 'stderr: warn'], ['1.1.1.2']),
+        ('exit 2', [], ['1.1.1.4'])]
+
+
+def test_broadcast_cmd(monkeypatch, capsys):
+    """rcmd 의 결과 묶음 / 스트림 표시와 성공 여부."""
+    import bilbo.cluster as bc
+
+    def _exec(user, private_key, ip, cmd, timeout=None,
+              retry_count=None):
+        if cmd == 'hostname':
+            return bc.HostResult(ip, [ip + '\n'], b'', 0)
+        return bc.HostResult(ip, [], b'', 3 if ip == '1.1.1.11' else 0)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    monkeypatch.setattr(bc, 'check_cluster', lambda clname: _dask_clinfo())
+
+    assert not bc.broadcast_cmd('test', 'true', 'worker')
+    out = capsys.readouterr().out
+    assert "==> 2 host(s), exit 0: 1.1.1.10, 1.1.1.12\n" in out
+    assert "==> 1 host(s), exit 3: 1.1.1.11\n" in out
+    assert out.rstrip().endswith("3 host(s): 2 exit 0, 1 exit 3")
+
+    assert bc.broadcast_cmd('test', 'hostname', stream=True)
+    out = capsys.readouterr().out
+    assert "scheduler 1.1.1.1 | 1.1.1.1\n" in out
+    assert "worker 1.1.1.12 | 1.1.1.12\n" in out
+    assert "==>" not in out
+    assert out.rstrip().endswith("4 host(s): 4 exit 0")
@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import signal
+
+import pytest
+from click.testing import CliRunner
+
+import bilbo.cluster as bc
+from bilbo import cli
+from bilbo import store
+from bilbo.jobs import JOB_DIR, submit_cmd, status_cmd, wait_cmd, kill_cmd, \
+    parse_status, find_job, submit_job, refresh_jobs, wait_job, kill_job, \
+    WAIT_TIMEOUT_EXIT
+
+HOST = ('ubuntu', 'key.pem', '1.1.1.2')
+
+
+def _run(cmd):
+    res = bc.exec_instance_cmd(*HOST, cmd)
+    assert res.ok, res.stderr
+    return res
+
+
+def _status(job_id=None):
+    return parse_status(_run(status_cmd(job_id)).stdout)
+
+
+def _group_gone(pgid):
+    """프로세스 그룹이 모두 끝났는가? 잠시 기다린다."""
+    for _ in range(100):
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_parse_status():
+    lines = ['j1\t101\t2020-01-01 00:00:00\texit 0\n',
+             'j2\t102\t2020-01-01 00:00:01\texit 2\n',
+             'j3\t\t\tlost\n',
+             'j4\t104\t2020-01-01 00:00:02\texit ?\n',
+             'broken line\n']
+    jobs = parse_status(lines)
+    assert sorted(jobs) == ['j1', 'j2', 'j3', 'j4']
+    assert jobs['j1'] == {'pid': 101, 'started': '2020-01-01 00:00:00',
+                          'status': 'done', 'exit_code': 0}
+    assert (jobs['j2']['status'], jobs['j2']['exit_code']) == ('failed', 2)
+    assert jobs['j3'] == {'pid': None, 'started': None, 'status': 'lost',
+                          'exit_code': None}
+    assert (jobs['j4']['status'], jobs['j4']['exit_code']) == ('failed', -1)
+
+
+def test_find_job(tmp_store):
+    """ID 나 유일한 앞부분으로 찾기."""
+    store.put_cluster('test', {'instances': []})
+    for job_id in ('20200101-000000-ab12', '20200101-000000-ab34',
+                   '20200102-000000-cd56'):
+        store.put_job('test', {'job_id': job_id, 'host': '1.1.1.2',
+                               'path': 'train.py', 'cmd': 'python train.py',
+                               'status': 'running'})
+    assert find_job('test', '20200101-000000-ab12')['job_id'] == \
+        '20200101-000000-ab12'
+    assert find_job('test', '20200102')['job_id'] == '20200102-000000-cd56'
+    for job_id in ('20200101', 'nojob'):
+        with pytest.raises(RuntimeError):
+            find_job('test', job_id)
+
+
+def test_submit_status(local_shell):
+    """작업을 분리해 시작하고, 기다린 후 종료 코드와 출력 기록 확인."""
+    home = local_shell(HOST[2])
+    cmd = "echo \"it's $((1 + 1))\"; exit 3"
+    res = _run(submit_cmd('j1', cmd))
+    pid = int(res.stdout[0])
+    assert _status('j1')['j1']['pid'] == pid
+
+    jobs = parse_status(_run(wait_cmd('j1')).stdout)
+    assert jobs['j1']['pid'] == pid
+    assert (jobs['j1']['status'], jobs['j1']['exit_code']) == ('failed', 3)
+    d = home / JOB_DIR / 'j1'
+    assert (d / 'out.log').read_text() == "it's 2\n"
+    assert (d / 'cmd').read_text() == cmd + '\n'
+    assert jobs['j1']['started'] == (d / 'started').read_text().strip()
+
+    # 명령의 exit 가 기록을 막지 않고, 작업마다 따로 기록됨
+    _run(submit_cmd('j2', 'true; exit 0'))
+    _run(wait_cmd('j2'))
+    assert {job_id: job['status'] for job_id, job in _status().items()} == \
+        {'j1': 'failed', 'j2': 'done'}
+    assert list(_status('j2')) == ['j2']
+    assert _status('nojob') == {}
+
+
+def test_kill_cmd(local_shell):
+    """작업의 프로세스 그룹을 중지. 끝난 작업은 그대로 둠."""
+    pid = int(_run(submit_cmd('j1', 'sleep 30; sleep 30')).stdout[0])
+    assert _status('j1')['j1']['status'] == 'running'
+
+    jobs = parse_status(_run(kill_cmd('j1')).stdout)
+    assert jobs['j1']['status'] == 'killed'
+    assert _group_gone(pid)
+    # 기다리기는 바로 끝남
+    assert parse_status(_run(wait_cmd('j1')).stdout)['j1']['status'] == \
+        'killed'
+
+    _run(submit_cmd('j2', 'true'))
+    _run(wait_cmd('j2', timeout=30))
+    assert parse_status(_run(kill_cmd('j2')).stdout)['j2']['status'] == \
+        'done'
+
+
+def test_lost(local_shell):
+    """기록 없이 사라진 작업."""
+    pid = int(_run(submit_cmd('j1', 'sleep 30')).stdout[0])
+    os.killpg(pid, signal.SIGKILL)
+    assert _group_gone(pid)
+    assert parse_status(_run(wait_cmd('j1')).stdout)['j1']['status'] == \
+        'lost'
+
+
+def test_job_commands(tmp_store, local_shell, monkeypatch):
+    """작업 시작, 상태 갱신, 기다리기, 중지를 로컬 bash 로."""
+    monkeypatch.setenv('PATH', os.path.dirname(sys.executable) + os.pathsep +
+                       os.environ['PATH'])
+    works = local_shell(HOST[2]) / 'works'
+    works.mkdir()
+    (works / 'train.py').write_text(
+        "import os, sys, time\n"
+        "print(os.environ['DASK_SCHEDULER_ADDRESS'])\n"
+        "time.sleep(float(os.environ.get('SLEEP', 0)))\n"
+        "sys.exit(int(os.environ.get('CODE', 0)))\n")
+    clinfo = {'private_command': False,
+              'notebook': {'public_ip': HOST[2], 'ssh_user': HOST[0],
+                           'ssh_private_key': HOST[1]},
+              'scheduler': {'private_dns_name': 'ip-10-0-0-1.internal'}}
+    store.put_cluster('test', {'instances': []})
+    monkeypatch.setattr(bc, 'check_cluster', lambda clname: clinfo)
+
+    ok = submit_job('test', 'train.py', ['lr=0.1'])
+    bad = submit_job('test', 'train.py', ['CODE=2'])
+    slow = submit_job('test', 'train.py', ['SLEEP=30'])
+    assert ok['status'] == 'running' and ok['pid'] > 0
+    assert 'lr=0.1 python train.py' in ok['cmd']
+
+    assert wait_job('test', ok['job_id'])['status'] == 'done'
+    job = wait_job('test', bad['job_id'])
+    assert (job['status'], job['exit_code']) == ('failed', 2)
+    log = works.parent / JOB_DIR / ok['job_id'] / 'out.log'
+    assert log.read_text() == "tcp://ip-10-0-0-1.internal:8786\n"
+
+    jobs = {job['job_id']: job for job in refresh_jobs('test')}
+    assert jobs[slow['job_id']]['status'] == 'running'
+    assert find_job('test', bad['job_id'])['exit_code'] == 2
+
+    # 제한 시간이 지나면 원격 기다리기도 끝나고 작업은 계속됨
+    t = time.time()
+    with pytest.raises(TimeoutError, match=slow['job_id']):
+        wait_job('test', slow['job_id'], timeout=1)
+    assert time.time() - t < 5
+    assert find_job('test', slow['job_id'])['status'] == 'running'
+    res = CliRunner().invoke(cli.main, ['job', 'wait', 'test',
+                                        slow['job_id'], '-t', '0.5'])
+    assert res.exit_code == WAIT_TIMEOUT_EXIT
+    assert res.output.strip() == "Timed out waiting for job {}.".format(
+        slow['job_id'])
+
+    assert kill_job('test', slow['job_id'])['status'] == 'killed'
+    assert find_job('test', slow['job_id'])['status'] == 'killed'
+    assert kill_job('test', ok['job_id'])['status'] == 'done'
+
+    # 원격 기록이 지워진 실행 중 작업은 lost
+    store.update_job('test', ok['job_id'], status='running')
+    for job in (ok, bad, slow):
+        _run('rm -rf "$HOME"/{}/{}'.format(JOB_DIR, job['job_id']))
+    jobs = {job['job_id']: job for job in refresh_jobs('test')}
+    assert jobs[ok['job_id']]['status'] == 'lost'
+    assert jobs[bad['job_id']]['status'] == 'failed'
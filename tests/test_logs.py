@@ -0,0 +1,139 @@
+"""원격 로그 테스트."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'benchmarks'))
+
+from bilbo.logs import LineSplitter  # noqa
+
+
+def test_line_splitter():
+    sp = LineSplitter(line_max=8)
+    assert sp.feed(b'abc') == []
+    assert sp.feed(b'de\nfg\r\nh') == ['abcde', 'fg']
+    # 줄 버퍼가 넘치면 잘라서 냄
+    assert sp.feed(b'123456789') == ['h123456789']
+    assert sp.feed('한글\n'.encode('utf-8')) == ['한글']
+    assert sp.feed(b'tail') == []
+    assert sp.flush() == ['tail']
+    assert sp.flush() == []
+
+
+def test_tail_logs(capsys):
+    import bilbo.cluster as bc
+    from bilbo.logs import show_logs
+    from bench_cluster import fake_env, PROFILE, CLUSTER
+
+    with fake_env(workers=2):
+        pobj, clinfo = bc.create_cluster(PROFILE, CLUSTER, None)
+        bc.save_cluster_info(CLUSTER, clinfo)
+        capsys.readouterr()
+
+        show_logs(CLUSTER)
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 4
+        assert lines[0].startswith('notebook ')
+        assert lines[1].startswith('scheduler ')
+        ip = clinfo['worker']['instances'][1]['public_ip']
+        assert lines[3] == 'worker    {0} | {0} log'.format(ip)
+
+        show_logs(CLUSTER, 'worker')
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 2
+        assert lines[0].startswith('worker ')
+
+
+def test_follow_logs(monkeypatch):
+    """여러 채널을 select 로 읽어 줄 단위로 출력."""
+    import io
+    import socket
+    from bilbo import logs
+
+    chans = {}
+    for prefix, chunks in (('worker a', [b'x1\nx', b'2\n']),
+                           ('worker b', [b'y1\ny2'])):
+        rsock, wsock = socket.socketpair()
+        for chunk in chunks:
+            wsock.sendall(chunk)
+        wsock.close()
+        chans[rsock] = (prefix, logs.LineSplitter())
+    monkeypatch.setattr(logs, '_open_channels', lambda targets, lines: chans)
+
+    out = io.StringIO()
+    logs.follow_logs([], out=out)
+    lines = out.getvalue().splitlines()
+    assert sorted(lines) == ['worker a | x1', 'worker a | x2',
+                             'worker b | y1', 'worker b | y2']
+    assert lines.index('worker a | x1') < lines.index('worker a | x2')
+
+
+def test_open_channels_fail(monkeypatch):
+    """한 호스트의 채널 열기가 실패해도 나머지 호스트는 따라가기."""
+    import socket
+    import paramiko
+    import bilbo.cluster as bc
+    from bilbo import logs
+
+    class _Chan:
+        def __init__(self, ip):
+            self.ip = ip
+            self.closed = False
+
+        def set_combine_stderr(self, combine):
+            pass
+
+        def exec_command(self, cmd):
+            if self.ip == '10.0.0.2':
+                raise paramiko.SSHException("channel closed")
+            self.cmd = cmd
+
+        def close(self):
+            self.closed = True
+
+    class _Transport:
+        def __init__(self, ip):
+            self.ip = ip
+
+        def is_active(self):
+            return True
+
+        def open_session(self):
+            if self.ip == '10.0.0.1':
+                raise OSError("connection reset")
+            chan = _Chan(self.ip)
+            opened.append(chan)
+            return chan
+
+    class _Client:
+        def __init__(self, ip):
+            self.ip = ip
+
+        def get_transport(self):
+            return _Transport(self.ip)
+
+    def _get(user, pkey, ip, retry_count=None):
+        if ip == '10.0.0.3':
+            raise socket.timeout("timed out")
+        return _Client(ip)
+
+    opened = []
+    discarded = []
+    monkeypatch.setattr(bc.ssh_pool, 'get', _get)
+    monkeypatch.setattr(bc.ssh_pool, 'discard',
+                        lambda *host: discarded.append(host[2]))
+    warns = []
+    monkeypatch.setattr(logs, 'warning', warns.append)
+
+    targets = [('worker {}'.format(i), ('ubuntu', 'key.pem',
+                                        '10.0.0.{}'.format(i)),
+                '~/.bilbo/logs/worker.log') for i in range(4)]
+    chans = logs._open_channels(targets, 5)
+    assert [prefix for prefix, _ in chans.values()] == ['worker 0']
+    assert list(chans)[0].cmd == 'tail -n 5 -F ~/.bilbo/logs/worker.log'
+    # 명령 실행에 실패한 채널은 닫음
+    assert [chan.closed for chan in opened] == [False, True]
+    assert sorted(discarded) == ['10.0.0.1', '10.0.0.2']
+    assert len(warns) == 3
+    for ip, warn in zip(('10.0.0.1', '10.0.0.2', '10.0.0.3'), warns):
+        assert ip in warn
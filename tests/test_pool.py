@@ -0,0 +1,110 @@
+import bilbo.store as store
+from bilbo.pool import POOL_TAGS, claim_instances, park_instances
+from bilbo.profile import Instance
+
+SPEC = {'image_id': 'ami-1', 'ec2type': 'm5.xlarge',
+        'security_group': 'sg-1', 'key_name': 'key', 'vol_size': None}
+
+
+def _desc(iid, state, **kw):
+    desc = {'InstanceId': iid, 'State': {'Name': state}, 'ImageId': 'ami-1',
+            'InstanceType': 'm5.xlarge', 'KeyName': 'key',
+            'SecurityGroups': [{'GroupId': 'sg-1'}]}
+    desc.update(kw)
+    return desc
+
+
+def _describe(descs):
+    """instance-id 필터에 맞는 인스턴스만 돌려주는 DescribeInstances."""
+    def _call(Filters):
+        ids = Filters[0]['Values']
+        return {'Reservations': [
+            {'Instances': [d for d in descs if d['InstanceId'] in ids]}]}
+    return _call
+
+
+def _pool_ids():
+    return [row['instance_id'] for row in store.iter_pool_instances()]
+
+
+def test_take_pool_instances(tmp_store):
+    """웜 풀에서 사양이 같은 인스턴스를 오래된 것부터 꺼내기 테스트."""
+    other = dict(SPEC, ec2type='c5.large')
+    store.put_pool_instances({'i-a': SPEC, 'i-b': SPEC, 'i-c': SPEC,
+                              'i-x': other})
+    with store.transaction() as conn:
+        conn.executemany("UPDATE pool SET added = ? WHERE instance_id = ?",
+                         [('2000-01-02', 'i-a'), ('2000-01-03', 'i-b'),
+                          ('2000-01-01', 'i-c')])
+
+    # 볼륨 크기가 없는(NULL) 사양도 같은 사양으로 찾음
+    assert store.take_pool_instances(SPEC, 2) == ['i-c', 'i-a']
+    assert sorted(_pool_ids()) == ['i-b', 'i-x']
+    assert store.take_pool_instances(dict(SPEC, vol_size=100), 1) == []
+    assert store.take_pool_instances(SPEC, 5) == ['i-b']
+    assert _pool_ids() == ['i-x']
+
+
+def test_park_instances(tmp_store, ec2_client):
+    """running 인스턴스만 태그를 바꾸고 정지해 풀에 넣기 테스트."""
+    tags = [{'Key': 'Name', 'Value': 'test-worker'},
+            {'Key': 'Owner', 'Value': 'me'},
+            {'Key': 'aws:ec2launchtemplate:id', 'Value': 'lt-1'}]
+    descs = [_desc('i-1', 'running', Tags=tags),
+             _desc('i-2', 'running', Tags=tags[:1]),
+             _desc('i-3', 'running', InstanceLifecycle='spot'),
+             _desc('i-4', 'stopped'),
+             _desc('i-5', 'terminated')]
+    client = ec2_client(describe_instances=_describe(descs))
+
+    rest = park_instances(client, ['i-1', 'i-2', 'i-3', 'i-4', 'i-5', 'i-6'],
+                          {'i-1': 100})
+    assert rest == ['i-3', 'i-4']
+    assert client.calls[1:] == [
+        ('delete_tags', {'Resources': ['i-1', 'i-2'],
+                         'Tags': [{'Key': 'Name'}, {'Key': 'Owner'}]}),
+        ('create_tags', {'Resources': ['i-1', 'i-2'], 'Tags': POOL_TAGS}),
+        ('stop_instances', {'InstanceIds': ['i-1', 'i-2']})]
+    rows = {row['instance_id']: row for row in store.iter_pool_instances()}
+    assert set(rows) == {'i-1', 'i-2'}
+    assert rows['i-1']['vol_size'] == 100
+    assert rows['i-2']['vol_size'] is None
+    assert rows['i-2']['security_group'] == 'sg-1'
+
+    # 넣을 인스턴스가 없으면 EC2 를 바꾸지 않음
+    client = ec2_client(describe_instances=_describe(descs))
+    assert park_instances(client, ['i-3', 'i-5']) == ['i-3']
+    assert [name for name, _ in client.calls] == ['describe_instances']
+
+
+def test_claim_instances(tmp_store, ec2_client):
+    """정지된 풀 인스턴스만 태그를 바꿔 시작하기 테스트."""
+    inst = Instance({'ami': 'ami-1', 'ec2type': 'm5.xlarge',
+                     'security_group': 'sg-1', 'keyname': 'key'})
+    store.put_pool_instances({'i-1': SPEC, 'i-2': SPEC, 'i-3': SPEC,
+                              'i-4': SPEC})
+    descs = [_desc('i-1', 'stopped'), _desc('i-2', 'stopping'),
+             _desc('i-4', 'stopped')]
+    client = ec2_client(describe_instances=_describe(descs))
+
+    class _EC2:
+        meta = type('Meta', (), {'client': client})
+
+    tag_spec = [{'ResourceType': 'instance',
+                 'Tags': [{'Key': 'Name', 'Value': 'test-worker'}]}]
+    got = claim_instances(_EC2(), inst, 3, tag_spec)
+
+    # 정지 중인 인스턴스는 풀로 되돌리고, 없어진 인스턴스는 버림
+    assert [d['InstanceId'] for d in got] == ['i-1']
+    assert sorted(_pool_ids()) == ['i-2', 'i-4']
+    assert client.calls[1:] == [
+        ('delete_tags', {'Resources': ['i-1'],
+                         'Tags': [{'Key': 'bilbo-pool'}]}),
+        ('create_tags', {'Resources': ['i-1'], 'Tags': tag_spec[0]['Tags']}),
+        ('start_instances', {'InstanceIds': ['i-1']})]
+
+    # 풀에 맞는 사양이 없으면 EC2 를 부르지 않음
+    client.calls.clear()
+    other = Instance({'ami': 'ami-2', 'ec2type': 'm5.xlarge'})
+    assert claim_instances(_EC2(), other, 1, tag_spec) == []
+    assert client.calls == []
@@ -1,6 +1,9 @@
 """프로파일 테스트."""
 import  pytest
 
+import json
+
+from bilbo import profile as bprof
 from bilbo.profile import Profile, DaskProfile, override_cfg_by_params
 
 
@@ -119,6 +122,48 @@ def test_dask_complex():
     assert pro.wrk_inst.tags[0][1] == "WrkOwner"
 
 
+def test_dask_worker_groups():
+    """여러 워커 그룹 테스트."""
+    cfg = {
+        "instance": {
+            'ami': 'ami-000',
+            "ec2type": "base-ec2type",
+            "security_group": "sg-000",
+            "keyname": "base-key",
+            "ssh_user": "ubuntu",
+            "ssh_private_key": "base-key.pem"
+        },
+        "dask": {
+            "worker": [
+                {
+                    "instance": {"ec2type": "r5.xlarge"},
+                    "count": 2,
+                    "nproc": 1
+                },
+                {
+                    "instance": {"ec2type": "c5.xlarge"},
+                    "count": 3,
+                    "nthread": 1
+                }
+            ]
+        }
+    }
+    pro = DaskProfile(cfg)
+    pro.validate()
+    assert pro.wrk_multi
+    assert len(pro.wrk_groups) == 2
+    assert pro.wrk_cnt == 5
+    assert pro.wrk_inst.ec2type == 'r5.xlarge'
+    g1, g2 = pro.wrk_groups
+    assert g1.count == 2 and g1.nproc == 1 and g1.nthread is None
+    assert g2.inst.ec2type == 'c5.xlarge'
+    assert g2.inst.ami == 'ami-000'
+    assert g2.inst.get_name('test') == 'test-worker-2'
+
+    override_cfg_by_params(cfg, ['dask.worker.1.count=4'])
+    assert DaskProfile(cfg).wrk_cnt == 6
+
+
 def test_profile():
     cfg = {
     }
@@ -226,6 +271,62 @@ def test_validate():
         pro.validate()
 
 
+def test_read_profile_cache(tmpdir, monkeypatch):
+    """검증된 프로파일 캐쉬 테스트."""
+    pdir = tmpdir.mkdir('profiles')
+    cdir = tmpdir.join('cache')
+    monkeypatch.setattr(bprof, 'prof_dir', str(pdir))
+    monkeypatch.setattr(bprof, 'prof_cache_dir', str(cdir))
+    cfg = {
+        "instance": {
+            'ami': 'ami-000',
+            "ec2type": "base-ec2type",
+            "keyname": "base-key",
+            "ssh_user": "ubuntu",
+            "ssh_private_key": "base-key.pem"
+        },
+        "dask": {}
+    }
+    pdir.join('test.json').write(json.dumps(cfg))
+
+    calls = []
+    orig = bprof.validate_by_schema
+    monkeypatch.setattr(bprof, 'validate_by_schema',
+                        lambda pcfg: calls.append(1) or orig(pcfg))
+
+    params = ['instance.ec2type=param-ec2type']
+    pcfg = bprof.read_profile('test.json', params)
+    assert pcfg['instance']['ec2type'] == 'param-ec2type'
+    # 덮어쓴 결과만 한 번 검증
+    assert len(calls) == 1
+    assert len(cdir.listdir()) == 1
+
+    # 캐쉬 히트는 검증하지 않음
+    assert bprof.read_profile('test.json', params) == pcfg
+    assert len(calls) == 1
+
+    # 패러미터나 내용이 다르면 다시 검증
+    bprof.read_profile('test.json')
+    assert len(calls) == 2
+    cfg['description'] = 'changed'
+    pdir.join('test.json').write(json.dumps(cfg))
+    assert bprof.read_profile('test.json')['description'] == 'changed'
+    assert len(calls) == 3
+    # 프로파일마다 마지막 결과만 남김
+    assert cdir.listdir() == [cdir.join('test.json')]
+    pdir.join('other.json').write(json.dumps(cfg))
+    bprof.read_profile('other.json')
+    assert sorted(p.basename for p in cdir.listdir()) == \
+        ['other.json', 'test.json']
+
+    # 잘못된 패러미터
+    with pytest.raises(RuntimeError, match=r"incorrect parameter.*"):
+        bprof.read_profile('test.json', ['instance.ec2type=1'])
+
+    # 컴파일된 validator 재사용
+    assert bprof.get_validator()[1] is bprof.get_validator()[1]
+
+
 def test_params():
     """CLI 패러미터로 프로파일 덮어쓰기 테스트."""
     cfg = {
@@ -0,0 +1,49 @@
+"""클러스터 상태 저장소 테스트."""
+import json
+
+import bilbo.store as store
+
+
+CLINFO = {
+    'name': 'test',
+    'description': 'desc',
+    'type': 'dask',
+    'instances': ['i-1', 'i-2', 'i-3'],
+    'scheduler': {'instance_id': 'i-1', 'public_ip': '1.1.1.1',
+                  'private_ip': '10.0.0.1', 'ssh_user': 'ubuntu',
+                  'ssh_private_key': 'key.pem'},
+    'worker': [
+        {'ssh_user': 'ubuntu', 'ssh_private_key': 'wkey.pem',
+         'instances': [{'instance_id': 'i-2', 'public_ip': '1.1.1.2',
+                        'private_ip': '10.0.0.2'}]},
+        {'ssh_user': 'ec2-user', 'ssh_private_key': 'wkey2.pem',
+         'instances': [{'instance_id': 'i-3', 'public_ip': '1.1.1.3',
+                        'private_ip': '10.0.0.3'}]}
+    ]
+}
+
+
+def test_store(tmp_store):
+    assert not store.cluster_exists('test')
+    store.put_cluster('test', CLINFO)
+    assert store.cluster_exists('test')
+    assert store.get_cluster('test') == CLINFO
+    assert list(store.iter_cluster_summary()) == [('test', 'desc')]
+
+    row = store.find_instance(cluster='test', public_ip='1.1.1.3')
+    assert row['role'] == 'worker'
+    assert row['ssh_user'] == 'ec2-user'
+    assert store.find_instance(private_ip='10.0.0.1')['role'] == 'scheduler'
+    assert store.find_instance(instance_id='i-9') is None
+
+    store.delete_cluster('test')
+    assert store.get_cluster('test') is None
+    assert store.find_instance(instance_id='i-2') is None
+
+
+def test_migrate(tmp_store):
+    path = tmp_store / 'old.json'
+    path.write_text(json.dumps(dict(CLINFO, name='old')))
+    assert store.get_cluster('old')['name'] == 'old'
+    assert not path.exists()
+    assert (tmp_store / 'old.json.migrated').exists()
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import shlex
+import _thread
+import threading
+
+import pytest
+
+import bilbo.cluster as bc
+from bilbo import store
+from bilbo.jobs import kill_group_cmd
+from bilbo.sweep import load_grid, run_id, run_cmd, run_sweep, pid_path
+
+HOST = ('ubuntu', 'key.pem', '1.1.1.2')
+
+
+def _grid(tmp_path, grid):
+    path = tmp_path / 'grid.json'
+    path.write_text(json.dumps(grid))
+    return load_grid(str(path))
+
+
+def test_load_grid(tmp_path):
+    """파라미터별 값 리스트는 모든 조합으로, 객체 리스트는 그대로."""
+    grid = {'lr': [0.1, 0.2], 'depth': [3, 5], 'opt': 'sgd'}
+    assert _grid(tmp_path, grid) == [
+        {'depth': 3, 'lr': 0.1, 'opt': 'sgd'},
+        {'depth': 3, 'lr': 0.2, 'opt': 'sgd'},
+        {'depth': 5, 'lr': 0.1, 'opt': 'sgd'},
+        {'depth': 5, 'lr': 0.2, 'opt': 'sgd'}]
+    runs = [{'lr': 0.1}, {'lr': 0.2, 'depth': 3}]
+    assert _grid(tmp_path, runs) == runs
+    for bad in ([{'lr': 0.1}, 1], 'lr'):
+        with pytest.raises(RuntimeError):
+            _grid(tmp_path, bad)
+
+
+def test_run_id():
+    assert run_id({'a': 1, 'b': 'x'}) == run_id({'b': 'x', 'a': 1})
+    assert run_id({'a': 1}) != run_id({'a': '1'})
+    assert len(run_id({})) == 10
+
+
+def _inner(cmd):
+    """새 세션으로 실행하는 명령."""
+    args = shlex.split(cmd)
+    return args[args.index('-c') + 1]
+
+
+def test_run_cmd():
+    rid = run_id({'name': 'a b'})
+    cmd = run_cmd('exp/train.ipynb', {'name': 'a b'}, None, rid)
+    assert "-p name 'a b'" in _inner(cmd)
+    assert "exp/train.sweep/{}.ipynb".format(rid) in _inner(cmd)
+    assert cmd.endswith("echo $! > {}; wait $!; }}".format(
+        pid_path('exp/train.ipynb', rid)))
+
+    cmd = run_cmd('train.py', {'lr': 0.1}, 'DASK_SCHEDULER_ADDRESS=x:8786',
+                  rid)
+    assert _inner(cmd).endswith("DASK_SCHEDULER_ADDRESS=x:8786 lr=0.1 "
+                                "python train.py > train.sweep/{}.log 2>&1".
+                                format(rid))
+    with pytest.raises(RuntimeError):
+        run_cmd('train.sh', {}, None, rid)
+
+
+def _script(local_shell, monkeypatch, body):
+    """원격 작업 폴더의 exp/train.py. 로컬 파이썬으로 실행되게 한다."""
+    monkeypatch.setenv('PATH', os.path.dirname(sys.executable) + os.pathsep +
+                       os.environ['PATH'])
+    exp = local_shell(HOST[2]) / 'works' / 'exp'
+    exp.mkdir(parents=True)
+    (exp / 'train.py').write_text(body)
+    return exp
+
+
+def test_run_cmd_bash(local_shell, monkeypatch):
+    """실행 명령을 로컬 bash 로. 종료 코드와 로그, PID 파일이 남음."""
+    exp = _script(local_shell, monkeypatch,
+                  "import os, sys\nprint(os.environ['lr'])\nsys.exit(3)\n")
+    rid = run_id({'lr': 0.1})
+    res = bc.exec_instance_cmd(*HOST, run_cmd('exp/train.py', {'lr': 0.1},
+                                              None, rid))
+    assert res.exit_code == 3
+    assert (exp / 'train.sweep' / (rid + '.log')).read_text() == '0.1\n'
+    assert (exp / 'train.sweep' / (rid + '.pid')).read_text().strip().isdigit()
+
+
+def test_run_cmd_kill(local_shell, monkeypatch):
+    """실행의 프로세스 그룹을 자식 프로세스까지 중지."""
+    exp = _script(local_shell, monkeypatch,
+                  "import subprocess\nsubprocess.run(['sleep', '30'])\n")
+    rid = run_id({})
+    pidf = exp / 'train.sweep' / (rid + '.pid')
+    results = []
+    th = threading.Thread(target=lambda: results.append(
+        bc.exec_instance_cmd(*HOST, run_cmd('exp/train.py', {}, None, rid))))
+    th.start()
+    for _ in range(100):
+        if pidf.exists() and pidf.read_text().strip():
+            break
+        time.sleep(0.05)
+    pgid = int(pidf.read_text())
+    # 파이썬이 sleep 을 띄울 때까지
+    time.sleep(0.5)
+
+    res = bc.exec_instance_cmd(*HOST, kill_group_cmd(
+        pid_path('exp/train.py', rid)))
+    assert res.ok
+    th.join(10)
+    assert results[0].exit_code == 128 + 15
+    # 그룹의 프로세스들이 모두 끝남
+    for _ in range(100):
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("process group {} still alive".format(pgid))
+
+
+def _clinfo():
+    return {'private_command': False,
+            'notebook': {'public_ip': HOST[2], 'ssh_user': HOST[0],
+                         'ssh_private_key': HOST[1]},
+            'type': 'dask',
+            'scheduler': {'public_ip': '1.1.1.1', 'private_ip': '10.0.0.1',
+                          'private_dns_name': 'ip-10-0-0-1.internal',
+                          'ssh_user': 'ubuntu', 'ssh_private_key': 'key.pem'},
+            'worker': {'ssh_user': 'ubuntu', 'ssh_private_key': 'key.pem',
+                       'instances': [{'public_ip': '1.1.1.10',
+                                      'private_ip': '10.0.0.10'}]}}
+
+
+def _statuses():
+    return {row['run_id']: row['status']
+            for row in store.iter_sweep_runs('test', 'train.py')}
+
+
+@pytest.fixture
+def sweep_cluster(tmp_store, monkeypatch):
+    clinfo = _clinfo()
+    store.put_cluster('test', clinfo)
+    monkeypatch.setattr(bc, 'check_cluster', lambda clname: clinfo)
+    return clinfo
+
+
+def test_run_sweep(sweep_cluster, monkeypatch, tmp_path, capsys):
+    """실패한 조합만 이어서, rerun 이면 모두 다시 실행."""
+    ran = []
+
+    def _exec(user, private_key, ip, cmd, timeout=None,
+              retry_count=None):
+        ran.append(ip)
+        return bc.HostResult(ip, [], b'', 1 if 'FAIL=1' in cmd else 0)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    grid = _grid(tmp_path, {'lr': [0.1, 0.2], 'FAIL': [0, 1]})
+
+    assert not run_sweep('test', 'train.py', grid, on_workers=True)
+    assert len(ran) == 4 and set(ran) <= {'1.1.1.2', '1.1.1.10'}
+    rows = list(store.iter_sweep_runs('test', 'train.py'))
+    assert sorted(r['status'] for r in rows) == \
+        ['done', 'done', 'failed', 'failed']
+    assert all(r['log'] == 'train.sweep/{}.log'.format(r['run_id'])
+               for r in rows)
+    assert capsys.readouterr().out.rstrip().endswith(
+        "4 run(s): 2 done, 2 failed, 0 skipped")
+
+    # 워커 없이는 노트북에서만
+    assert not run_sweep('test', 'train.py', grid)
+    assert ran[4:] == ['1.1.1.2', '1.1.1.2']
+    assert capsys.readouterr().out.rstrip().endswith(
+        "4 run(s): 0 done, 2 failed, 2 skipped")
+    assert run_sweep('test', 'train.py', grid[:2], rerun=True)
+    assert len(ran) == 8
+
+
+def test_run_sweep_interrupt(sweep_cluster, monkeypatch, tmp_path):
+    """중단하면 실행 중인 원격 실행을 중지해 interrupted, 나머지는 pending."""
+    lock = threading.Lock()
+    started = []
+    kills = []
+    killed = threading.Event()
+
+    def _exec(user, private_key, ip, cmd, timeout=None,
+              retry_count=None):
+        if 'kill -TERM' in cmd:
+            kills.append((ip, cmd))
+            killed.set()
+            return bc.HostResult(ip, [], b'', 0)
+        with lock:
+            started.append(ip)
+            if len(started) == 2:
+                # 두 호스트에서 실행 중일 때 Ctrl-C
+                _thread.interrupt_main()
+        killed.wait(5)
+        return bc.HostResult(ip, [], b'', 128 + 15)
+
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    grid = _grid(tmp_path, {'lr': [0.1, 0.2, 0.3, 0.4]})
+    with pytest.raises(KeyboardInterrupt):
+        run_sweep('test', 'train.py', grid, parallel=1, on_workers=True)
+
+    assert sorted(started) == ['1.1.1.10', '1.1.1.2']
+    statuses = _statuses()
+    assert sorted(statuses.values()) == ['interrupted', 'interrupted',
+                                         'pending', 'pending']
+    rows = {row['run_id']: row for row in
+            store.iter_sweep_runs('test', 'train.py')}
+    assert sorted(ip for ip, _ in kills) == ['1.1.1.10', '1.1.1.2']
+    for ip, cmd in kills:
+        rid = [r for r, row in rows.items() if row['host'] == ip and
+               row['status'] == 'interrupted'][0]
+        assert kill_group_cmd(pid_path('train.py', rid)) in cmd
+
+    # 이어하기는 중단된 실행부터
+    ran = []
+    monkeypatch.setattr(bc, 'exec_instance_cmd',
+                        lambda user, pkey, ip, cmd, timeout=None,
+                        retry_count=None:
+                        ran.append(ip) or bc.HostResult(ip, [], b'', 0))
+    assert run_sweep('test', 'train.py', grid)
+    assert len(ran) == 4
+    assert set(_statuses().values()) == {'done'}
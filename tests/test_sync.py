@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+import bilbo.cluster as bc
+import bilbo.sync as bs
+
+HOST = ('ubuntu', 'key.pem', '1.1.1.2')
+
+
+def _project(root):
+    """동기화할 로컬 폴더."""
+    (root / 'pkg' / '__pycache__').mkdir(parents=True)
+    (root / 'run.py').write_text('print(1)')
+    (root / 'pkg' / 'mod.py').write_text('x = 1')
+    (root / 'pkg' / '__pycache__' / 'mod.cpython-311.pyc').write_text('')
+    return root
+
+
+def test_diff():
+    """원격이 마지막 동기화 기록과 같을 때만 기록된 해쉬를 믿기."""
+    local = {'a': [1, 5, 'x'], 'b': [1, 5, 'y'], 'd': [1, 5, 'z'],
+             'e': [1, 5, 'w']}
+    remote = {'a': [1, '5.0'], 'c': [2, '6.0'], 'd': [1, '7.0'],
+              'e': [1, '5.0']}
+    known = {'a': [1, '5.0', 'x'], 'd': [1, '5.0', 'z'],
+             'e': [1, '5.0', 'old']}
+    # b 는 원격에 없음, d 는 원격에서 바뀜, e 는 로컬에서 바뀜
+    assert bs.diff(local, remote, known) == (['b', 'd', 'e'], [])
+    assert bs.diff(local, remote, known, True) == (['b', 'd', 'e'], ['c'])
+    assert bs.diff(local, remote, {}) == (['a', 'b', 'd', 'e'], [])
+
+
+def test_parse_listing():
+    lines = ['run.py\t8\t1600000000.1234567890\n',
+             'pkg/__pycache__/mod.pyc\t0\t1.0\n',
+             'a\tb.txt\t3\t2.0\n',
+             'broken\n']
+    assert bs.parse_listing(lines) == {
+        'run.py': [8, '1600000000.1234567890'],
+        'a\tb.txt': [3, '2.0']}
+    assert bs.parse_listing(lines, ('*.py',)) == {
+        'pkg/__pycache__/mod.pyc': [0, '1.0'], 'a\tb.txt': [3, '2.0']}
+
+
+def test_local_manifest(tmp_path, monkeypatch):
+    """크기와 수정 시간이 그대로인 파일은 다시 해쉬하지 않기."""
+    root = _project(tmp_path / 'proj')
+    hashed = []
+
+    def _sha256(path):
+        hashed.append(os.path.relpath(path, str(root)))
+        return 'sha-' + os.path.basename(path)
+
+    monkeypatch.setattr(bs, 'file_sha256', _sha256)
+    first = bs.local_manifest(str(root))
+    assert sorted(first) == ['pkg/mod.py', 'run.py']
+    assert first['run.py'][0] == 8 and first['run.py'][2] == 'sha-run.py'
+    assert sorted(hashed) == ['pkg/mod.py', 'run.py']
+
+    hashed.clear()
+    (root / 'run.py').write_text('print(22)')
+    second = bs.local_manifest(str(root), cache=first)
+    assert hashed == ['run.py']
+    assert second['pkg/mod.py'] == first['pkg/mod.py']
+    assert second['run.py'][0] == 9
+
+    assert sorted(bs.local_manifest(str(root), bs.EXCLUDES + ('pkg',))) == \
+        ['run.py']
+
+
+def test_apply_cmd(local_shell, tmp_path):
+    """올린 변경분을 풀고 지운 후 파일 목록을 내는 명령을 로컬 bash 로."""
+    root = _project(tmp_path / 'proj')
+    home = local_shell(HOST[2])
+    work = home / 'my work'
+    work.mkdir()
+    (work / 'old.txt').write_text('old')
+
+    send, deletes = ['pkg/mod.py', 'run.py'], ['old.txt', 'gone.txt']
+    bs._upload_changes(bc.ssh_pool.get(*HOST), str(root), send, deletes)
+    res = bc.exec_instance_cmd(*HOST, bs.apply_cmd('~/my work', send,
+                                                   deletes))
+    assert res.ok, res.stderr
+    assert (work / 'pkg' / 'mod.py').read_text() == 'x = 1'
+    assert not (work / 'old.txt').exists()
+    assert not (home / bs.STAGE).exists()
+    assert not (home / bs.DELETE_LIST).exists()
+
+    remote = bs.parse_listing(res.stdout)
+    assert sorted(remote) == ['pkg/mod.py', 'run.py']
+    assert remote['run.py'][0] == 8
+    mtime = os.stat(str(work / 'run.py')).st_mtime
+    assert float(remote['run.py'][1]) == pytest.approx(mtime)
+
+    # 보낼 것이 없으면 목록만
+    res = bc.exec_instance_cmd(*HOST, bs.apply_cmd('~/my work', [], []))
+    assert bs.parse_listing(res.stdout) == remote
+
+
+def test_sync_notebook(local_shell, tmp_path, monkeypatch):
+    """바뀐 파일만 보내고, 원격에서 바뀐 파일은 다시 보내기."""
+    root = _project(tmp_path / 'proj')
+    clinfo = {'private_command': False,
+              'notebook': {'public_ip': HOST[2], 'ssh_user': HOST[0],
+                           'ssh_private_key': HOST[1]}}
+    monkeypatch.setattr(bc, 'check_cluster', lambda clname: clinfo)
+    monkeypatch.setattr(bs, 'sync_dir', str(tmp_path / 'sync'))
+    work = local_shell(HOST[2]) / 'work'
+
+    def _sync(delete=False):
+        return bs.sync_notebook('test', str(root), '~/work', delete)
+
+    assert _sync() == (['pkg/mod.py', 'run.py'], [])
+    assert (work / 'run.py').read_text() == 'print(1)'
+    assert not (work / 'pkg' / '__pycache__').exists()
+    assert _sync() == ([], [])
+
+    (root / 'run.py').write_text('print(2)')
+    os.remove(str(root / 'pkg' / 'mod.py'))
+    assert _sync() == (['run.py'], [])
+    assert _sync(True) == ([], ['pkg/mod.py'])
+    assert sorted(os.listdir(str(work))) == ['pkg', 'run.py']
+    assert os.listdir(str(work / 'pkg')) == []
+
+    (work / 'run.py').write_text('print(3)')
+    assert _sync() == (['run.py'], [])
+    assert (work / 'run.py').read_text() == 'print(2)'
+
+    # 노트북이 없는 클러스터
+    del clinfo['notebook']
+    with pytest.raises(RuntimeError):
+        _sync()
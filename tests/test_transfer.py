@@ -0,0 +1,232 @@
+import re
+
+import pytest
+
+import bilbo.cluster as bc
+from bilbo.transfer import Payload, STAGE_DIR, upload, \
+    put_files, tree_sha256, remote_path, _is_current, _put_relay, \
+    _relay_serve_cmd
+
+HOST = ('ubuntu', 'key.pem', '1.1.1.1')
+
+
+def _source(tmp_path, is_dir):
+    """보낼 파일 또는 폴더."""
+    if not is_dir:
+        src = tmp_path / 'model.bin'
+        src.write_bytes(b'model' * 100)
+        return src
+    src = tmp_path / 'data'
+    (src / 'sub dir').mkdir(parents=True)
+    (src / 'a.txt').write_text('a')
+    (src / 'sub dir' / 'b.txt').write_text('b')
+    return src
+
+
+def _stage(payload):
+    return "{}/{}".format(STAGE_DIR, payload.name)
+
+
+def test_remote_path():
+    assert remote_path('~') == '"$HOME"'
+    assert remote_path('~/my data') == '"$HOME"/\'my data\''
+    assert remote_path('/tmp/x') == '/tmp/x'
+
+
+@pytest.mark.parametrize('is_dir', [False, True])
+@pytest.mark.parametrize('compress', [False, True])
+def test_install_cmd(local_shell, tmp_path, is_dir, compress):
+    """올린 파일을 확인하고 대상에 설치하는 명령을 로컬 bash 로 실행."""
+    src = _source(tmp_path, is_dir)
+    tmp_dir = tmp_path / 'tmp'
+    tmp_dir.mkdir()
+    payload = Payload(str(src), compress, str(tmp_dir))
+    assert payload.is_dir == is_dir
+    if is_dir:
+        assert payload.digest == tree_sha256(str(src))
+    home = local_shell(HOST[2])
+    dst = '~/my data/' + src.name
+
+    # 처음에는 대상이 없음
+    res = bc.exec_instance_cmd(*HOST, payload.check_cmd(dst))
+    assert res.ok and not _is_current(res, payload)
+
+    assert upload(HOST, payload.path, _stage(payload)).ok
+    res = bc.exec_instance_cmd(*HOST, payload.install_cmd(dst))
+    assert res.ok, res.stderr
+    assert list((home / STAGE_DIR).iterdir()) == []
+    target = home / 'my data' / src.name
+    if is_dir:
+        assert (target / 'a.txt').read_text() == 'a'
+        assert (target / 'sub dir' / 'b.txt').read_text() == 'b'
+    else:
+        assert target.read_bytes() == src.read_bytes()
+        assert not (home / 'my data' / (src.name + '.bilbo_part')).exists()
+
+    res = bc.exec_instance_cmd(*HOST, payload.check_cmd(dst))
+    assert _is_current(res, payload)
+
+
+def test_install_corrupt(local_shell, tmp_path):
+    """올린 파일의 해쉬가 다르면 대상을 건드리지 않고 실패."""
+    src = _source(tmp_path, False)
+    payload = Payload(str(src), True, str(tmp_path))
+    home = local_shell(HOST[2])
+    assert upload(HOST, payload.path, _stage(payload)).ok
+    with open(str(home / _stage(payload)), 'ab') as f:
+        f.write(b'x')
+    res = bc.exec_instance_cmd(*HOST, payload.install_cmd('~/model.bin'))
+    assert res.exit_code == 1
+    assert not (home / 'model.bin').exists()
+
+
+def _clinfo():
+    """스케쥴러와 워커 2 대인 클러스터 정보."""
+    wrks = [{'instance_id': 'i-w{}'.format(i),
+             'public_ip': '1.1.1.{}'.format(10 + i),
+             'private_ip': '10.0.0.{}'.format(10 + i)} for i in range(2)]
+    return {
+        'type': 'dask', 'private_command': False,
+        'scheduler': {'public_ip': '1.1.1.1', 'private_ip': '10.0.0.1',
+                      'ssh_user': 'ubuntu', 'ssh_private_key': 'key.pem'},
+        'worker': {'ssh_user': 'ubuntu', 'ssh_private_key': 'key.pem',
+                   'instances': wrks}
+    }
+
+
+def test_put_files(local_shell, monkeypatch, tmp_path, capsys):
+    """워커들에 직접 보내고, 내용이 같으면 건너뛰기."""
+    monkeypatch.setattr(bc, 'check_cluster', lambda clname: _clinfo())
+    src = _source(tmp_path, True)
+
+    assert put_files('test', str(src), '~/data', 'worker')
+    assert capsys.readouterr().out.rstrip().endswith(
+        "2 host(s): 2 sent, 0 unchanged, 0 failed")
+    for ip in ('1.1.1.10', '1.1.1.11'):
+        assert (local_shell(ip) / 'data' / 'a.txt').read_text() == 'a'
+
+    assert put_files('test', str(src), '~/data')
+    assert capsys.readouterr().out.rstrip().endswith(
+        "3 host(s): 1 sent, 2 unchanged, 0 failed")
+
+    # 바뀐 내용이나 force 는 다시 보냄
+    (src / 'a.txt').write_text('c')
+    assert put_files('test', str(src), '~/data', 'worker', compress=True)
+    assert (local_shell('1.1.1.11') / 'data' / 'a.txt').read_text() == 'c'
+    assert put_files('test', str(src), '~/data', 'worker', force=True)
+    assert capsys.readouterr().out.rstrip().endswith(
+        "2 host(s): 2 sent, 0 unchanged, 0 failed")
+
+
+def _record_relay(monkeypatch, serve_ok=True, fetch_fail=()):
+    """업로드와 명령을 순서대로 기록하는 대역."""
+    calls = []
+
+    def _upload(host, local, remote):
+        calls.append(('upload', host[2], remote))
+        return bc.HostResult(host[2], exit_code=0)
+
+    def _exec(user, private_key, ip, cmd, timeout=None,
+              retry_count=None):
+        calls.append(('exec', ip, cmd))
+        if 'BILBO_RELAY_TOKEN' in cmd:
+            if not serve_ok:
+                # 서버가 포트를 알리기 전에 죽음
+                return bc.HostResult(ip, ['4242\n'], b'', 0)
+            return bc.HostResult(ip, ['4242\n', '40123\n'], b'', 0)
+        if 'curl' in cmd and ip in fetch_fail:
+            return bc.HostResult(ip, [], b'', 22)
+        return bc.HostResult(ip, [], b'', 0)
+
+    monkeypatch.setattr('bilbo.transfer.upload', _upload)
+    monkeypatch.setattr(bc, 'exec_instance_cmd', _exec)
+    return calls
+
+
+def test_put_relay(monkeypatch, tmp_path):
+    """시드에 한 번 올리고 나머지는 시드에서 받은 후 서버를 멈춤."""
+    payload = Payload(str(_source(tmp_path, True)), False, str(tmp_path))
+    seed = HOST
+    hosts = [seed] + [('ubuntu', 'key.pem', '1.1.1.1{}'.format(i))
+                      for i in range(2)]
+    calls = _record_relay(monkeypatch)
+    res = _put_relay(seed, '10.0.0.1', hosts, payload, '~/data')
+    assert res.ok and len(res) == 3
+
+    assert calls[0] == ('upload', '1.1.1.1', _stage(payload))
+    assert calls[1][:2] == ('exec', '1.1.1.1')
+    serve = calls[1][2]
+    token = re.search(r'BILBO_RELAY_TOKEN=(\S+)', serve).group(1)
+    assert len(token) >= 32
+    assert ' 10.0.0.1 > ' in serve
+    fetches = calls[2:4]
+    assert sorted(ip for _, ip, _ in fetches) == ['1.1.1.10', '1.1.1.11']
+    url = 'http://10.0.0.1:40123/{} '.format(token)
+    install = payload.install_cmd('~/data')
+    assert all(url in cmd and cmd.endswith(install) for _, _, cmd in fetches)
+    # 서버를 멈춘 후 시드에 설치
+    assert calls[4:] == [('exec', '1.1.1.1', 'kill 4242'),
+                         ('exec', '1.1.1.1', install)]
+
+    # 토큰은 매번 새로
+    calls.clear()
+    _put_relay(seed, '10.0.0.1', hosts[1:], payload, '~/data')
+    assert token not in calls[1][2]
+    # 시드가 대상이 아니면 올린 파일만 지움
+    assert calls[-1] == ('exec', '1.1.1.1',
+                         'rm -f {}'.format(payload.stage))
+
+
+def test_put_relay_fallback(monkeypatch, tmp_path):
+    """서버를 못 띄우거나 받기에 실패한 호스트에는 직접 올림."""
+    payload = Payload(str(_source(tmp_path, False)), False, str(tmp_path))
+    hosts = [('ubuntu', 'key.pem', '1.1.1.1{}'.format(i)) for i in range(2)]
+    install = payload.install_cmd('~/model.bin')
+
+    calls = _record_relay(monkeypatch, serve_ok=False)
+    res = _put_relay(HOST, '10.0.0.1', hosts, payload, '~/model.bin')
+    assert res.ok and len(res) == 2
+    assert not any('curl' in c[2] for c in calls if c[0] == 'exec')
+    assert ('exec', '1.1.1.1', 'kill 4242') in calls
+    assert sorted(c[1] for c in calls if c[0] == 'upload') == \
+        ['1.1.1.1', '1.1.1.10', '1.1.1.11']
+
+    calls = _record_relay(monkeypatch, fetch_fail=('1.1.1.11',))
+    res = _put_relay(HOST, '10.0.0.1', hosts, payload, '~/model.bin')
+    assert res.ok
+    kill = calls.index(('exec', '1.1.1.1', 'kill 4242'))
+    assert calls[kill + 1:kill + 3] == [
+        ('upload', '1.1.1.11', _stage(payload)),
+        ('exec', '1.1.1.11', install)]
+
+
+def test_put_relay_local(local_shell, tmp_path):
+    """로컬 bash 에 띄운 중계 서버에서 토큰 경로로만 받기."""
+    src = _source(tmp_path, False)
+    payload = Payload(str(src), False, str(tmp_path))
+    hosts = [('ubuntu', 'key.pem', '1.1.1.1{}'.format(i)) for i in range(2)]
+
+    res = _put_relay(HOST, '127.0.0.1', [HOST] + hosts, payload,
+                     '~/model.bin')
+    assert res.ok, [(r.ip, r.stderr) for r in res.failed()]
+    for ip in ('1.1.1.1', '1.1.1.10', '1.1.1.11'):
+        home = local_shell(ip)
+        assert (home / 'model.bin').read_bytes() == src.read_bytes()
+        assert list((home / STAGE_DIR).iterdir()) == []
+
+    # 토큰이 다르면 받지 못함
+    seed = local_shell(HOST[2])
+    upload(HOST, payload.path, _stage(payload))
+    token = 'x' * 32
+    res = bc.exec_instance_cmd(*HOST, _relay_serve_cmd(payload, '127.0.0.1',
+                                                       token))
+    pid, port = [line.strip() for line in res.stdout]
+    try:
+        url = 'http://127.0.0.1:{}/'.format(port)
+        assert bc.exec_instance_cmd(*HOST, 'curl -sf {}{}'.format(
+            url, token)).stdout == [(seed / _stage(payload)).read_text()]
+        for path in ('y' * 32, '', payload.name):
+            assert bc.exec_instance_cmd(*HOST, 'curl -sf {}{}'.format(
+                url, path)).exit_code == 22
+    finally:
+        bc.exec_instance_cmd(*HOST, 'kill {}'.format(pid))
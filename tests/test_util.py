@@ -0,0 +1,52 @@
+"""유틸리티 테스트."""
+import pytest
+
+from bilbo import util
+from bilbo.util import RetryPolicy, set_retry_policy, get_retry_policy
+
+
+def test_retry_policy(monkeypatch):
+    """지수 백오프 재시도 정책 테스트."""
+    pol = RetryPolicy(initial=0.5, multiplier=2, cap=3, jitter=0)
+    assert [pol.delay(i) for i in range(5)] == [0.5, 1, 2, 3, 3]
+
+    # 지터는 대기 시간을 줄이기만 함
+    pol = RetryPolicy(initial=1, multiplier=1, jitter=0.5)
+    for i in range(20):
+        assert 0.5 <= pol.delay(i) <= 1
+
+    # 최대 시도 수
+    slept = []
+    pol = RetryPolicy(initial=1, multiplier=2, cap=4, jitter=0)
+    assert list(pol.attempts(4, slept.append)) == [0, 1, 2, 3]
+    assert slept == [1, 2, 4]
+
+    # 다음 대기가 전체 제한 시간을 넘으면 멈춤
+    clock = [0]
+
+    def _sleep(delay):
+        clock[0] += delay
+        slept.append(delay)
+
+    monkeypatch.setattr(util.time, 'monotonic', lambda: clock[0])
+    slept = []
+    pol = RetryPolicy(initial=1, multiplier=2, cap=100, jitter=0,
+                      deadline=5)
+    assert list(pol.attempts(sleep=_sleep)) == [0, 1, 2]
+    assert slept == [1, 2]
+
+
+def test_retry_policy_config():
+    """프로파일 설정으로 재시도 정책 지정 테스트."""
+    orig = get_retry_policy()
+    try:
+        pol = set_retry_policy({'initial': 0.1, 'deadline': 30})
+        assert get_retry_policy() is pol
+        cfg = pol.to_config()
+        assert cfg['initial'] == 0.1
+        assert cfg['deadline'] == 30
+        assert cfg['cap'] == RetryPolicy.DEFAULTS['cap']
+        with pytest.raises(TypeError):
+            set_retry_policy({'unknown': 1})
+    finally:
+        set_retry_policy(orig.to_config())